@@ -0,0 +1,97 @@
+import os
+import time
+import shutil
+import contextlib
+
+from typing import Dict, List
+
+basepath = os.environ['HOME']
+benchrootpath = os.path.join(basepath, 'lance-benchmarks')
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if len(sorted_values) == 0:
+        return 0.0
+    rank = max(1, min(len(sorted_values), int(-(-pct * len(sorted_values) // 100))))
+    return sorted_values[rank - 1]
+
+
+class BenchRecorder:
+    """
+    collects timing samples of named operations for one benchmark run
+    """
+    def __init__(self):
+        self.__samples = {}  # type: Dict[str, List[float]]
+        self.__walltimes = {}  # type: Dict[str, float]
+
+    @contextlib.contextmanager
+    def measure(self, name: str):
+        """
+        time one operation
+        """
+        starttime = time.perf_counter()
+        yield
+        self.sample(name, time.perf_counter() - starttime)
+
+    @contextlib.contextmanager
+    def measure_batch(self, name: str, count: int):
+        """
+        time a batch of count operations that can only be timed together, like events processed by another thread
+        """
+        starttime = time.perf_counter()
+        yield
+        elapsed = time.perf_counter() - starttime
+        self.__samples.setdefault(name, []).extend([elapsed / count] * count)
+        self.__walltimes[name] = self.__walltimes.get(name, 0.0) + elapsed
+
+    def sample(self, name: str, seconds: float):
+        self.__samples.setdefault(name, []).append(seconds)
+        self.__walltimes[name] = self.__walltimes.get(name, 0.0) + seconds
+
+    def summary(self) -> Dict[str, dict]:
+        summary = {}
+        for name, samples in self.__samples.items():
+            values = sorted(samples)
+            total = self.__walltimes[name]
+            summary[name] = {'count': len(values),
+                             'total': total,
+                             'mean': total / len(values),
+                             'p50': percentile(values, 50),
+                             'p90': percentile(values, 90),
+                             'p99': percentile(values, 99),
+                             'max': values[-1],
+                             'throughput': len(values) / total if total > 0 else None}
+        return summary
+
+
+class BenchBase:
+    """
+    benchmark is run once for every parameter set of the chosen scale
+    override params and benchBody
+    """
+    params = {'small': [{}]}  # type: Dict[str, List[dict]]
+
+    def __init__(self):
+        self.__benchrootpath = os.path.join(benchrootpath, self.__class__.__name__)
+
+    def bench_root_path(self):
+        return self.__benchrootpath
+
+    def benchBody(self, recorder: BenchRecorder, **params):
+        raise NotImplementedError()
+
+    def run(self, scale: str = 'small') -> List[dict]:
+        """
+        :return: list of {'params': {...}, 'metrics': {operation: summary}}
+        """
+        results = []
+        for params in self.params.get(scale, ()):
+            shutil.rmtree(self.__benchrootpath, ignore_errors=True)
+            os.makedirs(self.__benchrootpath)
+            recorder = BenchRecorder()
+            self.benchBody(recorder, **params)
+            results.append({'params': params, 'metrics': recorder.summary()})
+        return results
+
+    def cleanup(self):
+        shutil.rmtree(self.__benchrootpath, ignore_errors=True)
@@ -0,0 +1,130 @@
+import math
+import time
+import threading
+import collections
+
+from . import metrics
+
+from typing import Optional, Dict, List, Iterable
+
+
+STAGES = ('written', 'scanned', 'client_received', 'client_applied', 'acked')
+
+
+class ConfigGeneration:
+    """
+    one saved configuration of one device, with timestamps of stages it went through
+    client_* stages are in client's clock, so they are as good as clocks are in sync
+    """
+    def __init__(self, deviceid: str, generation: int, confighash: str, written_time: Optional[float] = None):
+        self.deviceid = deviceid
+        self.generation = generation
+        self.confighash = confighash
+        self.stages = {'written': time.time() if written_time is None else written_time}  # type: Dict[str, float]
+
+    def latency(self, stage: str) -> Optional[float]:
+        """
+        :return: seconds from config written till given stage, None if stage was not reached
+        """
+        if stage not in self.stages:
+            return None
+        return self.stages[stage] - self.stages['written']
+
+    def __repr__(self):
+        return '<ConfigGeneration: %s #%d %s>' % (self.deviceid, self.generation, ', '.join('%s=+%.3f' % (x, self.latency(x)) for x in STAGES if x in self.stages))
+
+
+def percentile(sorted_values: List[float], pct: float) -> Optional[float]:
+    """
+    nearest-rank percentile of already sorted values
+    """
+    if len(sorted_values) == 0:
+        return None
+    rank = max(1, min(len(sorted_values), int(math.ceil(pct / 100.0 * len(sorted_values)))))
+    return sorted_values[rank - 1]
+
+
+class ConfigPropagationTracer:
+    """
+    tracks device configuration generations from server saving it till client acknowledging it by config hash
+    """
+    def __init__(self, keep_generations: int = 256):
+        self.__keep = keep_generations
+        self.__generations = {}  # type: Dict[str, collections.deque]
+        self.__counters = {}  # type: Dict[str, int]
+        self.__lock = threading.Lock()
+
+    def begin(self, deviceid: str, confighash: str, written_time: Optional[float] = None) -> ConfigGeneration:
+        """
+        register new configuration generation written for device
+        """
+        with self.__lock:
+            self.__counters[deviceid] = self.__counters.get(deviceid, 0) + 1
+            gen = ConfigGeneration(deviceid, self.__counters[deviceid], confighash, written_time)
+            self.__generations.setdefault(deviceid, collections.deque(maxlen=self.__keep)).append(gen)
+        return gen
+
+    def __find(self, deviceid: str, confighash: str) -> Optional[ConfigGeneration]:
+        # latest generation with that hash, same config can be saved more than once
+        for gen in reversed(self.__generations.get(deviceid, ())):
+            if gen.confighash == confighash:
+                return gen
+        return None
+
+    def mark(self, deviceid: str, confighash: str, stage: str, timestamp: Optional[float] = None) -> Optional[ConfigGeneration]:
+        """
+        set stage timestamp for the latest generation of the device with given hash
+        if stage is already set - it's not overriden, we are interested in first time stage was reached
+        :return: generation marked or None if no such generation is known
+        """
+        assert stage in STAGES, 'unknown stage %s' % stage
+        with self.__lock:
+            gen = self.__find(deviceid, confighash)
+            if gen is None or stage in gen.stages:
+                return gen
+            gen.stages[stage] = time.time() if timestamp is None else timestamp
+        metrics.histogram('lance_config_propagation_seconds', {'stage': stage}).observe(gen.latency(stage))
+        return gen
+
+    def client_report(self, deviceid: str, report: dict) -> Optional[ConfigGeneration]:
+        """
+        apply report client writes next to config hash: {'hash': str, 'received': float or None, 'applied': float}
+        """
+        confighash = report.get('hash', None)
+        if confighash is None:
+            return None
+        gen = None
+        if report.get('received', None) is not None:
+            gen = self.mark(deviceid, confighash, 'client_received', report['received'])
+        if report.get('applied', None) is not None:
+            gen = self.mark(deviceid, confighash, 'client_applied', report['applied'])
+        return gen
+
+    def generations(self, deviceid: str) -> List[ConfigGeneration]:
+        with self.__lock:
+            return list(self.__generations.get(deviceid, ()))
+
+    def forget_device(self, deviceid: str):
+        with self.__lock:
+            self.__generations.pop(deviceid, None)
+            self.__counters.pop(deviceid, None)
+
+    def percentiles(self, deviceids: Optional[Iterable[str]] = None, percentiles: Iterable[float] = (50, 90, 99)) -> Dict[str, Dict[str, dict]]:
+        """
+        :param deviceids: devices to get stats for, all known if None
+        :return: {deviceid: {stage: {'count': int, 'p50': seconds, ...}}} latencies are counted from 'written' stage
+        """
+        with self.__lock:
+            if deviceids is None:
+                deviceids = list(self.__generations.keys())
+            gens = {did: list(self.__generations.get(did, ())) for did in deviceids}
+        result = {}
+        for did, devgens in gens.items():
+            result[did] = {}
+            for stage in STAGES[1:]:
+                values = sorted(x.latency(stage) for x in devgens if stage in x.stages)
+                stats = {'count': len(values)}
+                for pct in percentiles:
+                    stats['p%g' % pct] = percentile(values, pct)
+                result[did][stage] = stats
+        return result
@@ -1,16 +1,166 @@
 import os
 import sqlite3
+import threading
 import time
+import json
 from .servercomponent import ServerComponent
 from .lance_utils import async_method
+from .pathtemplate import render_path
 import xml.etree.ElementTree as ET
 import re
 
+from typing import Optional, Iterable, Dict, Set, Tuple
+
+
+class SyncthingConfigStore:
+    """
+    sqlite storage for SyncthingHandler configuration, alternative to rewriting whole json files on every change
+    each device and folder is a row that keeps it's serialized form, so unchanged rows are never serialized again
+    and the synced config.cfg is just a join of stored rows
+    folder membership is a separate table indexed by device, so folders of a device are found without decoding every folder row
+
+    Not thread safe by itself - supposed to be used only from SyncthingHandler's thread (or under it's lock)
+    """
+    def __init__(self, databasepath):
+        self.__db = databasepath
+        self.__connection = sqlite3.connect(self.__db, 30, check_same_thread=False)
+        self.__connection.execute('PRAGMA journal_mode=WAL')
+        with self.__connection:
+            self.__connection.executescript('''
+                CREATE TABLE IF NOT EXISTS "meta" ("key" TEXT NOT NULL PRIMARY KEY, "value" TEXT);
+                CREATE TABLE IF NOT EXISTS "servers" ("device" TEXT NOT NULL PRIMARY KEY);
+                CREATE TABLE IF NOT EXISTS "ignoredevices" ("device" TEXT NOT NULL PRIMARY KEY);
+                CREATE TABLE IF NOT EXISTS "devices" ("id" TEXT NOT NULL PRIMARY KEY, "data" TEXT NOT NULL);
+                CREATE TABLE IF NOT EXISTS "folders" ("id" TEXT NOT NULL PRIMARY KEY, "path" TEXT, "data" TEXT NOT NULL);
+                CREATE TABLE IF NOT EXISTS "folder_devices" ("folder" TEXT NOT NULL, "device" TEXT NOT NULL, PRIMARY KEY("folder", "device"));
+                CREATE INDEX IF NOT EXISTS "folder_devices_device" ON "folder_devices" ("device");
+            ''')
+
+    def close(self):
+        self.__connection.close()
+
+    def has_bootstrap(self) -> bool:
+        return self.__connection.execute('SELECT 1 FROM meta WHERE key=\'apikey\'').fetchone() is not None
+
+    def load_bootstrap(self) -> dict:
+        """
+        :return: dict of the same structure as syncthinghandler_config.json
+        """
+        cur = self.__connection.cursor()
+        meta = dict(cur.execute('SELECT key,value FROM meta').fetchall())
+        return {'apikey': meta.get('apikey', None),
+                'server_secret': meta.get('server_secret', None),
+                'servers': [x for x, in cur.execute('SELECT device FROM servers').fetchall()],
+                'folders': {fid: {'attribs': {'path': path}} for fid, path in cur.execute('SELECT id,path FROM folders').fetchall()},
+                'ignoreDevices': [x for x, in cur.execute('SELECT device FROM ignoredevices').fetchall()]}
+
+    def update(self, meta: Dict[str, Optional[str]], servers: Iterable[str], ignoredevices: Iterable[str], devices: Dict[str, Optional[dict]], folders: Dict[str, Optional[Tuple[Optional[str], dict]]], replace_all: bool = False) -> bool:
+        """
+        apply changes in one transaction
+        rows that serialize to the same text as the stored ones are left untouched
+        :param meta: key-value pairs like apikey and server_secret
+        :param servers: full server list, it's tiny
+        :param ignoredevices: full ignored devices list, it's tiny
+        :param devices: device id -> serialized device dict, or None to remove the device
+        :param folders: folder id -> (local path, serialized folder dict), or None to remove the folder
+        :param replace_all: if True - devices and folders are considered full lists, all other rows are removed
+        :return: True if anything that goes into generate_config_text has changed
+        """
+        servers = set(servers)
+        ignoredevices = set(ignoredevices)
+        with self.__connection:
+            cur = self.__connection.cursor()
+            cur.executemany('INSERT OR REPLACE INTO meta (key,value) VALUES (?,?)', meta.items())
+            changed = replace_all
+            if servers != set(x for x, in cur.execute('SELECT device FROM servers').fetchall()):
+                changed = True
+                cur.execute('DELETE FROM servers')
+                cur.executemany('INSERT INTO servers (device) VALUES (?)', ((x,) for x in servers))
+            if ignoredevices != set(x for x, in cur.execute('SELECT device FROM ignoredevices').fetchall()):
+                changed = True
+                cur.execute('DELETE FROM ignoredevices')
+                cur.executemany('INSERT INTO ignoredevices (device) VALUES (?)', ((x,) for x in ignoredevices))
+            if replace_all:
+                cur.execute('DELETE FROM devices')
+                cur.execute('DELETE FROM folders')
+                cur.execute('DELETE FROM folder_devices')
+
+            for did, devdata in devices.items():
+                old = cur.execute('SELECT data FROM devices WHERE id=?', (did,)).fetchone()
+                if devdata is None:
+                    if old is not None:
+                        changed = True
+                        cur.execute('DELETE FROM devices WHERE id=?', (did,))
+                    continue
+                data = json.dumps(devdata)
+                if old is None or old[0] != data:
+                    changed = True
+                    cur.execute('INSERT OR REPLACE INTO devices (id,data) VALUES (?,?)', (did, data))
+
+            for fid, folddata in folders.items():
+                old = cur.execute('SELECT path,data FROM folders WHERE id=?', (fid,)).fetchone()
+                if folddata is None:
+                    if old is not None:
+                        changed = True
+                        cur.execute('DELETE FROM folders WHERE id=?', (fid,))
+                        cur.execute('DELETE FROM folder_devices WHERE folder=?', (fid,))
+                    continue
+                path, fdict = folddata
+                data = json.dumps(fdict)
+                if old is not None and old == (path, data):
+                    continue
+                if old is None or old[1] != data:  # local path alone is not synced
+                    changed = True
+                cur.execute('INSERT OR REPLACE INTO folders (id,path,data) VALUES (?,?,?)', (fid, path, data))
+                cur.execute('DELETE FROM folder_devices WHERE folder=?', (fid,))
+                cur.executemany('INSERT OR IGNORE INTO folder_devices (folder,device) VALUES (?,?)', ((fid, did) for did in fdict.get('devices', ())))
+        return changed
+
+    def device_folder_ids(self, did: str) -> Set[str]:
+        """
+        ids of stored folders shared with given device, uses index on device
+        """
+        return set(x for x, in self.__connection.execute('SELECT folder FROM folder_devices WHERE device=?', (did,)).fetchall())
+
+    def generate_config_text(self) -> str:
+        """
+        generate text of synced config.cfg from stored rows, without reserializing devices and folders
+        """
+        cur = self.__connection.cursor()
+        devices = [x for x, in cur.execute('SELECT data FROM devices ORDER BY id').fetchall()]
+        folders = [x for x, in cur.execute('SELECT data FROM folders ORDER BY id').fetchall()]
+        servers = [x for x, in cur.execute('SELECT device FROM servers ORDER BY device').fetchall()]
+        ignoredevices = [x for x, in cur.execute('SELECT device FROM ignoredevices ORDER BY device').fetchall()]
+        return ''.join(('{"devices": [', ', '.join(devices),
+                        '], "servers": ', json.dumps(servers),
+                        ', "folders": [', ', '.join(folders),
+                        '], "ignoredevices": ', json.dumps(ignoredevices), '}'))
+
 
 class DatabaseHandler(ServerComponent):
     def __init__(self, server, databasepath):
         super(DatabaseHandler, self).__init__(server)
         self.__db = databasepath
+        self.__connection = None
+        self.__connection_lock = threading.Lock()
+
+    def __get_connection(self):
+        """
+        connection is opened once and reused by all queries
+        note that async methods may be executed either in this thread or in the invoker's thread if this one is not running
+        so connection is shared between threads, and all access to it must happen under self.__connection_lock
+        """
+        if self.__connection is None:
+            self.__connection = sqlite3.connect(self.__db, 30, check_same_thread=False)
+            self.__connection.execute('PRAGMA journal_mode=WAL')
+        return self.__connection
+
+    def stop(self):
+        super(DatabaseHandler, self).stop()
+        with self.__connection_lock:
+            if self.__connection is not None:
+                self.__connection.close()
+                self.__connection = None
 
     # def run(self):
     # 	while not self._stopped_set():
@@ -76,45 +226,30 @@ class DatabaseHandler(ServerComponent):
         :return:
         """
         cfg = {'devices': {}, 'blacklist': [], 'folders': {}}
-        con = sqlite3.connect(self.__db, 30)
-        try:
-            cur = con.cursor()
+        with self.__connection_lock:
+            cur = self.__get_connection().cursor()
             good_devices = cur.execute(
                 "SELECT device,address FROM devices INNER JOIN users ON devices.userid=users.userid WHERE devices.blocked=0 AND users.access<>0").fetchall()
             bad_devices = cur.execute(
                 "SELECT device FROM devices INNER JOIN users ON devices.userid=users.userid WHERE devices.blocked=1 OR users.access=0").fetchall()
-            for dev, adr in good_devices:
-                cfg['devices'][dev] = {'address': 'dynamic' if adr is None else adr, }
-            for dev in bad_devices:
-                cfg['blacklist'].append(dev)
-
-            folders = cur.execute("SELECT id,label,path from folders").fetchall()
-            for fid, flabel, fpath in folders:
-                acs = cur.execute(
-                    "SELECT users.userid,users.access,devices.device FROM folders_access INNER JOIN users ON folders_access.userid=users.userid INNER JOIN devices ON users.userid=devices.userid WHERE users.access<>0 AND folders_access.id=:fid",
-                    {'fid': fid}).fetchall()
-
-                for i in range(9999):  # reasonable 'something is wrong' condition
-                    # search config entries
-                    match = re.search('__LANCECONF_(\w+)__', fpath)
-                    if match and match.group(1) in self.config():
-                        fpath = ''.join([fpath[:match.start(0)], self.config()[match.group(1)], fpath[match.end(0):]])
-                    # search env
-                    match = re.search('__LANCEENV_(\w+)__', fpath)
-                    if match and match.group(1) in os.environ:
-                        fpath = ''.join([fpath[:match.start(0)], os.environ[match.group(1)], fpath[match.end(0):]])
-                    # search local(to current execution) variables
-                    locs = {'folder_label': flabel}
-                    match = re.search('__LANCELOC_(\w+)__', fpath)
-                    if match and match.group(1) in locs:
-                        fpath = ''.join([fpath[:match.start(0)], locs[match.group(1)], fpath[match.end(0):]])
-
-                cfg['folders'][fid] = {'label': flabel, 'path': os.path.normpath(fpath), 'type': 'sendreceive',
+            # one query for all folders with their devices, instead of one access query per folder
+            folder_rows = cur.execute(
+                "SELECT folders.id,folders.label,folders.path,acs.device FROM folders LEFT JOIN "
+                "(SELECT folders_access.id AS fid,devices.device AS device FROM folders_access INNER JOIN users ON folders_access.userid=users.userid INNER JOIN devices ON users.userid=devices.userid WHERE users.access<>0) AS acs "
+                "ON acs.fid=folders.id").fetchall()
+
+        for dev, adr in good_devices:
+            cfg['devices'][dev] = {'address': 'dynamic' if adr is None else adr, }
+        for dev, in bad_devices:
+            cfg['blacklist'].append(dev)
+
+        conf = self.config()
+        for fid, flabel, fpath, dev in folder_rows:
+            if fid not in cfg['folders']:
+                cfg['folders'][fid] = {'label': flabel, 'path': os.path.normpath(render_path(fpath, conf, {'folder_label': flabel})), 'type': 'sendreceive',
                                        'devices': []}
-                for _, _, dev in acs:
-                    cfg['folders'][fid]['devices'].append(dev)
-        finally:
-            con.close()
+            if dev is not None:
+                cfg['folders'][fid]['devices'].append(dev)
 
         return cfg
 
@@ -124,13 +259,9 @@ class DatabaseHandler(ServerComponent):
         query DB and get active device list
         :return: list of dicts with 'device', 'userid' keys
         '''
-        con = sqlite3.connect(self.__db, 30)
-        try:
-            cur = con.cursor()
-            devices = cur.execute(
-                "SELECT device,userid FROM devices INNER JOIN users ON devices.userid=users.userid WHERE devices.blocked=0 AND users.access<>0").fetchall()
-        finally:
-            con.close()
+        with self.__connection_lock:
+            devices = self.__get_connection().execute(
+                "SELECT device,devices.userid FROM devices INNER JOIN users ON devices.userid=users.userid WHERE devices.blocked=0 AND users.access<>0").fetchall()
 
         return [{'device': dev, 'userid': uid} for dev, uid in devices]
 
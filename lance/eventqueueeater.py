@@ -1,7 +1,9 @@
 import queue
+import time
 from .servercomponent import ServerComponent
 from . import lance_utils
 from . import eventprocessor
+from . import metrics
 
 
 class EventQueueEater(ServerComponent, lance_utils.EventQueueReader):
@@ -19,6 +21,9 @@ class EventQueueEater(ServerComponent, lance_utils.EventQueueReader):
                 event = self._dequeueEvent(block=True, timeout=10)
             except queue.Empty:
                 continue
+            metrics.gauge('lance_event_queue_depth').set(self._eventQueue.qsize())
+            metrics.counter('lance_events_total', {'type': type(event).__name__}).inc()
+            starttime = time.time()
             # process remove pending queue
             while self.__eventProcessorsRemoveQueue.qsize() > 0:
                 try:
@@ -59,6 +64,7 @@ class EventQueueEater(ServerComponent, lance_utils.EventQueueReader):
                 if ep.is_expected_event(event):
                     ep.add_event(event)
 
+            metrics.histogram('lance_event_dispatch_seconds', {'type': type(event).__name__}).observe(time.time() - starttime)
             self._eventProcessed()
 
     def add_event_processor(self, eventprocessor):
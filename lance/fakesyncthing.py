@@ -0,0 +1,484 @@
+import os
+import copy
+import json
+import time
+import base64
+import datetime
+import random
+import threading
+import http.server
+import urllib.parse
+import xml.etree.ElementTree as ET
+
+from .syncthinglauncher import SyncthingLauncher
+
+from typing import Optional, Dict, List, Tuple
+
+
+def random_device_id() -> str:
+    """
+    random id looking like a syncthing device id
+    """
+    raw = base64.b32encode(bytes(random.getrandbits(8) for _ in range(35))).decode('ascii')[:56]
+    return '-'.join(raw[i:i + 7] for i in range(0, 56, 7))
+
+
+def syncthing_timestamp(timestamp: Optional[float] = None) -> str:
+    """
+    timestamp in syncthing's format, with nanoseconds: 2019-05-01T12:00:00.123456789+02:00
+    """
+    dt = datetime.datetime.fromtimestamp(time.time() if timestamp is None else timestamp).astimezone()
+    tz = dt.strftime('%z')
+    return '%s000%s:%s' % (dt.strftime('%Y-%m-%dT%H:%M:%S.%f'), tz[:3], tz[3:])
+
+
+_NEVER = '0001-01-01T00:00:00Z'  # what syncthing reports for things that never happened
+
+
+class FakeSyncthingProcess:
+    """
+    what FakeSyncthing.start returns instead of Popen
+    """
+    def __init__(self, fake: 'FakeSyncthing', detach_on_terminate: bool = False):
+        self.__fake = fake
+        self.__detach = detach_on_terminate
+        self.returncode = None
+
+    def poll(self):
+        return self.returncode
+
+    def terminate(self):
+        self._exit(0, shutdown=not self.__detach)
+
+    def _exit(self, returncode: int, shutdown: bool = True):
+        if self.returncode is None:
+            if shutdown:
+                self.__fake._shutdown()
+            self.returncode = returncode
+
+    kill = terminate
+
+    def wait(self, timeout=None):
+        return self.returncode
+
+
+class FakeSyncthing(SyncthingLauncher):
+    """
+    in-process stand-in for syncthing REST api, to run syncthing handler without syncthing binary
+    pass it as syncthing_launcher to Server
+
+    serves /rest/events, /rest/system/ping, /rest/system/status, /rest/system/connections, /rest/system/config,
+    /rest/system/config/insync, /rest/db/file, /rest/db/status, /rest/db/scan, /rest/stats/folder, /rest/system/pause, /rest/system/resume and /rest/system/restart
+    nothing is really synced: events are what test scripts with push_event/schedule_event,
+    files are what test sets with set_file, or what's on disk in configured folders
+
+    latency is injected before every response, globally or per path
+    startup_delay is how long rest api refuses connections after start, like real syncthing does while loading
+    persistent fake outlives handlers, like syncthing run as a service: terminate only detaches from it,
+    and next start attaches to the running one with it's event history. use crash() to really stop it
+    """
+    def __init__(self, device_id: Optional[str] = None, latency: float = 0.0, require_restart_on_config: bool = False, startup_delay: float = 0.0, persistent: bool = False):
+        super(FakeSyncthing, self).__init__('fake syncthing')
+        self.__device_id = device_id
+        self.__latency = {None: latency}  # type: Dict[Optional[str], float]
+        self.__require_restart = require_restart_on_config
+        self.__startup_delay = startup_delay
+        self.__persistent = persistent
+        self.__start_time = None  # type: Optional[str]
+        self.__folder_status = {}  # type: Dict[str, dict]
+        self.__folder_stats = {}  # type: Dict[str, dict]
+        self.__connections = {}  # type: Dict[str, dict]
+        self.__lock = threading.Lock()
+        self.__events_cond = threading.Condition(self.__lock)
+        self.__events = []  # type: List[dict]
+        self.__last_event_id = 0
+        self.__timers = []  # type: List[threading.Timer]
+        self.__config = {}
+        self.__config_insync = True
+        self.__files = {}  # type: Dict[Tuple[str, str], dict]
+        self.__requests = []  # type: List[Tuple[str, str, dict]]
+        self.__paused = set()
+        self.__restarts = 0
+        self.__home = None
+        self.__httpd = None
+        self.__thread = None
+        self.__stopping = threading.Event()
+        self.__process = None  # type: Optional[FakeSyncthingProcess]
+
+    # launcher interface
+
+    def device_id(self, home: str) -> Optional[str]:
+        idpath = os.path.join(home, 'fake_syncthing_id')
+        if not os.path.exists(idpath):
+            return None
+        with open(idpath, 'r') as f:
+            return f.read()
+
+    def generate(self, home: str) -> bool:
+        os.makedirs(home, exist_ok=True)
+        with open(os.path.join(home, 'fake_syncthing_id'), 'w') as f:
+            f.write(self.__device_id if self.__device_id is not None else random_device_id())
+        return True
+
+    def start(self, home: str, gui_address: str):
+        if self.__persistent and self.__httpd is not None:
+            self.__process = FakeSyncthingProcess(self, detach_on_terminate=True)
+            return self.__process
+        if self.__process is not None and self.__process.poll() is None:
+            raise RuntimeError('fake syncthing is already running')
+        if self.__process is not None:  # restarted syncthing starts event ids from scratch
+            with self.__lock:
+                self.__events = []
+                self.__last_event_id = 0
+        self.__home = home
+        self.__load_config_xml(os.path.join(home, 'config.xml'))
+        addr, port = gui_address.rsplit(':', 1)
+        self.__stopping.clear()
+        httpd = self.__bind(addr, int(port)) if self.__startup_delay <= 0 else None  # so rest api is there as soon as start returns
+        self.__thread = threading.Thread(target=self.__serve, args=(addr, int(port), httpd), name='fake syncthing', daemon=True)
+        self.__thread.start()
+        self.__process = FakeSyncthingProcess(self, detach_on_terminate=self.__persistent)
+        return self.__process
+
+    def __bind(self, addr: str, port: int) -> Optional[http.server.ThreadingHTTPServer]:
+        with self.__lock:
+            if self.__stopping.is_set():
+                return None
+            self.__httpd = http.server.ThreadingHTTPServer((addr, port), self.__make_handler())
+            self.__httpd.daemon_threads = True
+            self.__start_time = syncthing_timestamp()
+            httpd = self.__httpd
+        self.push_event('StartupComplete', {'myID': self.device_id(self.__home)})
+        return httpd
+
+    def __serve(self, addr: str, port: int, httpd: Optional[http.server.ThreadingHTTPServer]):
+        if httpd is None:
+            if self.__stopping.wait(self.__startup_delay):
+                return
+            httpd = self.__bind(addr, port)
+            if httpd is None:
+                return
+        httpd.serve_forever()
+
+    def _shutdown(self):
+        with self.__lock:
+            self.__stopping.set()
+            for timer in self.__timers:
+                timer.cancel()
+            self.__timers = []
+            self.__events_cond.notify_all()
+            httpd = self.__httpd
+            self.__httpd = None
+        if httpd is not None:
+            httpd.shutdown()
+            httpd.server_close()
+
+    # scripting
+
+    def crash(self, returncode: int = 1):
+        """
+        make fake syncthing process exit on it's own
+        """
+        if self.__process is not None:
+            self.__process._exit(returncode)
+
+    def drop_events(self, keep: int = 0):
+        """
+        forget all buffered events but last keep ones, like syncthing does when it's event buffer overflows
+        """
+        with self.__lock:
+            self.__events = self.__events[len(self.__events) - keep:] if keep > 0 else []
+
+    def lose_events(self, count: int):
+        """
+        pretend count events happened and were dropped from buffer before anyone got them
+        """
+        with self.__lock:
+            self.__last_event_id += count
+
+    def set_connected(self, did: str, connected: bool = True, address: str = ''):
+        """
+        set what /rest/system/connections answers for device. only events can tell handler about it otherwise
+        """
+        with self.__lock:
+            self.__connections[did] = {'connected': connected, 'paused': did in self.__paused, 'address': address, 'clientVersion': 'fake' if connected else ''}
+
+    def last_event_id(self) -> int:
+        with self.__lock:
+            return self.__last_event_id
+
+    def set_folder_status(self, fid: str, **summary):
+        """
+        set what /rest/db/status answers for folder, synced idle folder by default
+        """
+        with self.__lock:
+            self.__folder_status.setdefault(fid, {'needTotalItems': 0, 'state': 'idle'}).update(summary)
+
+    def set_folder_stats(self, fid: str, last_file: Optional[float] = None, last_scan: Optional[float] = None):
+        """
+        set what /rest/stats/folder answers for folder: when it last pulled a file and when it was last scanned
+        pushed ItemFinished events and scan requests update it too
+        """
+        with self.__lock:
+            stats = self.__folder_stats.setdefault(fid, {'lastFile': {'at': _NEVER, 'filename': '', 'deleted': False}, 'lastScan': _NEVER})
+            if last_file is not None:
+                stats['lastFile']['at'] = syncthing_timestamp(last_file)
+            if last_scan is not None:
+                stats['lastScan'] = syncthing_timestamp(last_scan)
+
+    def set_latency(self, seconds: float, path: Optional[str] = None):
+        """
+        delay responses to path by given seconds, or all responses if path is None
+        """
+        self.__latency[path] = seconds
+
+    def push_event(self, eventtype: str, data: Optional[dict] = None, timestamp: Optional[float] = None) -> int:
+        """
+        add event to the event stream
+        :return: event id
+        """
+        with self.__lock:
+            self.__last_event_id += 1
+            self.__events.append({'id': self.__last_event_id,
+                                  'globalID': self.__last_event_id,
+                                  'type': eventtype,
+                                  'time': syncthing_timestamp(timestamp),
+                                  'data': data if data is not None else {}})
+            self.__events_cond.notify_all()
+            eventid = self.__last_event_id
+        if eventtype == 'ItemFinished' and data is not None and 'folder' in data:
+            self.set_folder_stats(data['folder'], last_file=timestamp if timestamp is not None else time.time())
+        return eventid
+
+    def schedule_event(self, delay: float, eventtype: str, data: Optional[dict] = None):
+        """
+        push event after delay seconds
+        """
+        timer = threading.Timer(delay, self.push_event, (eventtype, data))
+        timer.daemon = True
+        with self.__lock:
+            self.__timers.append(timer)
+        timer.start()
+
+    def script_events(self, script):
+        """
+        schedule a list of (delay since previous event, type, data) tuples
+        """
+        delay = 0
+        for step_delay, eventtype, data in script:
+            delay += step_delay
+            self.schedule_event(delay, eventtype, data)
+
+    def set_file(self, folder: str, name: str, local_version=None, global_version=None, modified: Optional[float] = None):
+        """
+        set what /rest/db/file reports for the file, different versions mean file is not yet synced
+        """
+        if global_version is None:
+            global_version = ['fake:1']
+        if local_version is None:
+            local_version = global_version
+        modified = syncthing_timestamp(modified)
+        with self.__lock:
+            self.__files[(folder, name)] = {'global': {'name': name, 'version': list(global_version), 'modified': modified},
+                                            'local': {'name': name, 'version': list(local_version), 'modified': modified},
+                                            'availability': []}
+
+    # inspection
+
+    def config(self) -> dict:
+        with self.__lock:
+            return json.loads(json.dumps(self.__config))
+
+    def _apikey(self) -> Optional[str]:
+        with self.__lock:
+            return self.__config.get('gui', {}).get('apikey', None)
+
+    def requests(self) -> List[Tuple[str, str, dict]]:
+        """
+        :return: list of (http method, path, query) of all requests served so far
+        """
+        with self.__lock:
+            return list(self.__requests)
+
+    def paused(self) -> set:
+        with self.__lock:
+            return set(self.__paused)
+
+    def restarts(self) -> int:
+        return self.__restarts
+
+    def base_url(self) -> Optional[str]:
+        if self.__httpd is None:
+            return None
+        return 'http://%s:%d' % self.__httpd.server_address[:2]
+
+    # internals
+
+    def __load_config_xml(self, path):
+        config = {'version': 0, 'folders': [], 'devices': [], 'gui': {}, 'options': {}, 'ignoredDevices': []}
+        if os.path.exists(path):
+            root = ET.parse(path).getroot()
+            config['version'] = int(root.get('version', 0))
+            for elem in root.findall('device'):
+                config['devices'].append({'deviceID': elem.get('id'), 'name': elem.get('name', ''),
+                                          'addresses': [x.text for x in elem.findall('address')],
+                                          'compression': elem.get('compression', 'metadata'),
+                                          'introducer': elem.get('introducer', 'false') == 'true'})
+            for elem in root.findall('folder'):
+                config['folders'].append({'id': elem.get('id'), 'label': elem.get('label', ''), 'path': elem.get('path'),
+                                          'type': elem.get('type', 'sendreceive'),
+                                          'devices': [{'deviceID': x.get('id')} for x in elem.findall('device')]})
+            for elem in root.findall('ignoredDevice'):
+                config['ignoredDevices'].append(elem.text)
+            gui = root.find('gui')
+            if gui is not None:
+                config['gui'] = {'enabled': gui.get('enabled', 'true') == 'true', 'tls': gui.get('tls', 'false') == 'true',
+                                 'address': gui.findtext('address'), 'apikey': gui.findtext('apikey')}
+            options = root.find('options')
+            if options is not None:
+                config['options'] = {x.tag: x.text for x in options}
+        with self.__lock:
+            self.__config = config
+            self.__config_insync = True
+
+    def __file_info(self, folder: str, name: str) -> Optional[dict]:
+        with self.__lock:
+            if (folder, name) in self.__files:
+                return self.__files[(folder, name)]
+            folderpath = None
+            for fconf in self.__config.get('folders', []):
+                if fconf.get('id') == folder:
+                    folderpath = fconf.get('path')
+                    break
+        if folderpath is None:
+            return None
+        filepath = os.path.join(folderpath, *name.split('/'))
+        if not os.path.isfile(filepath):
+            return None
+        stat = os.stat(filepath)
+        version = ['fake:%d' % stat.st_mtime_ns]
+        return {'global': {'name': name, 'version': version, 'modified': syncthing_timestamp(stat.st_mtime), 'size': stat.st_size},
+                'local': {'name': name, 'version': version, 'modified': syncthing_timestamp(stat.st_mtime), 'size': stat.st_size},
+                'availability': []}
+
+    def __events_since(self, since: int, timeout: float) -> List[dict]:
+        deadline = time.time() + timeout
+        with self.__lock:
+            while self.__httpd is not None:
+                events = [x for x in self.__events if x['id'] > since]
+                if len(events) > 0:
+                    return events
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return []
+                self.__events_cond.wait(remaining)
+        return []
+
+    def _handle(self, method: str, path: str, query: dict, body: Optional[bytes]) -> Tuple[int, object]:
+        """
+        :return: http code and json-able response
+        """
+        with self.__lock:
+            self.__requests.append((method, path, query))
+        latency = self.__latency.get(path, self.__latency[None])
+        if latency > 0:
+            time.sleep(latency)
+
+        if method == 'GET' and path == '/rest/events':
+            return 200, self.__events_since(int(query.get('since', 0)), float(query.get('timeout', 60)))
+        elif path == '/rest/system/ping':
+            return 200, {'ping': 'pong'}
+        elif method == 'GET' and path == '/rest/system/status':
+            return 200, {'myID': self.device_id(self.__home), 'startTime': self.__start_time}
+        elif method == 'GET' and path == '/rest/system/config':
+            return 200, self.config()
+        elif method == 'POST' and path == '/rest/system/config':
+            config = json.loads(body.decode('utf-8'))
+            with self.__lock:
+                self.__config = config
+                self.__config_insync = not self.__require_restart
+            self.push_event('ConfigSaved', {'version': config.get('version', 0)})
+            return 200, None
+        elif method == 'GET' and path == '/rest/system/config/insync':
+            with self.__lock:
+                return 200, {'configInSync': self.__config_insync}
+        elif method == 'GET' and path == '/rest/db/file':
+            info = self.__file_info(query.get('folder', ''), query.get('file', ''))
+            if info is None:
+                return 404, 'No such object in the index'
+            return 200, info
+        elif method == 'GET' and path == '/rest/system/connections':
+            with self.__lock:
+                return 200, {'total': {}, 'connections': copy.deepcopy(self.__connections)}
+        elif method == 'GET' and path == '/rest/db/status':
+            with self.__lock:
+                return 200, dict(self.__folder_status.get(query.get('folder', ''), {'needTotalItems': 0, 'state': 'idle'}))
+        elif method == 'POST' and path == '/rest/db/scan':
+            self.set_folder_stats(query.get('folder', ''), last_scan=time.time())
+            self.push_event('LocalIndexUpdated', {'folder': query.get('folder', ''), 'items': 0})
+            return 200, None
+        elif method == 'GET' and path == '/rest/stats/folder':
+            with self.__lock:
+                stats = {x['id']: {'lastFile': {'at': _NEVER, 'filename': '', 'deleted': False}, 'lastScan': _NEVER} for x in self.__config.get('folders', [])}
+                stats.update(copy.deepcopy(self.__folder_stats))
+            return 200, stats
+        elif method == 'POST' and path in ('/rest/system/pause', '/rest/system/resume'):
+            with self.__lock:
+                devices = [query['device']] if 'device' in query else [x['deviceID'] for x in self.__config.get('devices', [])]
+                if path == '/rest/system/pause':
+                    self.__paused.update(devices)
+                else:
+                    self.__paused.difference_update(devices)
+            for dev in devices:
+                self.push_event('DevicePaused' if path == '/rest/system/pause' else 'DeviceResumed', {'device': dev})
+            return 200, None
+        elif method == 'POST' and path == '/rest/system/restart':
+            self.__restarts += 1
+            with self.__lock:
+                self.__config_insync = True
+            self.push_event('StartupComplete', {'myID': self.device_id(self.__home)})
+            return 200, {'ok': 'restarting'}
+        return 404, '404 page not found'
+
+    def __make_handler(self):
+        fake = self
+
+        class _Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def __serve(self, method):
+                url = urllib.parse.urlsplit(self.path)
+                query = dict(urllib.parse.parse_qsl(url.query))
+                body = None
+                if 'Content-Length' in self.headers:
+                    body = self.rfile.read(int(self.headers['Content-Length']))
+                apikey = fake._apikey()
+                if apikey and self.headers.get('X-API-Key', None) != apikey:
+                    code, response = 403, 'CSRF Error'
+                else:
+                    try:
+                        code, response = fake._handle(method, url.path, query, body)
+                    except Exception as e:
+                        code, response = 500, repr(e)
+                if isinstance(response, str):
+                    data = response.encode('utf-8')
+                    ctype = 'text/plain; charset=utf-8'
+                else:
+                    data = b'' if response is None else json.dumps(response).encode('utf-8')
+                    ctype = 'application/json; charset=utf-8'
+                self.send_response(code)
+                self.send_header('Content-Type', ctype)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self.__serve('GET')
+
+            def do_POST(self):
+                self.__serve('POST')
+
+            def log_message(self, format, *args):
+                pass
+
+        return _Handler
@@ -0,0 +1,126 @@
+"""
+json encoding and decoding for lance files and syncthing rest payloads
+uses the fastest backend available: orjson, then simplejson, then stdlib json
+
+files synced by syncthing (config.cfg and such) are written compact - they are read by machines only,
+and every byte of them is rehashed and transferred to every device on every change.
+local files, like syncthinghandler_config.json, stay indented, so they are still easy to edit by hand.
+
+note that configuration hashes are NOT computed with this codec - they must be the same on all devices,
+whatever backend every device happens to have
+"""
+import json as _stdjson
+
+try:
+    import orjson as _orjson
+except ImportError:
+    _orjson = None
+
+try:
+    import simplejson as _simplejson
+except ImportError:
+    _simplejson = None
+
+from typing import Union, Optional
+
+
+class JsonCodec:
+    """
+    stdlib-compatible backend, works with json and simplejson modules
+    """
+    def __init__(self, module, name: str):
+        self.__module = module
+        self.__name = name
+
+    def name(self) -> str:
+        return self.__name
+
+    def loads(self, data: Union[str, bytes, bytearray]):
+        return self.__module.loads(data)
+
+    def dumps(self, obj, compact: bool = False) -> str:
+        if compact:
+            return self.__module.dumps(obj, separators=(',', ':'))
+        return self.__module.dumps(obj, indent=4)
+
+
+class OrjsonCodec(JsonCodec):
+    """
+    orjson backend
+    orjson can only indent with 2 spaces, so non-compact output is left to stdlib to keep files looking the same
+    non-ascii output is also left to stdlib, cuz orjson writes raw utf-8, and files are opened with locale encoding
+    """
+    def __init__(self):
+        super(OrjsonCodec, self).__init__(_stdjson, 'orjson')
+
+    def loads(self, data: Union[str, bytes, bytearray]):
+        return _orjson.loads(data)
+
+    def dumps(self, obj, compact: bool = False) -> str:
+        if compact:
+            try:
+                result = _orjson.dumps(obj).decode('utf-8')
+            except TypeError:  # non-str dict keys and such, orjson.JSONEncodeError is a TypeError
+                result = None
+            if result is not None and result.isascii():
+                return result
+        return super(OrjsonCodec, self).dumps(obj, compact)
+
+
+def _available_codecs():
+    codecs = {'json': lambda: JsonCodec(_stdjson, 'json')}
+    if _simplejson is not None:
+        codecs['simplejson'] = lambda: JsonCodec(_simplejson, 'simplejson')
+    if _orjson is not None:
+        codecs['orjson'] = OrjsonCodec
+    return codecs
+
+
+def available_backends():
+    """
+    :return: names of backends that can be used on this machine, fastest first
+    """
+    return [x for x in ('orjson', 'simplejson', 'json') if x in _available_codecs()]
+
+
+__codec = None  # type: Optional[JsonCodec]
+
+
+def set_backend(name: Optional[str] = None):
+    """
+    choose json backend
+    :param name: one of available_backends(), or None for the fastest one
+    """
+    global __codec
+    codecs = _available_codecs()
+    if name is None:
+        name = available_backends()[0]
+    if name not in codecs:
+        raise ValueError('json backend %s is not available, available are: %s' % (name, ', '.join(available_backends())))
+    __codec = codecs[name]()
+
+
+def backend_name() -> str:
+    return __codec.name()
+
+
+def loads(data: Union[str, bytes, bytearray]):
+    """
+    parse json from str, or directly from bytes, like http response body
+    """
+    return __codec.loads(data)
+
+
+def dumps(obj, compact: bool = False) -> str:
+    return __codec.dumps(obj, compact)
+
+
+def load(f):
+    return __codec.loads(f.read())
+
+
+def dump(obj, f, compact: bool = False):
+    f.write(__codec.dumps(obj, compact))
+
+
+set_backend()
@@ -4,9 +4,59 @@ import os
 import errno
 import re
 import time
+import datetime
+import contextlib
 
 from typing import Iterable, Optional
 
+from . import logger
+from . import metrics
+from .profiling import AsyncMethodProfiler
+
+_async_profiler = None  # type: Optional[AsyncMethodProfiler]
+
+
+def set_async_profiler(profiler: Optional[AsyncMethodProfiler]):
+    """
+    profile async methods of all StoppableThreads that do not have their own profiler set, None to disable
+    """
+    global _async_profiler
+    _async_profiler = profiler
+
+
+_timezones = {'Z': datetime.timezone.utc}  # type: dict  # timezone offset string -> timezone object, there are only a few of those in practice
+
+
+def syncthing_timestamp_to_datetime(timestamp: str) -> datetime.datetime:
+    """
+    parse syncthing's RFC3339 timestamp with up to nanoseconds, like 2019-05-01T12:00:00.123456789+02:00
+    fields are at fixed offsets, so slicing is way faster than strptime. nanoseconds are truncated to microseconds
+    """
+    try:
+        if timestamp[-1] == 'Z':
+            tzstr = 'Z'
+            end = len(timestamp) - 1
+        else:
+            tzstr = timestamp[-6:]
+            end = len(timestamp) - 6
+        microsecond = 0
+        if end > 19:  # there is a fraction
+            if timestamp[19] != '.':
+                raise ValueError()
+            microsecond = int(timestamp[20:end][:6].ljust(6, '0'))
+        tz = _timezones.get(tzstr)
+        if tz is None:
+            if tzstr[0] not in '+-' or tzstr[3] != ':':
+                raise ValueError()
+            offset = datetime.timedelta(hours=int(tzstr[1:3]), minutes=int(tzstr[4:6]))
+            tz = _timezones.setdefault(tzstr, datetime.timezone(-offset if tzstr[0] == '-' else offset))
+        return datetime.datetime(int(timestamp[0:4]), int(timestamp[5:7]), int(timestamp[8:10]),
+                                 int(timestamp[11:13]), int(timestamp[14:16]), int(timestamp[17:19]),
+                                 microsecond, tz)
+    except (ValueError, IndexError):
+        raise ValueError('bad syncthing timestamp: %r' % timestamp) from None
+
+
 def makedirs(path, mode=0o777):
     try:
         return os.makedirs(path, mode)
@@ -15,6 +65,45 @@ def makedirs(path, mode=0o777):
             raise
 
 
+@contextlib.contextmanager
+def atomic_write(path: str, mode: str = 'w', fsync: bool = True):
+    """
+    open file for writing so that no one ever sees it half-written, not lance, not syncthing
+    data goes to a temp file next to path, then it is renamed over path. if anything fails - path is left untouched
+    temp name looks like .syncthing.<name>.lance-<pid>-<thread>.tmp, syncthing ignores these and does not sync them,
+    and the lance part keeps it from clashing with syncthing's own temp file for the same name
+    :param path: file to write
+    :param mode: 'w' or 'wb'
+    :param fsync: flush data to disk before rename, and the directory after it, so a crash leaves either old or new file
+    """
+    dirpath, name = os.path.split(path)
+    tmppath = os.path.join(dirpath, '.syncthing.%s.lance-%d-%d.tmp' % (name, os.getpid(), threading.get_ident()))
+    try:
+        with open(tmppath, mode) as f:
+            yield f
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmppath, path)
+    except BaseException:
+        try:
+            os.remove(tmppath)
+        except OSError:
+            pass
+        raise
+    if fsync and hasattr(os, 'O_DIRECTORY'):  # no way to fsync a directory on windows, nor need to
+        try:
+            dirfd = os.open(dirpath or '.', os.O_RDONLY | os.O_DIRECTORY)
+        except OSError:
+            return
+        try:
+            os.fsync(dirfd)
+        except OSError:
+            pass
+        finally:
+            os.close(dirfd)
+
+
 class BaseEvent(object):
     def __init__(self):
         pass
@@ -48,6 +137,7 @@ class EventQueueWriter(EventQueueUser):
         super(EventQueueWriter, self).__init__(queue)
 
     def _enqueueEvent(self, event):
+        logger.record_event(event)
         self._eventQueue.put(event)
 
 
@@ -65,9 +155,10 @@ def async_method(raise_while_invoking=False, queue_only=False):
     def inner_decor(func):
         def wrapper(self, *args, **kwargs):
             asyncres = StoppableThread.AsyncResult(raise_while_invoking)
+            metrics.counter('lance_async_calls_total', {'component': self._metricsName, 'method': func.__name__}).inc()
             if queue_only or self.isAlive():  # if self is a running thread - enqueue method for execution
                 with self._method_invoke_Queue_lock:
-                    self._method_invoke_Queue.put((func, asyncres, args, kwargs))
+                    self._method_invoke_Queue.put((func, asyncres, args, kwargs, time.time()))
             else:  # if self is not running - execute now
                 try:    #TODO: make sure this can never be executed while object's constructor is being executed!
                     asyncres._setDone(func(self, *args, **kwargs))
@@ -86,6 +177,7 @@ class AsyncMethodBatch:
     def __init__(self, thread: 'StoppableThread'):
         self._method_invoke_Queue = SimpleThreadsafeQueue()
         self._method_invoke_Queue_lock = threading.Lock()
+        self._metricsName = thread._metricsName
         self.__thread = thread
         self.__doubleEnterPreventor = threading.Lock()
 
@@ -242,7 +334,7 @@ class StoppableThread(threading.Thread):
             return self.__done.wait(timeout)
 
         def check(self):
-            return self.__done.isSet()
+            return self.__done.is_set()
 
         def set_raise_on_invoke(self, do_raise):
             self.__raiseImmediately = do_raise
@@ -274,6 +366,18 @@ class StoppableThread(threading.Thread):
         self._method_invoke_Queue_lock = threading.Lock()
         self.__stopped_event = threading.Event()
         self._methodQueueBlockTime = 0.1
+        self._metricsName = type(self).__name__  # component label for metrics, subclasses may make it more specific
+        self._profiler = None  # type: Optional[AsyncMethodProfiler]
+
+    def set_profiler(self, profiler: Optional[AsyncMethodProfiler]):
+        """
+        profile async methods invoked by this thread, overrides global profiler set by set_async_profiler
+        """
+        self._profiler = profiler
+
+    def isAlive(self):
+        # Thread.isAlive is gone since python 3.9, async_method relies on it
+        return self.is_alive()
 
     def stop(self):
         self.__stopped_event.set()
@@ -283,6 +387,7 @@ class StoppableThread(threading.Thread):
 
     def _processAsyncMethods(self, time_to_wait=0.25, max_events_to_invoke=None):
         i = 1 if max_events_to_invoke is None else max_events_to_invoke
+        metrics.gauge('lance_async_queue_depth', {'component': self._metricsName}).set(self._method_invoke_Queue.qsize())
         while self._method_invoke_Queue.qsize() and i > 0:
             try:
                 cmd = self._method_invoke_Queue.get(True, time_to_wait)
@@ -292,10 +397,28 @@ class StoppableThread(threading.Thread):
                 break
             except SimpleThreadsafeQueue.Blocked:
                 continue  # is this reasonable?
+            labels = {'component': self._metricsName, 'method': cmd[0].__name__}
+            starttime = time.time()
+            metrics.histogram('lance_async_queue_wait_seconds', labels).observe(starttime - cmd[4])
+            profiler = self._profiler if self._profiler is not None else _async_profiler
             try:
-                cmd[1]._setDone(cmd[0](self, *cmd[2], **cmd[3]))
+                try:
+                    if profiler is None:
+                        result = cmd[0](self, *cmd[2], **cmd[3])
+                    else:
+                        result = profiler.invoke(self._metricsName, cmd[0], self, cmd[2], cmd[3], starttime - cmd[4])
+                finally:
+                    metrics.histogram('lance_async_run_seconds', labels).observe(time.time() - starttime)
+                cmd[1]._setDone(result)
             except Exception as e:
-                if not cmd[1]._setException(e):  # means we should retry
+                metrics.counter('lance_async_errors_total', labels).inc()
+                final = True
+                try:
+                    final = cmd[1]._setException(e)
+                finally:  # _setException may raise it straight away
+                    if final and logger.get_flight_recorder() is not None:
+                        logger.get_flight_recorder().dump_on_exception(e, '%s.%s' % (type(self).__name__, cmd[0].__name__))
+                if not final:  # means we should retry
                     self._method_invoke_Queue.put_back(cmd)
                     return
 
@@ -1,18 +1,337 @@
+import sys
+import os
 import time
+import json
+import atexit
+import fnmatch
+import threading
+import traceback
+import collections
+
+from typing import Optional, Iterable
 
 _loggercache = {}
+_levelrules = []  # list of (name pattern, level), later rules win
+
+# record is a plain tuple, cuz it is created for every log line: (time, logger name, level, msg, args)
+# msg is None for records made by logger(level, *args), otherwise it's a str or a callable given to logger.fmt
+
+
+def record_message(record) -> str:
+    """
+    build message text of a record, this is where all the formatting happens
+    """
+    _, _, _, msg, args = record
+    if msg is None:
+        return ', '.join(map(repr, args))
+    if callable(msg):
+        return msg()
+    if len(args) > 0:
+        return msg % args
+    return msg
+
+
+def format_text(record) -> str:
+    etime, name, _, msg, _ = record
+    timestamp = '%s-%d: ' % (time.strftime("%H-%M-%S", time.localtime(etime)), (etime % 1) * 1e6)
+    text = record_message(record)
+    if msg is not None:
+        text = repr(text)
+    return "%s: %s :: %s" % (timestamp, name.upper(), text)
+
+
+def format_json(record) -> str:
+    etime, name, level, _, _ = record
+    return json.dumps({'time': etime, 'logger': name, 'level': level, 'message': record_message(record)})
+
+
+class StdoutSink:
+    """
+    default sink - formats and prints record straight away, in the caller's thread
+    """
+    def emit(self, record):
+        print(format_text(record))
+
+    def flush(self, timeout=None):
+        pass
+
+    def close(self):
+        pass
+
+
+class StreamWriter:
+    """
+    writes lines to a stream, if stream is None - to whatever sys.stdout is at the moment of writing
+    """
+    def __init__(self, stream=None):
+        self.__stream = stream
+
+    def write(self, lines: Iterable[str]):
+        stream = self.__stream if self.__stream is not None else sys.stdout
+        stream.write(''.join(x + '\n' for x in lines))
+        stream.flush()
+
+    def close(self):
+        pass
+
+
+class RotatingFileWriter:
+    """
+    appends lines to a file, when file grows over max_bytes it is renamed to path.1, path.1 to path.2 and so on
+    up to backup_count files are kept
+    """
+    def __init__(self, path: str, max_bytes: int = 0, backup_count: int = 3):
+        self.__path = path
+        self.__max_bytes = max_bytes
+        self.__backup_count = backup_count
+        self.__file = open(self.__path, 'a')
+        self.__size = self.__file.tell()
+
+    def __rotate(self):
+        self.__file.close()
+        for i in range(self.__backup_count - 1, 0, -1):
+            if os.path.exists('%s.%d' % (self.__path, i)):
+                os.replace('%s.%d' % (self.__path, i), '%s.%d' % (self.__path, i + 1))
+        if self.__backup_count > 0:
+            os.replace(self.__path, '%s.1' % self.__path)
+        self.__file = open(self.__path, 'w')
+        self.__size = 0
+
+    def write(self, lines: Iterable[str]):
+        for line in lines:
+            if self.__max_bytes > 0 and self.__size > 0 and self.__size + len(line) + 1 > self.__max_bytes:
+                self.__rotate()
+            self.__file.write(line)
+            self.__file.write('\n')
+            self.__size += len(line) + 1
+        self.__file.flush()
+
+    def close(self):
+        self.__file.close()
+
+
+class AsyncLogSink:
+    """
+    sink that formats records in the caller's thread and puts lines into a ring buffer, writing is done by a background writer thread
+    records are formatted right away, cuz log args are often live objects that change later
+    deque's append and popleft are atomic, so callers never take a lock
+    if buffer is full - oldest lines are dropped, dropped() tells how many
+    """
+    def __init__(self, writer=None, json_lines: bool = False, capacity: int = 65536, flush_interval: float = 0.1):
+        self.__writer = writer if writer is not None else StreamWriter()
+        self.__formatter = format_json if json_lines else format_text
+        self.__capacity = capacity
+        self.__buffer = collections.deque(maxlen=capacity)
+        self.__dropped = 0
+        self.__flush_interval = flush_interval
+        self.__stop_event = threading.Event()
+        self.__thread = threading.Thread(target=self.__run, name='lance log writer', daemon=True)
+        self.__thread.start()
+        atexit.register(self.close)
+
+    def emit(self, record):
+        try:
+            line = self.__formatter(record)
+        except Exception as e:
+            line = 'log record formatting failed: %s' % repr(e)
+        if len(self.__buffer) >= self.__capacity:
+            self.__dropped += 1  # not exact with many writers, but good enough to notice
+        self.__buffer.append(line)
+
+    def dropped(self) -> int:
+        return self.__dropped
+
+    def __drain(self):
+        lines = []
+        while True:
+            try:
+                lines.append(self.__buffer.popleft())
+            except IndexError:
+                break
+        if len(lines) > 0:
+            self.__writer.write(lines)
+
+    def __run(self):
+        while not self.__stop_event.wait(self.__flush_interval):
+            try:
+                self.__drain()
+            except Exception:  # logging must never kill the writer
+                pass
+        self.__drain()
+
+    def flush(self, timeout: Optional[float] = None):
+        """
+        wait for all currently buffered records to be written
+        """
+        start = time.time()
+        while len(self.__buffer) > 0 and self.__thread.is_alive():
+            if timeout is not None and time.time() - start > timeout:
+                return
+            time.sleep(self.__flush_interval / 4)
+
+    def close(self):
+        if self.__stop_event.is_set():
+            return
+        self.__stop_event.set()
+        self.__thread.join()
+        self.__writer.close()
+
+
+class FlightRecorder:
+    """
+    keeps last capacity log records of all levels and lance events in a ring buffer
+    nothing is formatted until dump, so it's cheap enough to keep enabled all the time
+    that is why log args must be snapshots, not live objects that change later: tuple(some_set), not some_set
+    """
+    def __init__(self, capacity: int = 4096, dump_dir: Optional[str] = None, min_dump_interval: float = 10):
+        """
+        :param capacity: number of records to keep
+        :param dump_dir: where to dump on exceptions, if None - dump goes to stderr
+        :param min_dump_interval: exception dumps happening more often than that are skipped
+        """
+        self.__buffer = collections.deque(maxlen=capacity)
+        self.__dump_dir = dump_dir
+        self.__min_dump_interval = min_dump_interval
+        self.__last_dump_time = None
+        self.__dump_lock = threading.Lock()
+
+    def record(self, record):
+        self.__buffer.append(record)
+
+    def records(self):
+        return tuple(self.__buffer)
+
+    def dump(self, stream=None, reason: Optional[str] = None):
+        """
+        format all kept records and write them to stream, sys.stderr if None
+        """
+        lines = []
+        for record in tuple(self.__buffer):
+            try:
+                lines.append(format_text(record))
+            except Exception as e:
+                lines.append('log record formatting failed: %s' % repr(e))
+        if stream is None:
+            stream = sys.stderr
+        stream.write('---- lance flight recorder dump: %s ----\n' % (reason or 'on demand'))
+        stream.write(''.join(x + '\n' for x in lines))
+        stream.write('---- end of flight recorder dump ----\n')
+        stream.flush()
+
+    def dump_on_exception(self, exception: BaseException, where: str = ''):
+        """
+        record exception and dump, unless another dump happened not long ago
+        """
+        self.record((time.time(), 'flight recorder', 5, lambda: 'exception in %s\n%s' % (where, ''.join(traceback.format_exception(type(exception), exception, exception.__traceback__))), ()))
+        with self.__dump_lock:
+            now = time.time()
+            if self.__last_dump_time is not None and now - self.__last_dump_time < self.__min_dump_interval:
+                return
+            self.__last_dump_time = now
+        reason = 'exception %s in %s' % (repr(exception), where)
+        if self.__dump_dir is None:
+            self.dump(reason=reason)
+            return
+        os.makedirs(self.__dump_dir, exist_ok=True)
+        with open(os.path.join(self.__dump_dir, 'lance-flight-%s-%d.log' % (time.strftime('%Y%m%d-%H%M%S'), threading.get_ident())), 'w') as f:
+            self.dump(f, reason=reason)
+
+
+_sink = StdoutSink()
+_flightrecorder = None  # type: Optional[FlightRecorder]
+
+
+def set_sink(sink):
+    """
+    replace sink for all loggers
+    :return: previous sink
+    """
+    global _sink
+    oldsink = _sink
+    _sink = sink
+    return oldsink
+
+
+def get_sink():
+    return _sink
+
+
+def enable_flight_recorder(capacity: int = 4096, dump_dir: Optional[str] = None, min_dump_interval: float = 10) -> FlightRecorder:
+    global _flightrecorder
+    _flightrecorder = FlightRecorder(capacity, dump_dir, min_dump_interval)
+    return _flightrecorder
+
+
+def disable_flight_recorder():
+    global _flightrecorder
+    _flightrecorder = None
+
+
+def get_flight_recorder() -> Optional[FlightRecorder]:
+    return _flightrecorder
+
+
+def record_event(event):
+    """
+    put lance event into flight recorder, if it is enabled
+    """
+    if _flightrecorder is not None:
+        _flightrecorder.record((time.time(), 'lance event', 0, '%r', (event,)))
+
+
+def set_log_level(name_pattern: str, level: int):
+    """
+    set min log level for all loggers with names matching given fnmatch pattern, like '* SyncthingHandler'
+    applies both to existing and future loggers, later calls take precedence
+    """
+    _levelrules.append((name_pattern, level))
+    for name, printer in _loggercache.items():
+        if fnmatch.fnmatchcase(name, name_pattern):
+            printer.min_log_level = level
+
+
+class Logger:
+    """
+    called as logger(level, *args) - prints all args if level is high enough
+    use logger.fmt(level, msg, *args) for messages expensive to build:
+    msg is %-formatted with args, or called if it's a callable, but only if level is high enough
+    use logger.enabled(level) to skip building log data altogether
+    if flight recorder is enabled - records of all levels go there too, enabled() only reflects the output level
+    """
+    def __init__(self, name):
+        self.name = name
+        self.min_log_level = 1
+        for pattern, level in _levelrules:
+            if fnmatch.fnmatchcase(name, pattern):
+                self.min_log_level = level
+
+    def enabled(self, level) -> bool:
+        return level >= self.min_log_level
+
+    def __call__(self, level, *args):
+        if _flightrecorder is not None:
+            record = (time.time(), self.name, level, None, args)
+            _flightrecorder.record(record)
+            if level >= self.min_log_level:
+                _sink.emit(record)
+        elif level >= self.min_log_level:
+            _sink.emit((time.time(), self.name, level, None, args))
+
+    def fmt(self, level, msg, *args):
+        if _flightrecorder is not None:
+            record = (time.time(), self.name, level, msg, args)
+            _flightrecorder.record(record)
+            if level >= self.min_log_level:
+                _sink.emit(record)
+        elif level >= self.min_log_level:
+            _sink.emit((time.time(), self.name, level, msg, args))
+
 
 def get_logger(name):
     global _loggercache
     if name in _loggercache:
         return _loggercache[name]
 
-    def printer(level, *args):
-        if level >= printer.min_log_level:
-            etime = time.time()
-            timestamp = '%s-%d: ' % (time.strftime("%H-%M-%S", time.localtime(etime)), (etime % 1) * 1e6)
-            print("%s: %s :: %s" % (timestamp, name.upper(), ', '.join(map(repr, args))))
-
-    printer.min_log_level = 1
+    printer = Logger(name)
     _loggercache[name] = printer
     return printer
@@ -0,0 +1,211 @@
+import bisect
+import threading
+import http.server
+
+from typing import Optional, Dict, Tuple, Iterable
+
+
+DEFAULT_LATENCY_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Counter:
+    def __init__(self):
+        self.__value = 0
+        self.__lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.__lock:
+            self.__value += amount
+
+    def value(self):
+        return self.__value
+
+    def _snapshot(self):
+        return {'value': self.__value}
+
+
+class Gauge:
+    def __init__(self):
+        self.__value = 0
+        self.__lock = threading.Lock()
+
+    def set(self, value):
+        self.__value = value
+
+    def inc(self, amount=1):
+        with self.__lock:
+            self.__value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def value(self):
+        return self.__value
+
+    def _snapshot(self):
+        return {'value': self.__value}
+
+
+class Histogram:
+    """
+    bucket i counts values in (buckets[i-1], buckets[i]], last one is +Inf
+    counts are made cumulative only in exposition text
+    """
+    def __init__(self, buckets: Iterable[float] = DEFAULT_LATENCY_BUCKETS):
+        self.__buckets = tuple(sorted(buckets))
+        self.__counts = [0] * (len(self.__buckets) + 1)
+        self.__sum = 0.0
+        self.__count = 0
+        self.__lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.__buckets, value)
+        with self.__lock:
+            self.__counts[i] += 1
+            self.__sum += value
+            self.__count += 1
+
+    def count(self):
+        return self.__count
+
+    def sum(self):
+        return self.__sum
+
+    def _snapshot(self):
+        with self.__lock:
+            return {'buckets': self.__buckets + (float('inf'),),
+                    'counts': tuple(self.__counts),
+                    'sum': self.__sum,
+                    'count': self.__count}
+
+
+class MetricsRegistry:
+    """
+    keeps named metrics, each name may have many label sets
+    metric getters create metric on first use, so instrumented code does not need any registration step
+    """
+    def __init__(self):
+        self.__metrics = {}  # type: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], object]
+        self.__types = {}  # type: Dict[str, type]
+        self.__lock = threading.Lock()
+
+    def __get(self, metrictype, name, labels, *args):
+        key = (name, tuple(sorted(labels.items())) if labels else ())
+        metric = self.__metrics.get(key, None)
+        if metric is not None:
+            return metric
+        with self.__lock:
+            if self.__types.setdefault(name, metrictype) is not metrictype:
+                raise ValueError('metric %s already registered as %s' % (name, self.__types[name].__name__))
+            if key not in self.__metrics:
+                self.__metrics[key] = metrictype(*args)
+            return self.__metrics[key]
+
+    def counter(self, name: str, labels: Optional[Dict[str, str]] = None) -> Counter:
+        return self.__get(Counter, name, labels)
+
+    def gauge(self, name: str, labels: Optional[Dict[str, str]] = None) -> Gauge:
+        return self.__get(Gauge, name, labels)
+
+    def histogram(self, name: str, labels: Optional[Dict[str, str]] = None, buckets: Iterable[float] = DEFAULT_LATENCY_BUCKETS) -> Histogram:
+        return self.__get(Histogram, name, labels, buckets)
+
+    def snapshot(self) -> Dict[str, list]:
+        """
+        :return: {metric name: [{'type': type name, 'labels': {...}, ...metric values}]}
+        """
+        with self.__lock:
+            items = list(self.__metrics.items())
+        snap = {}
+        for (name, labels), metric in sorted(items, key=lambda x: x[0]):
+            entry = {'type': type(metric).__name__.lower(), 'labels': dict(labels)}
+            entry.update(metric._snapshot())
+            snap.setdefault(name, []).append(entry)
+        return snap
+
+    def exposition_text(self) -> str:
+        """
+        text exposition format, the one prometheus scrapes
+        """
+        def _labelstr(labels, extra=None):
+            pairs = list(labels.items())
+            if extra is not None:
+                pairs.append(extra)
+            if len(pairs) == 0:
+                return ''
+            return '{%s}' % ','.join('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for k, v in pairs)
+
+        lines = []
+        for name, entries in self.snapshot().items():
+            lines.append('# TYPE %s %s' % (name, entries[0]['type']))
+            for entry in entries:
+                labels = entry['labels']
+                if entry['type'] != 'histogram':
+                    lines.append('%s%s %s' % (name, _labelstr(labels), entry['value']))
+                    continue
+                cumulative = 0
+                for bucket, count in zip(entry['buckets'], entry['counts']):
+                    cumulative += count
+                    lines.append('%s_bucket%s %d' % (name, _labelstr(labels, ('le', '+Inf' if bucket == float('inf') else repr(bucket))), cumulative))
+                lines.append('%s_sum%s %s' % (name, _labelstr(labels), repr(entry['sum'])))
+                lines.append('%s_count%s %d' % (name, _labelstr(labels), entry['count']))
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+def counter(name: str, labels: Optional[Dict[str, str]] = None) -> Counter:
+    return registry.counter(name, labels)
+
+
+def gauge(name: str, labels: Optional[Dict[str, str]] = None) -> Gauge:
+    return registry.gauge(name, labels)
+
+
+def histogram(name: str, labels: Optional[Dict[str, str]] = None, buckets: Iterable[float] = DEFAULT_LATENCY_BUCKETS) -> Histogram:
+    return registry.histogram(name, labels, buckets)
+
+
+def snapshot() -> Dict[str, list]:
+    return registry.snapshot()
+
+
+class MetricsHttpServer:
+    """
+    serves registry's text exposition on http://addr:port/metrics from a daemon thread
+    binds to localhost by default - it's meant for a local scraper, not for the world
+    """
+    def __init__(self, port: int, addr: str = '127.0.0.1', metrics_registry: Optional[MetricsRegistry] = None):
+        metrics_registry = metrics_registry if metrics_registry is not None else registry
+
+        class _Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?', 1)[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                data = metrics_registry.exposition_text().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):  # no stderr spam on every scrape
+                pass
+
+        self.__httpd = http.server.ThreadingHTTPServer((addr, port), _Handler)
+        self.__thread = threading.Thread(target=self.__httpd.serve_forever, name='lance metrics http', daemon=True)
+        self.__thread.start()
+
+    def port(self) -> int:
+        return self.__httpd.server_address[1]
+
+    def stop(self):
+        self.__httpd.shutdown()
+        self.__httpd.server_close()
+        self.__thread.join()
+
+
+def start_http_server(port: int, addr: str = '127.0.0.1') -> MetricsHttpServer:
+    return MetricsHttpServer(port, addr)
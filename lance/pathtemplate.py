@@ -0,0 +1,103 @@
+import os
+import re
+import functools
+
+from typing import Optional, Dict, Tuple, Union, Mapping
+
+
+class PathTemplateError(RuntimeError):
+    pass
+
+
+class UnresolvedPlaceholderError(PathTemplateError):
+    pass
+
+
+class CyclicPlaceholderError(PathTemplateError):
+    pass
+
+
+class PathTemplate:
+    """
+    folder path with __LANCECONF_name__, __LANCEENV_name__ and __LANCELOC_name__ placeholders
+    path is parsed once into literal and placeholder segments, rendering is a single join
+    CONF - server config entries (like data_root), ENV - environment variables, LOC - values local to the current folder (like folder_label)
+    CONF and ENV values may contain placeholders themselves, those are expanded too,
+    LOC values are substituted as is, cuz they come from folder data, not from configuration
+    """
+    __placeholder_regex = re.compile(r'__LANCE(CONF|ENV|LOC)_(\w+)__')
+
+    def __init__(self, path: str):
+        self.__path = path
+        segments = []
+        pos = 0
+        for match in PathTemplate.__placeholder_regex.finditer(path):
+            if match.start() > pos:
+                segments.append(path[pos:match.start()])
+            segments.append((match.group(1), match.group(2)))
+            pos = match.end()
+        if pos < len(path):
+            segments.append(path[pos:])
+        self.__segments = tuple(segments)  # type: Tuple[Union[str, Tuple[str, str]], ...]
+
+    def path(self) -> str:
+        return self.__path
+
+    def is_static(self) -> bool:
+        return all(isinstance(x, str) for x in self.__segments)
+
+    def placeholders(self) -> Tuple[Tuple[str, str], ...]:
+        """
+        :return: tuple of (kind, name) pairs, kind is one of CONF, ENV, LOC
+        """
+        return tuple(x for x in self.__segments if not isinstance(x, str))
+
+    def render(self, conf: Optional[Mapping[str, str]] = None, locs: Optional[Mapping[str, str]] = None, strict: bool = False) -> str:
+        """
+        :param conf: values for __LANCECONF_*__
+        :param locs: values for __LANCELOC_*__
+        :param strict: if True - raise UnresolvedPlaceholderError on unknown placeholder, otherwise leave it as is
+        :return: rendered path
+        """
+        sources = {'CONF': conf if conf is not None else {},
+                   'ENV': os.environ,
+                   'LOC': locs if locs is not None else {}}
+        return self._render(sources, strict, ())
+
+    def _render(self, sources: Dict[str, Mapping[str, str]], strict: bool, stack: Tuple[Tuple[str, str], ...]) -> str:
+        if self.is_static():
+            return self.__path
+        parts = []
+        for segment in self.__segments:
+            if isinstance(segment, str):
+                parts.append(segment)
+                continue
+            kind, name = segment
+            value = sources[kind].get(name, None)
+            if value is None:
+                if strict:
+                    raise UnresolvedPlaceholderError('cannot resolve __LANCE%s_%s__ in %s' % (kind, name, self.__path))
+                parts.append('__LANCE%s_%s__' % segment)
+                continue
+            if kind == 'LOC':
+                parts.append(value)
+                continue
+            if segment in stack:
+                raise CyclicPlaceholderError('placeholder cycle: %s' % ' -> '.join('__LANCE%s_%s__' % x for x in stack + (segment,)))
+            parts.append(compile_template(value)._render(sources, strict, stack + (segment,)))
+        return ''.join(parts)
+
+    def __repr__(self):
+        return '<PathTemplate: %s>' % self.__path
+
+
+@functools.lru_cache(maxsize=4096)
+def compile_template(path: str) -> PathTemplate:
+    """
+    get compiled template for the path, cached per path
+    """
+    return PathTemplate(path)
+
+
+def render_path(path: str, conf: Optional[Mapping[str, str]] = None, locs: Optional[Mapping[str, str]] = None, strict: bool = False) -> str:
+    return compile_template(path).render(conf, locs, strict)
@@ -0,0 +1,143 @@
+import io
+import time
+import pstats
+import reprlib
+import cProfile
+import threading
+import collections
+
+from .logger import get_logger
+
+from typing import Optional, Callable, Dict, List
+
+
+_argrepr = reprlib.Repr()
+_argrepr.maxstring = 48
+_argrepr.maxother = 48
+_argrepr.maxlist = 4
+_argrepr.maxtuple = 4
+_argrepr.maxset = 4
+_argrepr.maxdict = 4
+_argrepr.maxlevel = 2
+
+# there can be only one active cProfile since python 3.12 (it's built on sys.monitoring), and calls are profiled in many threads at once
+_cprofile_lock = threading.Lock()
+
+
+def summarize_args(args, kwargs) -> str:
+    """
+    short repr of call arguments, long containers and strings are cut, so it is safe to log any call
+    """
+    parts = [_argrepr.repr(x) for x in args]
+    parts.extend('%s=%s' % (k, _argrepr.repr(v)) for k, v in kwargs.items())
+    return ', '.join(parts)
+
+
+class SlowCall:
+    def __init__(self, component: str, method: str, argstext: str, wait_time: float, run_time: float, failed: bool, profile_text: Optional[str] = None):
+        self.time = time.time()
+        self.component = component
+        self.method = method
+        self.argstext = argstext
+        self.wait_time = wait_time
+        self.run_time = run_time
+        self.failed = failed
+        self.profile_text = profile_text
+
+    def __repr__(self):
+        return '<SlowCall: %s.%s(%s) waited %.3fs, ran %.3fs%s>' % (self.component, self.method, self.argstext, self.wait_time, self.run_time, ', failed' if self.failed else '')
+
+
+class AsyncMethodProfiler:
+    """
+    times async methods invoked by StoppableThread's queue processing, queue wait and run time separately
+    calls running longer than slow_threshold (or waiting longer than slow_wait_threshold) are reported
+    with use_cprofile every call runs under cProfile, but stats are only formatted for slow calls,
+    still it's an overhead, so do not keep it on in production for long
+    only one call in the process is profiled at a time, calls made while another one is profiled, or while some other
+    profiling tool is active, are just timed. on python 3.12+ profile of a call may include other threads
+    """
+    def __init__(self, slow_threshold: float = 0.5, slow_wait_threshold: Optional[float] = None, use_cprofile: bool = False, cprofile_lines: int = 20,
+                 keep_slow_calls: int = 256, report: Optional[Callable[[SlowCall], None]] = None):
+        """
+        :param slow_threshold: run time in seconds to consider call slow
+        :param slow_wait_threshold: queue wait time in seconds to consider call slow, None to not report on wait
+        :param use_cprofile: collect cProfile stats of slow calls
+        :param cprofile_lines: number of top cumulative entries in reported stats
+        :param keep_slow_calls: how many last slow calls to keep for slow_calls()
+        :param report: callable that gets SlowCall, by default slow calls are logged
+        """
+        self.__slow_threshold = slow_threshold
+        self.__slow_wait_threshold = slow_wait_threshold
+        self.__use_cprofile = use_cprofile
+        self.__cprofile_lines = cprofile_lines
+        self.__report = report if report is not None else self.__log_slow_call
+        self.__slow_calls = collections.deque(maxlen=keep_slow_calls)
+        self.__stats = {}  # type: Dict[tuple, list]  # (component, method) -> [count, wait total, run total, run max]
+        self.__lock = threading.Lock()
+        self.__log = get_logger(self.__class__.__name__)
+
+    def invoke(self, component: str, func, obj, args, kwargs, wait_time: float):
+        """
+        call func(obj, *args, **kwargs), measuring it
+        :param component: name to report call under
+        :param wait_time: how long call has been waiting in queue
+        """
+        profile = None
+        if self.__use_cprofile and _cprofile_lock.acquire(blocking=False):
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:  # another profiling tool is already active
+                profile = None
+                _cprofile_lock.release()
+        failed = True
+        starttime = time.time()
+        try:
+            result = func(obj, *args, **kwargs)
+            failed = False
+            return result
+        finally:
+            run_time = time.time() - starttime
+            if profile is not None:
+                profile.disable()
+                _cprofile_lock.release()
+            key = (component, func.__name__)
+            with self.__lock:
+                stat = self.__stats.setdefault(key, [0, 0.0, 0.0, 0.0])
+                stat[0] += 1
+                stat[1] += wait_time
+                stat[2] += run_time
+                stat[3] = max(stat[3], run_time)
+            if run_time >= self.__slow_threshold or self.__slow_wait_threshold is not None and wait_time >= self.__slow_wait_threshold:
+                profile_text = None
+                if profile is not None:
+                    stream = io.StringIO()
+                    pstats.Stats(profile, stream=stream).sort_stats('cumulative').print_stats(self.__cprofile_lines)
+                    profile_text = stream.getvalue()
+                slowcall = SlowCall(component, func.__name__, summarize_args(args, kwargs), wait_time, run_time, failed, profile_text)
+                self.__slow_calls.append(slowcall)
+                try:
+                    self.__report(slowcall)
+                except Exception as e:
+                    self.__log(4, 'slow call report failed: %s' % repr(e))
+
+    def __log_slow_call(self, slowcall: SlowCall):
+        self.__log.fmt(3, '%r', slowcall)
+        if slowcall.profile_text is not None:
+            self.__log.fmt(3, 'profile of %s.%s:\n%s', slowcall.component, slowcall.method, slowcall.profile_text)
+
+    def slow_calls(self) -> List[SlowCall]:
+        return list(self.__slow_calls)
+
+    def stats(self) -> Dict[str, dict]:
+        """
+        :return: {'component.method': {'count', 'wait_total', 'run_total', 'run_max'}}
+        """
+        with self.__lock:
+            return {'%s.%s' % key: {'count': stat[0], 'wait_total': stat[1], 'run_total': stat[2], 'run_max': stat[3]} for key, stat in self.__stats.items()}
+
+    def reset(self):
+        with self.__lock:
+            self.__stats = {}
+        self.__slow_calls.clear()
@@ -1,9 +1,5 @@
 import os
-
-try:
-    import simplejson as json
-except ImportError:
-    import json
+import sys
 
 import string
 import random
@@ -11,8 +7,9 @@ import copy
 import time
 
 from .servercomponent import ServerComponent
-from .lance_utils import async_method
+from .lance_utils import async_method, atomic_write
 from .logger import get_logger
+from . import jsoncodec
 
 from . import syncthinghandler
 from . import eventprocessor
@@ -28,6 +25,8 @@ log = get_logger('ProjectManager')
 
 
 class ShotPart:
+    __slots__ = ('__usersids', '__usersids_tuple', '__project', '__shot', '__stfolder', '__fid', '__id')
+
     def __init__(self, stfolder: syncthinghandler.Folder):
         self.__usersids = set()
         self.__usersids_tuple = None
@@ -100,8 +99,10 @@ class ShotPart:
 
 
 class User:
+    __slots__ = ('__id', '__readableName', '__deviceids', '__deviceids_tuple', '__access_shotids', '__access_shotids_tuple')
+
     def __init__(self, mdata):
-        self.__id = mdata['id']
+        self.__id = sys.intern(mdata['id'])
         self.__readableName = mdata['name']
         self.__deviceids = set(mdata['deviceids'])  # type: Set[str]
         self.__deviceids_tuple = None
@@ -153,15 +154,7 @@ class ProjectManager(ServerComponent, eventprocessor.BaseEventProcessorInterface
     @classmethod
     def get_project_names(cls, server) -> Set[str]:
         sth = server.syncthingHandler  # type: syncthinghandler.SyncthingHandler
-        folders = sth.get_folders().result()
-        projectnames = set()
-        for fid, folder in folders.items():
-            fmeta = folder.metadata()
-            if '__ProjectManager_data__' not in fmeta:
-                continue
-            pm_metadata = fmeta['__ProjectManager_data__']
-            projectnames.add(pm_metadata['project'])
-        return projectnames
+        return sth.get_project_names().result()  # syncthing handler keeps project index, no need to scan all folders
 
     def __init__(self, server, project: str):  #, config_sync_status=False):
         super(ProjectManager, self).__init__(server)
@@ -173,6 +166,7 @@ class ProjectManager(ServerComponent, eventprocessor.BaseEventProcessorInterface
         self.__users = {}  # type: Dict[str, User]
         #self.__configInSync = config_sync_status
         self.__log = get_logger('%s %s' % (self.__sthandler.myId()[:5], self.__class__.__name__))
+        self._metricsName = self.__log.name
         self._server.eventQueueEater.add_event_processor(self)
 
     def run(self):
@@ -183,7 +177,7 @@ class ProjectManager(ServerComponent, eventprocessor.BaseEventProcessorInterface
     # Event processor methods
     @async_method(raise_while_invoking=True, queue_only=True)
     def add_event(self, event):
-        self.__log(1, 'PManager: event received: %s' % (repr(event),))
+        self.__log.fmt(1, 'PManager: event received: %r', event)
         # if not self.__configInSync:
         #     if isinstance(event, syncthinghandler.ConfigSyncChangedEvent):
         #         self.__log(1, 'new config sync status = %s' % repr(event.in_sync()))
@@ -403,7 +397,7 @@ class ProjectManager(ServerComponent, eventprocessor.BaseEventProcessorInterface
                     configpath = self.__projectSettingsFolder.path()
                     try:
                         with open(os.path.join(configpath, 'config.cfg'), 'r') as f:
-                            config = json.load(f)
+                            config = jsoncodec.load(f)
                     except:
                         self.__log(3, 'config loading error - might be not in sync, might be corrupted')
                         #self.__configInSync = False
@@ -432,9 +426,10 @@ class ProjectManager(ServerComponent, eventprocessor.BaseEventProcessorInterface
 
             configchanged = self.__shots != oldshots or self.__users != oldusers or oldprojectconfigfolder != self.__projectSettingsFolder
 
-            self.__log(1, 'shots: %s' % ", ".join(self.__shots.keys()))
-            self.__log(1, '\n'.join(('%s:\n%s' % (shk, '\n\t'.join((x for x in self.__shots[shk]))) for shk in self.__shots)))
-            self.__log(1, 'users: %s' % ", ".join(self.__users.keys()))
+            # rendered right away, shots and users change later
+            self.__log.fmt(1, 'shots: %s', ", ".join(self.__shots.keys()))
+            self.__log.fmt(1, '%s', '\n'.join(('%s:\n%s' % (shk, '\n\t'.join((x for x in self.__shots[shk]))) for shk in self.__shots)))
+            self.__log.fmt(1, 'users: %s', ", ".join(self.__users.keys()))
 
             folderidToDevidset = {}  # type: Dict[str, Set[str]]
             for shotid, shotpartdict in self.__shots.items():
@@ -553,7 +548,7 @@ class ProjectManager(ServerComponent, eventprocessor.BaseEventProcessorInterface
             raise RuntimeError('only server can add users')
         configpath = self.__projectSettingsFolder.path()
         with open(os.path.join(configpath, 'config.cfg'), 'r') as f:
-            config = json.load(f)
+            config = jsoncodec.load(f)
 
         if userid in config.get('users', {}):
             self.__log(2, 'add_user: userid already exists')
@@ -572,8 +567,8 @@ class ProjectManager(ServerComponent, eventprocessor.BaseEventProcessorInterface
                                    'deviceids': dev_list,
                                    'access': shotid_partname_pair_list}
 
-        with open(os.path.join(configpath, 'config.cfg'), 'w') as f:
-            json.dump(config, f)
+        with atomic_write(os.path.join(configpath, 'config.cfg'), fsync=self.__sthandler.config_fsync) as f:
+            jsoncodec.dump(config, f, compact=True)
         # after this syncthing will not emit foldersync event, cuz changes are local
         self.__rescanConfiguration(rescan_project_settings=True)
 
@@ -583,7 +578,7 @@ class ProjectManager(ServerComponent, eventprocessor.BaseEventProcessorInterface
             raise RuntimeError('only server can add users')
         configpath = self.__projectSettingsFolder.path()
         with open(os.path.join(configpath, 'config.cfg'), 'r') as f:
-            config = json.load(f)
+            config = jsoncodec.load(f)
 
         if userid not in config.get('users', {}):
             self.__log(2, 'add_user: userid does not exists')
@@ -591,8 +586,8 @@ class ProjectManager(ServerComponent, eventprocessor.BaseEventProcessorInterface
 
         del config['users'][userid]
 
-        with open(os.path.join(configpath, 'config.cfg'), 'w') as f:
-            json.dump(config, f)
+        with atomic_write(os.path.join(configpath, 'config.cfg'), fsync=self.__sthandler.config_fsync) as f:
+            jsoncodec.dump(config, f, compact=True)
         # after this syncthing will not emit foldersync event, cuz changes are local
         self.__rescanConfiguration(rescan_project_settings=True)
 
@@ -609,12 +604,12 @@ class ProjectManager(ServerComponent, eventprocessor.BaseEventProcessorInterface
 
         configpath = self.__projectSettingsFolder.path()
         with open(os.path.join(configpath, 'config.cfg'), 'r') as f:
-            config = json.load(f)
+            config = jsoncodec.load(f)
 
         config['users'][uiserid]['deviceids'] = list(self.__users[uiserid].device_ids())
 
-        with open(os.path.join(configpath, 'config.cfg'), 'w') as f:
-            json.dump(config, f)
+        with atomic_write(os.path.join(configpath, 'config.cfg'), fsync=self.__sthandler.config_fsync) as f:
+            jsoncodec.dump(config, f, compact=True)
         # after this syncthing will not emit foldersync event, cuz changes are local
         self.__rescanConfiguration(rescan_project_settings=True)
 
@@ -631,11 +626,11 @@ class ProjectManager(ServerComponent, eventprocessor.BaseEventProcessorInterface
 
         configpath = self.__projectSettingsFolder.path()
         with open(os.path.join(configpath, 'config.cfg'), 'r') as f:
-            config = json.load(f)
+            config = jsoncodec.load(f)
 
         config['users'][uiserid]['deviceids'] = list(self.__users[uiserid].device_ids())
 
-        with open(os.path.join(configpath, 'config.cfg'), 'w') as f:
-            json.dump(config, f)
+        with atomic_write(os.path.join(configpath, 'config.cfg'), fsync=self.__sthandler.config_fsync) as f:
+            jsoncodec.dump(config, f, compact=True)
         # after this syncthing will not emit foldersync event, cuz changes are local
         self.__rescanConfiguration(rescan_project_settings=True)
@@ -0,0 +1,194 @@
+import os
+import sys
+import json
+import gzip
+import time
+import argparse
+import threading
+
+from .fakesyncthing import FakeSyncthing
+
+from typing import Optional, Dict, List, Tuple
+
+RECORDING_VERSION = 1
+
+
+class RestRecorder:
+    """
+    writes REST requests syncthing handler makes and responses it gets into a gzipped json lines file
+    first line is a header with handler's identity and configuration, so recording can be replayed without the original server
+    every next line is {'t': seconds since start, 'm': method, 'p': path, 'q': query, 'r': response}, post data is not recorded
+    """
+    def __init__(self, path: str, header: dict):
+        self.__path = path
+        self.__file = gzip.open(path, 'wt', encoding='utf-8')
+        self.__starttime = time.time()
+        self.__lock = threading.Lock()
+        self.__count = 0
+        header = dict(header)
+        header.update({'type': 'header', 'version': RECORDING_VERSION, 'time': self.__starttime})
+        self.__file.write(json.dumps(header, separators=(',', ':')) + '\n')
+
+    def path(self) -> str:
+        return self.__path
+
+    def record(self, method: str, path: str, query: dict, response=None):
+        line = json.dumps({'t': round(time.time() - self.__starttime, 6), 'm': method, 'p': path, 'q': query, 'r': response}, separators=(',', ':'))
+        with self.__lock:
+            if self.__file is None:
+                return
+            self.__file.write(line + '\n')
+            self.__count += 1
+
+    def count(self) -> int:
+        return self.__count
+
+    def close(self):
+        with self.__lock:
+            if self.__file is not None:
+                self.__file.close()
+                self.__file = None
+
+
+def load_recording(path: str) -> Tuple[dict, List[dict]]:
+    """
+    :return: (header, list of records)
+    """
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        header = json.loads(f.readline())
+        if header.get('type') != 'header':
+            raise ValueError('%s is not a rest recording' % path)
+        if header.get('version', 0) > RECORDING_VERSION:
+            raise ValueError('recording version %d is not supported' % header['version'])
+        records = [json.loads(line) for line in f if line.strip()]
+    return header, records
+
+
+def _query_key(path: str, query: dict) -> Tuple[str, str]:
+    return path, json.dumps({k: str(v) for k, v in query.items() if k not in ('since', 'timeout')}, sort_keys=True)
+
+
+class ReplaySyncthing(FakeSyncthing):
+    """
+    fake syncthing serving a recorded event stream as fast as handler asks for it
+    other recorded GET responses are served in recorded order per path and query, last one is repeated when they run out
+    anything not recorded is served by FakeSyncthing
+    """
+    def __init__(self, header: dict, records: List[dict]):
+        super(ReplaySyncthing, self).__init__(device_id=header['myid'])
+        self.__batches = []  # type: List[List[dict]]
+        self.__responses = {}  # type: Dict[Tuple[str, str], List]
+        for record in records:
+            if record['m'] != 'GET':
+                continue
+            if record['p'] == '/rest/events':
+                if record['r']:
+                    self.__batches.append(record['r'])
+                continue
+            self.__responses.setdefault(_query_key(record['p'], record['q']), []).append(record['r'])
+        self.__next_batch = 0
+        self.__replay_lock = threading.Lock()
+        self.__finished = threading.Event()
+        self.__served_events = 0
+        if len(self.__batches) == 0:
+            self.__finished.set()
+
+    def total_events(self) -> int:
+        return sum(len(x) for x in self.__batches)
+
+    def served_events(self) -> int:
+        return self.__served_events
+
+    def wait_finished(self, timeout: Optional[float] = None) -> bool:
+        """
+        wait till all recorded events were given to the handler
+        """
+        return self.__finished.wait(timeout)
+
+    def _handle(self, method: str, path: str, query: dict, body: Optional[bytes]):
+        if method == 'GET' and path == '/rest/events':
+            # batches are served in recorded order whatever since is, cuz syncthing restarts reset event ids
+            with self.__replay_lock:
+                if self.__next_batch < len(self.__batches):
+                    batch = self.__batches[self.__next_batch]
+                    self.__next_batch += 1
+                    self.__served_events += len(batch)
+                    return 200, batch
+            self.__finished.set()
+            return super(ReplaySyncthing, self)._handle(method, path, query, body)
+        if method == 'GET':
+            with self.__replay_lock:
+                responses = self.__responses.get(_query_key(path, query), None)
+                if responses:
+                    response = responses.pop(0) if len(responses) > 1 else responses[0]
+                    return 200, response
+        return super(ReplaySyncthing, self)._handle(method, path, query, body)
+
+
+def prepare_replay_root(header: dict, config_root: str, data_root: str):
+    """
+    recreate syncthing handler's configuration from recording header, so that a server can be started on it
+    folders get default local paths under data_root
+    """
+    os.makedirs(config_root, exist_ok=True)
+    FakeSyncthing(device_id=header['myid']).generate(config_root)
+    bootstrap = {'apikey': header['apikey'],
+                 'server_secret': header['server_secret'],
+                 'servers': header['servers'],
+                 'devices': {did: {'id': did, 'name': name} for did, name in header['devices'].items()},
+                 'folders': {},
+                 'ignoreDevices': header['ignoredevices']}
+    with open(os.path.join(config_root, 'syncthinghandler_config.json'), 'w') as f:
+        json.dump(bootstrap, f, indent=4)
+    if header['myid'] in header['servers']:
+        configpath = os.path.join(data_root, 'server', 'configuration')
+    else:
+        configpath = os.path.join(data_root, 'control', header['myid'], 'configuration')
+    os.makedirs(configpath, exist_ok=True)
+    with open(os.path.join(configpath, 'config.cfg'), 'w') as f:
+        json.dump(header['config'], f, indent=4)
+
+
+def replay(recording_path: str, root: str, timeout: float = 3600) -> dict:
+    """
+    replay recording into a fresh server at root: syncthing handler and event queue eater with everything subscribed
+    :return: {'events': events replayed, 'seconds': time till all events are processed, 'events_per_second': ...}
+    """
+    from .server import Server  # server imports syncthing handler, that imports us
+
+    header, records = load_recording(recording_path)
+    config_root = os.path.join(root, 'config')
+    data_root = os.path.join(root, 'data')
+    prepare_replay_root(header, config_root, data_root)
+    fake = ReplaySyncthing(header, records)
+    srv = Server(config_root, data_root, syncthing_launcher=fake)
+    starttime = time.time()
+    srv.start()
+    try:
+        if not fake.wait_finished(timeout):
+            raise RuntimeError('replay did not finish in %g seconds' % timeout)
+        while srv.eventQueue.unfinished_tasks > 0:
+            if time.time() - starttime > timeout:
+                raise RuntimeError('event queue was not drained in %g seconds' % timeout)
+            time.sleep(0.001)
+        elapsed = time.time() - starttime
+    finally:
+        srv.stop()
+    return {'events': fake.served_events(),
+            'seconds': elapsed,
+            'events_per_second': fake.served_events() / elapsed if elapsed > 0 else None}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='replay syncthing rest recording into a local server without syncthing')
+    parser.add_argument('recording', help='recording made with SyncthingHandler.start_rest_recording')
+    parser.add_argument('root', help='empty directory to create replay server configuration in')
+    parser.add_argument('--timeout', type=float, default=3600)
+    args = parser.parse_args(argv)
+    result = replay(args.recording, args.root, args.timeout)
+    json.dump(result, sys.stdout)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -4,8 +4,9 @@ import random
 import string
 from . import lance_utils
 from . import logger
+from . import metrics
 
-from .syncthinghandler import SyncthingHandler, ConfigSyncChangedEvent, FoldersSyncedEvent
+from .syncthinghandler import SyncthingHandler, FoldersSyncedEvent, ProjectsAddedEvent, ProjectsRemovedEvent
 from .eventqueueeater import EventQueueEater
 from .eventprocessor import BaseEventProcessor
 from .projectmanager import ProjectManager
@@ -35,7 +36,7 @@ class Server(object):
             Note that though you can dynamically change expected event types, since event processor and event supplier work in separate threads - you may miss events while changing states here
             So better enum here all the eveens types required for all the sates of your processor, unless you do not care to miss some events
             """
-            return isinstance(event, FoldersSyncedEvent) or isinstance(event, ConfigSyncChangedEvent)
+            return isinstance(event, FoldersSyncedEvent) or isinstance(event, ProjectsAddedEvent) or isinstance(event, ProjectsRemovedEvent)
 
         def _processEvent(self, event):
             """
@@ -61,11 +62,10 @@ class Server(object):
                     newpm.start()
                     newpm.rescan_configuration().set_raise_on_invoke(True)
 
-            elif isinstance(event, ConfigSyncChangedEvent):
-                # need to check if new projects appeared, and if so - create new project managers
-                self.__log(0, 'config synced event received')
-                possibleprojects = ProjectManager.get_project_names(self.__server)
-                for possibleproject in possibleprojects:
+            elif isinstance(event, ProjectsAddedEvent):
+                # syncthing handler keeps project index, so we only get here when new projects really appeared
+                self.__log(0, 'projects added event received')
+                for possibleproject in event.projects():
                     if possibleproject in self.__server.projectManagers:
                         continue
                     self.__log(1, 'new project discovered! %s' % possibleproject)
@@ -75,7 +75,25 @@ class Server(object):
                     newpm.start()
                     newpm.rescan_configuration().set_raise_on_invoke(True)
 
-    def __init__(self, config_root_path=None, data_root_path=None):
+            elif isinstance(event, ProjectsRemovedEvent):
+                self.__log(0, 'projects removed event received')
+                for project in event.projects():
+                    if project not in self.__server.projectManagers:
+                        continue
+                    self.__log(1, 'project %s is gone, stopping its project manager' % project)
+                    pm = self.__server.projectManagers.pop(project)
+                    # it only unsubscribes itself once it's thread exits, and until then it would be fed events it can't invoke anymore
+                    self.__server.eventQueueEater.remove_event_provessor(pm)
+                    pm.stop()
+
+    def __init__(self, config_root_path=None, data_root_path=None, config_backend='json', metrics_port=None, syncthing_launcher=None):
+        """
+        :param config_root_path:
+        :param data_root_path:
+        :param config_backend: 'json' or 'sqlite' - how syncthing handler keeps it's configuration locally
+        :param metrics_port: if given - serve metrics text exposition on localhost at this port while server is running
+        :param syncthing_launcher: SyncthingLauncher to use instead of running syncthing binary, like lance.fakesyncthing.FakeSyncthing
+        """
         super(Server, self).__init__()
 
         if config_root_path is None:
@@ -84,19 +102,27 @@ class Server(object):
         if data_root_path is None:
             data_root_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), r'data')
 
-        self.config = {'config_root': config_root_path, 'data_root': data_root_path}
+        if config_backend not in ('json', 'sqlite'):
+            raise ValueError('unknown config backend %s' % config_backend)
+
+        self.config = {'config_root': config_root_path, 'data_root': data_root_path, 'config_backend': config_backend}
 
         lance_utils.makedirs(self.config['data_root'])
         lance_utils.makedirs(self.config['config_root'])
 
         self.eventQueue = queue.Queue()
+        self.syncthingLauncher = syncthing_launcher
         self.syncthingHandler = SyncthingHandler(self)
         self.eventQueueEater = EventQueueEater(self)
         self._projectManagerHandler = Server.ProjectManagerHandler(self)
         self.eventQueueEater.add_event_processor(self._projectManagerHandler)
         self.projectManagers = {}  # type: Dict[str, ProjectManager]
+        self.__metrics_port = metrics_port
+        self.__metrics_server = None  # type: Optional[metrics.MetricsHttpServer]
 
     def start(self):
+        if self.__metrics_port is not None:
+            self.__metrics_server = metrics.start_http_server(self.__metrics_port)
         self.eventQueueEater.start()
         self.syncthingHandler.start()
 
@@ -106,6 +132,9 @@ class Server(object):
         for pm in self.projectManagers.values():
             pm.stop()
         self.syncthingHandler.stop()
+        if self.__metrics_server is not None:
+            self.__metrics_server.stop()
+            self.__metrics_server = None
 
     def add_project(self, projectname):
         if projectname in self.projectManagers:
@@ -116,7 +145,7 @@ class Server(object):
                                                'project': projectname}}
         fold_path = os.path.join(self.config['data_root'], 'project_%s_configuration' % safename)
         os.makedirs(fold_path, exist_ok=True)
-        with open(os.path.join(fold_path, 'config.cfg'), 'w') as f:
+        with lance_utils.atomic_write(os.path.join(fold_path, 'config.cfg'), fsync=self.syncthingHandler.config_fsync) as f:
             f.write('{}')
         return self.syncthingHandler.add_folder(fold_path, 'project %s configuration' % projectname, devList=None, metadata=prjmeta, overrideFid=fid)
 
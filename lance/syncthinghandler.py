@@ -1,17 +1,18 @@
-import sys
 import os
+import sys
 import shutil
 import errno
 import copy
-import subprocess
 import threading
 import urllib.request as requester
+import http.client
 import json
 import time
 import xml.etree.ElementTree as ET
 from xml.dom import minidom
 import string
 import random
+import re
 
 import hashlib
 
@@ -21,8 +22,16 @@ from .lance_utils import async_method, AsyncMethodBatch
 from .eventtypes import *
 from . import eventprocessor
 from .logger import get_logger
+from . import metrics
+from . import jsoncodec
+from .pathtemplate import render_path
+from .configtrace import ConfigPropagationTracer
+from .syncthinglauncher import SyncthingLauncher
+from .syncthingsupervisor import SyncthingSupervisor
+from .restrecording import RestRecorder
+from .databasehandler import SyncthingConfigStore
 
-from typing import Union, Optional, Iterable, Set, Dict
+from typing import Union, Optional, Iterable, Set, Dict, List
 
 
 def listdir(path):
@@ -42,8 +51,23 @@ def remove(path):
         if e.errno != errno.ENOENT:
             raise
 
-def syncthing_timestamp_to_datetime(timestamp: str) -> datetime.datetime:
-    return datetime.datetime.strptime(re.sub('\d{3}(?=[\+-]\d{2}:\d{2}$)', '', timestamp), '%Y-%m-%dT%H:%M:%S.%f%z')
+syncthing_timestamp_to_datetime = lance_utils.syncthing_timestamp_to_datetime
+
+
+def _interned_copy(data):
+    """
+    deep copy of json-like data with all strings interned,
+    so thousands of folders with similar metadata keep one copy of every key and common value
+    """
+    if isinstance(data, str):
+        return sys.intern(data)
+    if isinstance(data, dict):
+        return {sys.intern(k) if isinstance(k, str) else k: _interned_copy(v) for k, v in data.items()}
+    if isinstance(data, list):
+        return [_interned_copy(x) for x in data]
+    if isinstance(data, tuple):
+        return tuple(_interned_copy(x) for x in data)
+    return copy.deepcopy(data)
 
 #  EXCEPTIONS
 class SyncthingNotReadyError(RuntimeError):
@@ -64,15 +88,21 @@ class ConfigNotInSyncError(RuntimeError):
 #  HELPERS
 class DeviceVolatileData:
     # explicitly state names of methods, not use __getattr__, to help ourselves later with static code analisys
+    __slots__ = ('__data',)
+    __defaults = {'addr': '',
+                  'paused': False,
+                  'connected': False,
+                  'clientName': '',
+                  'clientVersion': ''}
+
     def __init__(self):
-        self.__data = {'addr': '',
-                       'paused': False,
-                       'connected': False,
-                       'clientName': '',
-                       'clientVersion': ''}
+        self.__data = DeviceVolatileData.__defaults  # shared till first update
 
     def _update_data(self, data):
-        self.__data.update(data)
+        # data dict is never modified in place, but replaced, so copies can share it
+        newdata = dict(self.__data)
+        newdata.update(data)
+        self.__data = newdata
 
     def address(self):
         return self.__data.get('addr', '')
@@ -98,22 +128,33 @@ class DeviceVolatileData:
     def __len__(self):
         return len(self.__data)
 
+    def __deepcopy__(self, memodict=None):
+        newone = type(self).__new__(type(self))
+        newone.__data = self.__data  # it's never modified in place
+        return newone
+
 
 class FolderVolatileData:
     # explicitly state names of methods, not use __getattr__, to help ourselves later with static code analisys
+    __slots__ = ('__data',)
+    __defaults = {'globalBytes': 0,
+                  'inSyncBytes': 0,
+                  'connected': False,
+                  'needBytes': 0,
+                  'needFiles': 0,
+                  'needTotalItems': 0,
+                  'state': '',
+                  'stateChanged': '',
+                  'version': 0}
+
     def __init__(self):
-        self.__data = {'globalBytes': 0,
-                       'inSyncBytes': 0,
-                       'connected': False,
-                       'needBytes': 0,
-                       'needFiles': 0,
-                       'needTotalItems': 0,
-                       'state': '',
-                       'stateChanged': '',
-                       'version': 0}
+        self.__data = FolderVolatileData.__defaults  # shared till first update
 
     def _update_data(self, data):
-        self.__data.update(data)
+        # data dict is never modified in place, but replaced, so copies can share it
+        newdata = dict(self.__data)
+        newdata.update(data)
+        self.__data = newdata
 
     def global_bytes(self):
         return self.__data.get('globalBytes', 0)
@@ -148,10 +189,19 @@ class FolderVolatileData:
     def __len__(self):
         return len(self.__data)
 
+    def __deepcopy__(self, memodict=None):
+        newone = type(self).__new__(type(self))
+        newone.__data = self.__data  # it's never modified in place
+        return newone
+
 
 class Device:
+    __slots__ = ('__stid', '__name', '__sthandler', '__volatiledata', '__ismyself', '__added_at', '__delete_on_sync_after',
+                 '_st_event_synced', '_st_event_confighash')
+    __config_slots = ('_Device__stid', '_Device__name', '_Device__sthandler', '_Device__ismyself', '_Device__added_at', '_Device__delete_on_sync_after')  # what replace_with replaces
+
     def __init__(self, sthandler: 'SyncthingHandler', id: str, name: Optional[str] = None, creation_time: Optional[float] = None):  #TODO: probably noone outside this class uses creation_time argument. check and consider removing!
-        self.__stid = id  # type: str
+        self.__stid = sys.intern(id)  # type: str
         self.__name = name  # type: str
         self.__sthandler = sthandler
         self.__volatiledata = DeviceVolatileData()
@@ -165,11 +215,8 @@ class Device:
         self._st_event_confighash = ""  #TODO: should this be saved and shared between servers?? can lead to all sorts of shits both ways!
 
     def replace_with(self, newdevice: 'Device'):
-        newdict = copy.copy(newdevice.__dict__)
-        del newdict['_Device__volatiledata']
-        del newdict['_st_event_synced']
-        del newdict['_st_event_confighash']
-        self.__dict__.update(newdict)
+        for attr in Device.__config_slots:
+            setattr(self, attr, getattr(newdevice, attr))
 
     def volatile_data(self):
         return self.__volatiledata
@@ -236,8 +283,17 @@ class Device:
         return newone
 
     def __copy__(self):
-        newone = Device(self.__sthandler, self.__stid, self.__name, self.__added_at)
+        # same as Device(self.__sthandler, self.__stid, self.__name, self.__added_at), but without asking sthandler who we are again
+        newone = Device.__new__(Device)
+        newone.__stid = self.__stid
+        newone.__name = self.__name
+        newone.__sthandler = self.__sthandler
         newone.__volatiledata = self.__volatiledata
+        newone.__ismyself = self.__ismyself
+        newone.__added_at = self.__added_at
+        newone.__delete_on_sync_after = None
+        newone._st_event_synced = True
+        newone._st_event_confighash = ""
         return newone
 
     def configuration_hash(self):
@@ -260,6 +316,15 @@ class Device:
     def serialize_to_str(self) -> str:
         return json.dumps(self.serialize_to_dict())
 
+    def _matches_serialized(self, data: dict) -> bool:
+        """
+        would deserializing data give a device equal to this one
+        """
+        return self.__stid == data['id'] and \
+               self.__name == data['name'] and \
+               self.__added_at == data['added_at'] and \
+               self.__delete_on_sync_after == data['delete_on_sync_after']
+
     @classmethod
     def deserialize(cls, sthandler, s: Union[str, dict]):
         if isinstance(s, str):
@@ -272,36 +337,39 @@ class Device:
 
 
 class Folder:
+    __slots__ = ('__stfid', '__label', '__path', '__devices', '__sthandler', '__volatiledata', '__metadata', '__metadatajson', '_st_event_synced')
+    __config_slots = ('_Folder__stfid', '_Folder__label', '_Folder__path', '_Folder__devices', '_Folder__sthandler', '_Folder__metadata', '_Folder__metadatajson')  # what replace_with replaces
+
     def __init__(self, sthandler: 'SyncthingHandler', id: str, label: str, path: Optional[str] = None, devices: Optional[Iterable] = None, metadata=None):
-        self.__stfid = id
-        self.__label = label
+        self.__stfid = sys.intern(id)
+        self.__label = sys.intern(label) if isinstance(label, str) else label
         self.__path = path
-        self.__devices = set(devices) if devices is not None else set()
+        self.__devices = set(map(sys.intern, devices)) if devices is not None else set()
         self.__sthandler = sthandler
         self.__volatiledata = DeviceVolatileData()
         if metadata is None:
             metadata = {}
         else:
-            metadata = copy.deepcopy(metadata)
-        self.__metadata = metadata
+            metadata = _interned_copy(metadata)
+        self.__metadata = metadata  # copied once on the way in, then shared by all copies of this folder, so never modify it
+        self.__metadatajson = None  # type: Optional[str]  # cached for configuration_hash, metadata is immutable after all
         self._st_event_synced = True  # for internal use by syncthinghandler stevent processor
 
     def replace_with(self, newfolder: 'Folder'):
-        newdict = copy.copy(newfolder.__dict__)
-        del newdict['_Folder__volatiledata']
-        del newdict['_st_event_synced']
-        self.__dict__.update(newdict)
+        for attr in Folder.__config_slots:
+            setattr(self, attr, getattr(newfolder, attr))
 
     def _setMetadata(self, metadata):
         """
         supposed to be called from SyncthingHandler
         DOES NOT updates syncthinghandler itself
         """
-        self.__metadata = copy.deepcopy(metadata)
+        self.__metadata = _interned_copy(metadata)
+        self.__metadatajson = None
 
     def metadata(self):
         """
-        this is supposed to be immutable,
+        this is supposed to be immutable, it is shared between copies of the folder
         """
         return self.__metadata
 
@@ -371,16 +439,22 @@ class Folder:
                self.__metadata == other.__metadata
 
     def __deepcopy__(self, memodict=None):
-        newone = copy.copy(self)
-        newone.__metadata = copy.deepcopy(self.__metadata)
+        newone = copy.copy(self)  # devices are already in a new set, and device ids are immutable, metadata is shared
         newone.__volatiledata = copy.deepcopy(self.__volatiledata, memo=memodict)
-        newone.__devices = copy.deepcopy(self.__devices, memo=memodict)  # deepcopy of devices
         return newone
 
     def __copy__(self):
-        newone = Folder(self.__sthandler, self.__stfid, self.__label, self.__path, self.__devices)  # devices will be same but in a new set
-        newone.__metadata = copy.copy(self.__metadata)
+        # same as Folder(self.__sthandler, self.__stfid, self.__label, self.__path, self.__devices), but without copying metadata
+        newone = Folder.__new__(Folder)
+        newone.__stfid = self.__stfid
+        newone.__label = self.__label
+        newone.__path = self.__path
+        newone.__devices = set(self.__devices)  # devices will be same but in a new set
+        newone.__sthandler = self.__sthandler
         newone.__volatiledata = self.__volatiledata
+        newone.__metadata = self.__metadata
+        newone.__metadatajson = self.__metadatajson
+        newone._st_event_synced = True
         return newone
 
     def configuration_hash(self):
@@ -395,7 +469,9 @@ class Folder:
         for dev in self.__devices:
             devhash ^= hash(dev)
         ph += '::' + str(devhash)
-        ph += json.dumps(self.__metadata)
+        if self.__metadatajson is None:
+            self.__metadatajson = json.dumps(self.__metadata)  # not jsoncodec - hash must be the same on all devices whatever backend they have
+        ph += self.__metadatajson
         return hash(ph)
 
     def serialize_to_dict(self) -> dict:
@@ -408,6 +484,17 @@ class Folder:
     def serialize_to_str(self) -> str:
         return json.dumps(self.serialize_to_dict())
 
+    def _matches_serialized(self, data: dict, path: Optional[str]) -> bool:
+        """
+        would deserializing data and setting path give a folder equal to this one
+        """
+        attribs = data['attribs']
+        return self.__stfid == attribs['fid'] and \
+               self.__label == attribs['label'] and \
+               self.__path == path and \
+               len(self.__devices) == len(data['devices']) and self.__devices.issuperset(data['devices']) and \
+               self.__metadata == data['metadata']
+
     @classmethod
     def deserialize(cls, sthandler, s: Union[str, dict]):
         if isinstance(s, str):
@@ -455,6 +542,13 @@ class DevicesVolatileDataChangedEvent(DevicesConfigurationEvent):
     pass
 
 
+class DevicesConfigSyncedEvent(DevicesConfigurationEvent):
+    """
+    devices acknowledged they have applied current configuration server saved for them
+    """
+    pass
+
+
 class FoldersConfigurationEvent(ConfigurationEvent):
     def __init__(self, folders: Iterable[Folder], source: str):
         super(FoldersConfigurationEvent, self).__init__(source)
@@ -487,6 +581,26 @@ class FoldersSyncedEvent(FoldersConfigurationEvent):
     pass
 
 
+class ProjectsConfigurationEvent(ConfigurationEvent):
+    def __init__(self, projects: Iterable[str], source: str):
+        super(ProjectsConfigurationEvent, self).__init__(source)
+        self.__projects = tuple(projects)
+
+    def projects(self):
+        return self.__projects
+
+    def __repr__(self):
+        return '<{typename}>: ({projectlist})'.format(typename=type(self).__name__, projectlist=', '.join(self.__projects))
+
+
+class ProjectsAddedEvent(ProjectsConfigurationEvent):
+    pass
+
+
+class ProjectsRemovedEvent(ProjectsConfigurationEvent):
+    pass
+
+
 class ConfigSyncChangedEvent(BaseEvent):
     def __init__(self, insync: bool):
         super(ConfigSyncChangedEvent, self).__init__()
@@ -556,38 +670,65 @@ class SyncthingHandler(ServerComponent):
         super(SyncthingHandler, self).__init__(server)
 
         self.__log = get_logger(self.__class__.__name__)
-        self.__log.min_log_level = 1
 
         self.__myid_lock = threading.Lock()
         self.syncthing_bin = r'syncthing'
+        self.syncthing_launcher = getattr(server, 'syncthingLauncher', None)  # type: Optional[SyncthingLauncher]  # if None - syncthing_bin is run
         self.data_root = server.config['data_root']  # os.path.join(os.path.split(os.path.abspath(__file__))[0], r'data')
         self.config_root = server.config['config_root']  # os.path.join(os.path.split(os.path.abspath(__file__))[0], r'config')
+        self.folder_path_template = os.path.join('__LANCECONF_data_root__', '__LANCELOC_folder_label__')  # where to put folders that have no local path yet
 
         self.syncthing_gui_ip = '127.0.0.1'
         self.syncthing_gui_port = 9394 + int(random.uniform(0, 1000))
         self.syncthing_listenaddr = "tcp4://127.0.0.1:%d" % int(random.uniform(22000, 23000))
         self.syncthing_proc = None
+        self.syncthing_ready_timeout = 32  # seconds to wait for syncthing rest api to come up after start
+        self.syncthing_rest_timeout = 120  # seconds before rest call is considered hung
+        self.config_fsync = True  # fsync config files on save. they are written atomically anyway, this is about surviving power loss
+        self.__syncthingReady = threading.Event()  # set once rest api of current syncthing_proc answered a ping
+        self.__syncthingReadyLock = threading.Lock()  # only one caller probes, the rest wait for it
         self.__servers = set()  # set of ids in __devices dict that are servers
         self.__devices = {}  # type: Dict[str, Device]
         self.__folders = {}  # type: Dict[str, Folder]
         self.__ignoreDevices = set()  # set of devices
+        self.__projectIndex = {}  # type: Dict[str, Set[str]]  # project name -> ids of folders with that project in metadata
+        self.__publishedProjects = set()  # type: Set[str]  # projects announced with ProjectsAddedEvent, it's only done while config is in sync
 
         self.__apikey = None
         self.__myid = None
         self.__server_secret = None
 
         self._last_event_id = 0
+        self.__eventSource = None  # type: Optional[list]  # [myID, startTime] of syncthing instance _last_event_id belongs to, None till checked after start
+        self.__lastEventTime = None  # type: Optional[str]  # syncthing timestamp of last received event
+        self.resync_batch_size = 32  # folders to resync per event loop iteration after missed events
+        self.__resyncPending = False
+        self.__resyncSince = None  # type: Optional[str]  # syncthing timestamp after which events were missed, None if unknown
+        self.__resyncFolders = None  # type: Optional[List[str]]  # folders left to resync after missed events, None till chosen
+        self.__resyncDevices = False
+        self.__resyncedFolders = set()  # type: Set[str]  # what was resynced so far, reported once resync is done
+        self.__resyncedSyncedFolders = set()  # type: Set[str]
+        self.__resyncedDevices = set()  # type: Set[str]
 
         self.__defer_stupdate = False
         self.__defer_stupdate_writerequired = False
 
+        self.__configTracer = ConfigPropagationTracer()  # server side: how long device configs take to get acked
+        self.__configReceivedTime = None  # client side: when we last got config.cfg from server, reported back with config hash
+        self.__restRecorder = None  # type: Optional[RestRecorder]
+
+        self.__configStore = None  # type: Optional[SyncthingConfigStore]
+        if server.config.get('config_backend', 'json') == 'sqlite':
+            self.__configStore = SyncthingConfigStore(os.path.join(self.config_root, 'syncthinghandler_config.sqlite3'))
+
         self.__isValidState = True
         self.__configInSync = False
         self.__reload_configuration()
         if self._isServer():  # register special server event processors
             self.__updateClientConfigs()
         self.__log = get_logger('%s %s' % (self.myId()[:5], self.__class__.__name__))
-        self.__log.min_log_level = 1
+        self._metricsName = self.__log.name
+        self.__supervisor = SyncthingSupervisor(self._metricsName)
         self.__st_config_locks = []
 
     def start(self):
@@ -597,40 +738,78 @@ class SyncthingHandler(ServerComponent):
     def stop(self):
         super(SyncthingHandler, self).stop()
         self.__stop_syncthing()
+        if self.ident is None and self.__configStore is not None:  # never started, so run will not close it
+            self.__configStore.close()
+
+    def run(self):
+        try:
+            super(SyncthingHandler, self).run()
+        finally:
+            # supervisor might have restarted syncthing just as stop() was stopping it
+            if self.syncthing_proc is not None:
+                self.__stop_syncthing()
+            # loop has exited, nothing will touch config store anymore
+            if self.__configStore is not None:
+                self.__configStore.close()
 
     def myId(self):
         with self.__myid_lock:
             if self.__myid is not None:
                 return self.__myid
-            proc = subprocess.Popen([self.syncthing_bin, '-home={home}'.format(home=self.config_root), '-no-browser', '-no-restart', '-device-id'], stdout=subprocess.PIPE)
-            res = proc.communicate()[0]
-            if res.endswith(b'\n'):
-                res = res[:-1]
-            res = res.decode()
-            if proc.wait() != 0:
+            res = self.__launcher().device_id(self.config_root)
+            if res is None:
                 raise NoInitialConfiguration()
             self.__myid = res
         return res
 
+    def __launcher(self) -> SyncthingLauncher:
+        if self.syncthing_launcher is not None:
+            return self.syncthing_launcher
+        return SyncthingLauncher(self.syncthing_bin)
+
     def _isServer(self):
         return self.myId() in self.__servers
 
     def _enqueueEvent(self, event):
-        self.__log(1, 'enqueuing event: %s' % repr(event))
+        self.__log.fmt(1, 'enqueuing event: %r', event)
         super(SyncthingHandler, self)._enqueueEvent(event)
 
     def _runLoopLoad(self):
         while True:
             # TODO: check for device/folder connection events to check for blacklisted, just in case
+            if self.syncthing_proc is not None and self.__isValidState:
+                self.__supervise()
             if self.syncthing_proc is not None and self.__isValidState:  # TODO: skip this for some set time to wait for events to accumulate
                 try:
+                    if self.__eventSource is None:
+                        self.__resume_event_cursor()
+                    if self.__resyncPending:  # if it fails - it stays pending and is retried next time
+                        self.__resync_state()
                     stevents = self.__get('/rest/events', since=self._last_event_id, timeout=2)  # TODO: get events in async way
-                except:
-                    time.sleep(2)
+                except SyncthingNotReadyError:
+                    # readiness probe has already waited as long as it makes sense,
+                    # syncthing is dead or restarting, supervisor will deal with it
+                    time.sleep(0.1)
                     yield
                     continue
+                except Exception as e:
+                    self.__log(3, 'failed to get syncthing events: %s' % repr(e))
+                    proc = self.syncthing_proc  # handler may be stopped from another thread meanwhile
+                    if proc is None or proc.poll() is not None:  # it's dead, supervisor will restart it straight away
+                        yield
+                        continue
+                    if self.__supervisor.rest_failed():
+                        self.__log(4, 'syncthing does not respond, killing it')
+                        proc.kill()
+                        proc.wait()
+                        self.__supervise('unresponsive')
+                    else:
+                        time.sleep(2)
+                    yield
+                    continue
+                self.__supervisor.rest_succeeded()
 
-                self.__log(0, "syncthing event", stevents)
+                self.__log.fmt(0, 'syncthing event: %r', stevents)
                 current_session = hash(self.syncthing_proc)
                 # loop through rest events and pack them into lance events
                 if stevents is None:
@@ -639,27 +818,42 @@ class SyncthingHandler(ServerComponent):
                     continue
 
                 if len(stevents) > 0:
-                    self._last_event_id = max(stevents, key=lambda x: x['id'])['id']
+                    # syncthing's event buffer is finite, if we fell behind or were away - some events are lost
+                    firstid = min(x['id'] for x in stevents)
+                    if firstid > self._last_event_id + 1:
+                        self.__log(2, 'events %d-%d were dropped by syncthing, resyncing state' % (self._last_event_id + 1, firstid - 1))
+                        metrics.counter('lance_syncthing_event_gaps_total', {'component': self._metricsName}).inc()
+                        metrics.counter('lance_syncthing_dropped_events_total', {'component': self._metricsName}).inc(firstid - self._last_event_id - 1)
+                        if not self.__resyncPending:  # if previous resync is not done - it's earlier gap time covers this one too
+                            self.__resyncSince = self.__lastEventTime
+                        self.__resyncPending = True
+                        self.__resyncFolders = None  # choose folders again
+                        self.__resyncDevices = True
+
+                if len(stevents) > 0:
+                    lastevent = max(stevents, key=lambda x: x['id'])
+                    self._last_event_id = lastevent['id']
+                    self.__lastEventTime = lastevent['time']
 
                 for stevent in stevents:
                     # filter and pack events into our wrapper
 
-                    eventtime_datetime = syncthing_timestamp_to_datetime(stevent['time'])
-                    eventtime = eventtime_datetime.timestamp()
                     #just fancy logging:
-                    logtext = 'event type "%s" from %s' % (stevent['type'], eventtime_datetime.strftime('%H:%M:%S.%f'))
-                    if stevent['type'] == 'FolderSummary':
-                        logtext += ' %s: %d' % (stevent['data']['folder'], stevent['data']['summary']['needTotalItems'])
-                    elif stevent['type'] == 'ItemStarted':
-                        logtext += '%s: %s: %s' % (stevent['data']['folder'], stevent['data']['action'], stevent['data']['item'])
-                    elif stevent['type'] == 'ItemFinished':
-                        logtext += '%s: %s: %s' % (stevent['data']['folder'], stevent['data']['action'], stevent['data']['item'])
-                    self.__log(1, logtext)
+                    if self.__log.enabled(1):
+                        eventtime_datetime = syncthing_timestamp_to_datetime(stevent['time'])
+                        logtext = 'event type "%s" from %s' % (stevent['type'], eventtime_datetime.strftime('%H:%M:%S.%f'))
+                        if stevent['type'] == 'FolderSummary':
+                            logtext += ' %s: %d' % (stevent['data']['folder'], stevent['data']['summary']['needTotalItems'])
+                        elif stevent['type'] == 'ItemStarted':
+                            logtext += '%s: %s: %s' % (stevent['data']['folder'], stevent['data']['action'], stevent['data']['item'])
+                        elif stevent['type'] == 'ItemFinished':
+                            logtext += '%s: %s: %s' % (stevent['data']['folder'], stevent['data']['action'], stevent['data']['item'])
+                        self.__log(1, logtext)
 
                     controlfolders = {self.get_config_folder(did).fid(): did for did, dev in self.__devices.items()} if self._isServer() else {}
 
                     if stevent.get('error', None) is not None or stevent.get('data', {}).get('error', None) is not None:
-                        self.__log(1, 'syncthing event has error status, %s, skipping' % json.dumps(stevent))
+                        self.__log.fmt(1, lambda: 'syncthing event has error status, %s, skipping' % json.dumps(stevent))
                         continue  # TODO: for now we have NO error handling/reporting at all
 
                     if stevent['type'] == 'StartupComplete':
@@ -667,18 +861,7 @@ class SyncthingHandler(ServerComponent):
                         # must check configuration
                         self.__log(1, 'StartupComplete event received, config in sync =%s' % repr(self.__configInSync))
                         try:
-                            configstatus = self.__get('/rest/db/file', folder=self.get_config_folder().fid(), file='configuration/config.cfg')
-                            configsynced = configstatus['global']['version'] == configstatus['local']['version']
-                            self.__log(1, 'probed config folder status, synced =%s' % repr(configsynced))
-                            if self.__configInSync != configsynced:
-                                self.__configInSync = configsynced
-                                if self.__configInSync:
-                                    try:
-                                        self.__reload_configuration()
-                                    except Exception as e:
-                                        self.__log(2, 'config reload failed cuz of Exception %s probably being updated by syncthing' % repr(e))
-                                        self.__configInSync = False
-                                self._enqueueEvent(ConfigSyncChangedEvent(self.__configInSync))
+                            self.__probe_config_sync()
                         except requester.HTTPError as e:
                             if e.code == 404:  # looks like syncthing config was not saved. how did this happen??
                                 self.__log(4, 'syncthing config was not properly initialized')
@@ -699,6 +882,7 @@ class SyncthingHandler(ServerComponent):
                         #if data['summary']['needTotalItems'] == 0:
                         self.__log(1, 'server configuration sync completed, config in sync = True')
                         self.__configInSync = True
+                        self.__configReceivedTime = time.time()
                         try:
                             self.__reload_configuration()  # TODO: add parameter to nobootstrap, cuz we need to override bootstrap at this point
                             self.__save_bootstrapConfig()
@@ -707,6 +891,7 @@ class SyncthingHandler(ServerComponent):
                             self.__configInSync = False
                         else:
                             self._enqueueEvent(ConfigSyncChangedEvent(True))
+                            self.__publish_projects('config_sync')
 
                     # Check control folder
                     elif self._isServer() and stevent['type'] == 'ItemFinished' and stevent['data']['folder'] in controlfolders and  stevent['data']['action'] != 'metadata':
@@ -725,17 +910,29 @@ class SyncthingHandler(ServerComponent):
                                     self.__log(1, 'expecting hash %s, got hash %s' % (self.__devices[clientdid]._st_event_confighash, syncedhash))
                                     if syncedhash == self.__devices[clientdid]._st_event_confighash:
                                         self.__devices[clientdid]._st_event_synced = True
+                                        self.__log.fmt(1, 'config propagation: %r', self.__configTracer.mark(clientdid, syncedhash, 'acked'))
+                                        self._enqueueEvent(DevicesConfigSyncedEvent((copy.deepcopy(self.__devices[clientdid]),), 'syncthing::event'))
                                         self.__log(1, 'device %s synced configuration' % clientdid)
                                         if self.__devices[clientdid].is_schediled_for_deletion():
                                             self.__log(1, 'now safe to delete device %s' % clientdid)
                                             del self.__devices[clientdid]
-                                            self.__save_configuration(save_st_config=True)
+                                            self.__configTracer.forget_device(clientdid)
+                                            self.__save_configuration(save_st_config=True, changed_devices=(clientdid,), changed_folders=())
                                             # Note that we don't update any device config, cuz if device scheduled for deletion - it must have already been removed from everything
                                             # so here we just do sanity check
                                             for fid, folder in self.__folders.items():
                                                 assert clientdid not in folder.devices()
                                     else:
                                         self.__log(1, 'device %s config hash differs from expected, waiting' % clientdid)
+                        elif stevent['data']['item'] == 'config_sync/trace':  # client's timestamps of receiving and applying config, may come before or after the hash
+                            clientdid = controlfolders[stevent['data']['folder']]
+                            try:
+                                with open(os.path.join(self.get_config_folder(clientdid).path(), 'config_sync', 'trace'), 'r') as f:
+                                    report = jsoncodec.load(f)
+                            except (OSError, ValueError) as e:
+                                self.__log(1, "couldn't read config trace of device %s: %s" % (clientdid, repr(e)))
+                            else:
+                                self.__configTracer.client_report(clientdid, report)
                         elif stevent['data']['item'] == 'configuration/config.cfg':  # either another server updated it, or it may be index mismatch with removed and added back device
                             try:
                                 fid = stevent['data']['folder']
@@ -756,8 +953,8 @@ class SyncthingHandler(ServerComponent):
                         fid = stevent['data']['folder']
 
                         self.__folders[fid]._updateVolatileData(stevent['data'])
-                        self.__log(1, repr(self.__folders[fid].volatile_data()))
                         fcopy = copy.deepcopy(self.__folders[fid])
+                        self.__log.fmt(1, '%r', fcopy.volatile_data())  # copy's data is not changed by further updates
                         self._enqueueEvent(FoldersVolatileDataChangedEvent((fcopy,), 'syncthing::event'))
                         if stevent['data']['summary']['needTotalItems'] == 0:
                             self.__folders[stevent['data']['folder']]._st_event_synced = True
@@ -769,21 +966,24 @@ class SyncthingHandler(ServerComponent):
                         if did in self.__devices:
                             self.__devices[did]._update_volatile_data(stevent['data'])
                             self.__devices[did]._update_volatile_data({'connected': True, 'error': None})
-                            self.__log(1, repr(self.__devices[did].volatile_data()))
-                            self._enqueueEvent(DevicesVolatileDataChangedEvent((copy.deepcopy(self.__devices[did]),), 'syncthing::event'))
+                            dcopy = copy.deepcopy(self.__devices[did])
+                            self.__log.fmt(1, '%r', dcopy.volatile_data())
+                            self._enqueueEvent(DevicesVolatileDataChangedEvent((dcopy,), 'syncthing::event'))
                     elif stevent['type'] == 'DeviceDisconnected':
                         did = stevent['data']['id']
                         if did in self.__devices:
                             self.__devices[did]._update_volatile_data(stevent['data'])
                             self.__devices[did]._update_volatile_data({'connected': False})
-                            self.__log(1, repr(self.__devices[did].volatile_data()))
-                            self._enqueueEvent(DevicesVolatileDataChangedEvent((copy.deepcopy(self.__devices[did]),), 'syncthing::event'))
+                            dcopy = copy.deepcopy(self.__devices[did])
+                            self.__log.fmt(1, '%r', dcopy.volatile_data())
+                            self._enqueueEvent(DevicesVolatileDataChangedEvent((dcopy,), 'syncthing::event'))
                     elif stevent['type'] == 'DeviceDiscovered':
                         did = stevent['data']['device']
                         if did in self.__devices:
                             self.__devices[did]._update_volatile_data(stevent['data'])
-                            self.__log(1, repr(self.__devices[did].volatile_data()))
-                            self._enqueueEvent(DevicesVolatileDataChangedEvent((copy.deepcopy(self.__devices[did]),), 'syncthing::event'))
+                            dcopy = copy.deepcopy(self.__devices[did])
+                            self.__log.fmt(1, '%r', dcopy.volatile_data())
+                            self._enqueueEvent(DevicesVolatileDataChangedEvent((dcopy,), 'syncthing::event'))
                     elif stevent['type'] == 'FolderCompletion' and \
                             stevent['data']['device'] in self.__devices and \
                             self.__devices[stevent['data']['device']].is_schediled_for_deletion() and \
@@ -807,9 +1007,197 @@ class SyncthingHandler(ServerComponent):
                     else:  # General event
                         self._enqueueEvent(SyncthingEvent(stevent))
 
+                if len(stevents) > 0:
+                    self.__save_event_cursor()
+
             #time.sleep(1)
             yield
 
+    def __probe_config_sync(self):
+        """
+        ask syncthing if config folder is in sync, reload configuration if it just became so
+        :raises requester.HTTPError: 404 if syncthing does not know config folder
+        """
+        configstatus = self.__get('/rest/db/file', folder=self.get_config_folder().fid(), file='configuration/config.cfg')
+        configsynced = configstatus['global']['version'] == configstatus['local']['version']
+        self.__log(1, 'probed config folder status, synced =%s' % repr(configsynced))
+        if self.__configInSync != configsynced:
+            self.__configInSync = configsynced
+            if self.__configInSync:
+                self.__configReceivedTime = time.time()  # we could not see it arriving, it's as close as we can get
+                try:
+                    self.__reload_configuration()
+                except Exception as e:
+                    self.__log(2, 'config reload failed cuz of Exception %s probably being updated by syncthing' % repr(e))
+                    self.__configInSync = False
+            self._enqueueEvent(ConfigSyncChangedEvent(self.__configInSync))
+            self.__publish_projects('config_sync')
+
+    def __event_cursor_path(self):
+        return os.path.join(self.config_root, 'syncthing_event_cursor.json')
+
+    def __resume_event_cursor(self):
+        """
+        continue from saved _last_event_id if we are talking to the same syncthing instance it was saved for,
+        so events already processed before lance restart are not processed again
+        a new syncthing instance starts it's event ids from scratch, so there is nothing to resume
+        """
+        status = self.__get('/rest/system/status')
+        source = [status.get('myID'), status.get('startTime')]
+        try:
+            with open(self.__event_cursor_path(), 'r') as f:
+                cursor = jsoncodec.load(f)
+        except (OSError, ValueError):
+            cursor = None
+        if cursor is not None and cursor.get('source') == source and cursor.get('last_event_id', 0) > self._last_event_id:
+            # StartupComplete is most probably behind the cursor, so we do what it would do
+            try:
+                self.__probe_config_sync()
+            except requester.HTTPError as e:
+                if e.code != 404:
+                    raise
+                self.__log(2, 'config folder is unknown to syncthing, processing events from the start')
+            else:
+                self.__log(1, 'resuming syncthing events from %d' % cursor['last_event_id'])
+                self._last_event_id = cursor['last_event_id']
+                self.__lastEventTime = cursor.get('last_event_time', None)
+        self.__eventSource = source
+
+    def __save_event_cursor(self):
+        if self.__eventSource is None:
+            return
+        try:  # no fsync - it's written after every event batch, and losing it only means reprocessing some events
+            with lance_utils.atomic_write(self.__event_cursor_path(), fsync=False) as f:
+                jsoncodec.dump({'source': self.__eventSource, 'last_event_id': self._last_event_id, 'last_event_time': self.__lastEventTime}, f, compact=True)
+        except OSError as e:
+            self.__log(3, 'could not save event cursor: %s' % repr(e))
+
+    def __resync_targets(self, since: Optional[str]) -> List[str]:
+        """
+        choose folders that could have missed state changes after given syncthing timestamp
+        syncthing only changes folder state by scanning or pulling, and both are timestamped in folder stats, one request for all folders.
+        a folder that was not synced at the gap may have finished in it. anything else announced in the gap, but not pulled yet,
+        will be reported by events when pulling starts
+        if time is unknown or stats are not available - all folders are chosen
+        """
+        if since is None:
+            return list(self.__folders.keys())
+        try:
+            stats = self.__get('/rest/stats/folder')
+        except requester.HTTPError as e:
+            self.__log(3, 'could not get folder stats, resyncing all folders: %s' % repr(e))
+            return list(self.__folders.keys())
+        sincetime = syncthing_timestamp_to_datetime(since)
+        targets = []
+        for fid, folder in self.__folders.items():
+            fstats = stats.get(fid, None)
+            if not folder._st_event_synced or fstats is None:
+                targets.append(fid)
+                continue
+            for timestamp in (fstats.get('lastScan', None), (fstats.get('lastFile', None) or {}).get('at', None)):
+                try:
+                    changed = timestamp is not None and syncthing_timestamp_to_datetime(timestamp) >= sincetime
+                except ValueError:
+                    changed = True
+                if changed:
+                    targets.append(fid)
+                    break
+        return targets
+
+    def __resync_state(self):
+        """
+        rebuild devices' and folders' volatile data from syncthing status endpoints, for when events about it could have been missed
+        this is way cheaper than replaying history, and is only as stale as one request
+        devices all come with one request, folders are queried one by one, so only those chosen by __resync_targets
+        one call resyncs devices and up to resync_batch_size pending folders, so event processing is not blocked on servers with lots of folders.
+        what was resynced is collected across calls and reported in one batch of events when whole resync is done
+        connection errors are raised, whatever is not resynced yet stays pending
+        """
+        if self.__resyncFolders is None:
+            self.__resyncFolders = self.__resync_targets(self.__resyncSince)
+            self.__log(1, 'resyncing %d of %d folders' % (len(self.__resyncFolders), len(self.__folders)))
+        if self.__resyncDevices:
+            try:
+                connections = self.__get('/rest/system/connections').get('connections', {})
+            except requester.HTTPError as e:
+                self.__log(3, 'could not get device connections: %s' % repr(e))
+                connections = {}
+            for did, conn in connections.items():
+                if did not in self.__devices or did == self.myId():
+                    continue
+                self.__devices[did]._update_volatile_data({'connected': conn.get('connected', False),
+                                                           'paused': conn.get('paused', False),
+                                                           'addr': conn.get('address', ''),
+                                                           'clientVersion': conn.get('clientVersion', '')})
+                self.__resyncedDevices.add(did)
+            self.__resyncDevices = False
+
+        queried = 0
+        while len(self.__resyncFolders) > 0 and queried < self.resync_batch_size:
+            fid = self.__resyncFolders[-1]
+            folder = self.__folders.get(fid, None)
+            if folder is not None:  # might have been removed since
+                queried += 1
+                try:
+                    summary = self.__get('/rest/db/status', folder=fid)
+                except requester.HTTPError as e:
+                    self.__log(3, 'could not get status of folder %s: %s' % (fid, repr(e)))
+                else:
+                    folder._updateVolatileData({'folder': fid, 'summary': summary})
+                    wassynced = folder._st_event_synced
+                    folder._st_event_synced = summary.get('needTotalItems', -1) == 0
+                    self.__resyncedFolders.add(fid)
+                    if folder._st_event_synced and not wassynced:
+                        self.__resyncedSyncedFolders.add(fid)
+            self.__resyncFolders.pop()
+        if len(self.__resyncFolders) > 0:
+            self.__log(1, '%d folders left to resync' % len(self.__resyncFolders))
+            return
+
+        # done, report everything at once, with current state of objects
+        changedfolders = tuple(copy.deepcopy(self.__folders[x]) for x in self.__resyncedFolders if x in self.__folders)
+        syncedfolders = tuple(x for x in changedfolders if x.id() in self.__resyncedSyncedFolders)
+        changeddevices = tuple(copy.deepcopy(self.__devices[x]) for x in self.__resyncedDevices if x in self.__devices)
+        self.__log(1, 'resynced %d folders and %d devices' % (len(changedfolders), len(changeddevices)))
+        self.__resyncPending = False
+        self.__resyncSince = None
+        self.__resyncFolders = None
+        self.__resyncedFolders = set()
+        self.__resyncedSyncedFolders = set()
+        self.__resyncedDevices = set()
+        if len(changedfolders) > 0:
+            self._enqueueEvent(FoldersVolatileDataChangedEvent(changedfolders, 'syncthing::resync'))
+        if len(syncedfolders) > 0:
+            self._enqueueEvent(FoldersSyncedEvent(syncedfolders, 'syncthing::resync'))
+        if len(changeddevices) > 0:
+            self._enqueueEvent(DevicesVolatileDataChangedEvent(changeddevices, 'syncthing::resync'))
+
+    def __supervise(self, reason: Optional[str] = None):
+        """
+        restart syncthing if it died without us stopping it
+        :param reason: if given - syncthing is known to be dead for this reason
+        """
+        if self._stopped_set():  # handler is stopping, and so is syncthing, on purpose
+            return
+        checked = self.__supervisor.check_process(self.syncthing_proc)
+        if reason is None:
+            reason = checked
+        if reason is None:
+            return
+        if not self.__supervisor.may_restart(reason):
+            self.__log(5, 'syncthing %s, but it was restarted too many times already, giving up' % reason)
+            self.syncthing_proc = None
+            return
+        self.__log(4 if reason != 'restart requested' else 1, 'syncthing %s, restarting' % reason)
+        self.__start_syncthing()
+
+    @async_method()
+    def get_syncthing_supervisor_stats(self) -> dict:
+        """
+        :return: dict with running, uptime, restarts, crashes, liveness_failures and gave_up
+        """
+        return self.__supervisor.stats()
+
     def __generateInitialConfig(self):
         self.__log(1, 'Generating initial configuration')
         dorestart = self.syncthing_running()
@@ -822,9 +1210,7 @@ class SyncthingHandler(ServerComponent):
                 # if we can get id - config is already generated
             except NoInitialConfiguration:
                 self.__log(1, 'generating syncthing keys')
-                proc = subprocess.Popen([self.syncthing_bin, '-generate={home}'.format(home=self.config_root)], stdout=sys.stdout, stderr=sys.stderr)
-                proc.wait()
-                if proc.poll() != 0:
+                if not self.__launcher().generate(self.config_root):
                     raise RuntimeError('Could not generate initial configuration')
 
                 # lets generate initial cache
@@ -843,6 +1229,62 @@ class SyncthingHandler(ServerComponent):
     def __updateClientConfigs(self):
         pass
 
+    @staticmethod
+    def __folder_project(folder: Folder) -> Optional[str]:
+        return folder.metadata().get('__ProjectManager_data__', {}).get('project', None)
+
+    def __index_folder_projects(self, folders: Iterable[Folder], source: str):
+        """
+        add given folders to the project index, emit event if new projects appeared
+        """
+        for folder in folders:
+            project = SyncthingHandler.__folder_project(folder)
+            if project is None:
+                continue
+            self.__projectIndex.setdefault(project, set()).add(folder.id())
+        self.__publish_projects(source)
+
+    def __unindex_folder_projects(self, folders: Iterable[Folder], source: str):
+        """
+        remove given folders from the project index, emit event if some projects have no folders left
+        """
+        for folder in folders:
+            project = SyncthingHandler.__folder_project(folder)
+            if project not in self.__projectIndex:
+                continue
+            self.__projectIndex[project].discard(folder.id())
+            if len(self.__projectIndex[project]) == 0:
+                del self.__projectIndex[project]
+        self.__publish_projects(source)
+
+    def __rebuild_project_index(self, source: str):
+        """
+        rebuild project index from scratch, emit events for the difference with the previous one
+        """
+        self.__projectIndex = {}
+        for folder in self.__folders.values():
+            project = SyncthingHandler.__folder_project(folder)
+            if project is None:
+                continue
+            self.__projectIndex.setdefault(project, set()).add(folder.id())
+        self.__publish_projects(source)
+
+    def __publish_projects(self, source: str):
+        """
+        emit events for the difference between project index and projects announced before
+        nothing is announced while config is not in sync, project managers should not be created from half-synced config,
+        so this is called again every time config becomes synced
+        """
+        if not self.__configInSync:
+            return
+        projectsadded = [x for x in self.__projectIndex if x not in self.__publishedProjects]
+        projectsremoved = [x for x in self.__publishedProjects if x not in self.__projectIndex]
+        self.__publishedProjects = set(self.__projectIndex.keys())
+        if len(projectsadded) > 0:
+            self._enqueueEvent(ProjectsAddedEvent(projectsadded, source))
+        if len(projectsremoved) > 0:
+            self._enqueueEvent(ProjectsRemovedEvent(projectsremoved, source))
+
     def __del__(self):
         self.__stop_syncthing()
 
@@ -929,6 +1371,26 @@ class SyncthingHandler(ServerComponent):
         """
         return copy.deepcopy(self.__folders)
 
+    @async_method()
+    def get_project_names(self):
+        """
+        names of projects found in folders' metadata
+        if config not in sync - this will return last valid configuration
+        :return:
+        """
+        return set(self.__projectIndex.keys())
+
+    @async_method()
+    def get_config_propagation_stats(self, deviceids: Optional[Iterable[str]] = None, percentiles: Iterable[float] = (50, 90, 99)):
+        """
+        latency percentiles of device configuration propagation, from config being written to each of
+        'scanned', 'client_received', 'client_applied' and 'acked' stages
+        client stages are measured by client's clock
+        :param deviceids: devices to get stats for, all devices configs were saved for if None
+        :return: {deviceid: {stage: {'count': int, 'p50': seconds or None, ...}}}
+        """
+        return self.__configTracer.percentiles(deviceids, percentiles)
+
     @async_method()
     def add_server(self, deviceid: str):
         return self.__interface_addServer(deviceid)
@@ -963,12 +1425,12 @@ class SyncthingHandler(ServerComponent):
             raise RuntimeError('device %s does not belong to this server' % did)
         if fid not in self.__folders:
             raise RuntimeError('folder %s does not belong to this server' % did)
-        self.__log(1, "adding %s to %s that has %s" % (did, fid, repr(self.__folders[fid].devices())))
+        self.__log.fmt(1, "adding %s to %s that has %r", did, fid, tuple(self.__folders[fid].devices()))
         if did not in self.__folders[fid].devices():
             self.__log(1, 'adding')
             self.__folders[fid].add_device(did)
-            self.__save_configuration(save_st_config=True)
-            self.__log(1, "config saved %s" % repr(self.__folders[fid].devices()))
+            self.__save_configuration(save_st_config=True, changed_devices=(), changed_folders=(fid,))
+            self.__log.fmt(1, "config saved %r", tuple(self.__folders[fid].devices()))
             #self.__save_st_config()
             for dev in self.__folders[fid].devices():
                 self.__save_device_configuration(dev)
@@ -982,12 +1444,12 @@ class SyncthingHandler(ServerComponent):
             raise ConfigNotInSyncError()
         if fid not in self.__folders:
             raise RuntimeError('folder %s does not belong to this server' % did)
-        self.__log(1, "removing %s from %s that has %s" % (did, fid, repr(self.__folders[fid].devices())))
+        self.__log.fmt(1, "removing %s from %s that has %r", did, fid, tuple(self.__folders[fid].devices()))
         if did in self.__folders[fid].devices():
             self.__log(1, 'removing')
             self.__folders[fid].remove_device(did)
-            self.__save_configuration(save_st_config=True)
-            self.__log(1, "config saved %s" % repr(self.__folders[fid].devices()))
+            self.__save_configuration(save_st_config=True, changed_devices=(), changed_folders=(fid,))
+            self.__log.fmt(1, "config saved %r", tuple(self.__folders[fid].devices()))
             #self.__save_st_config()
             for dev in self.__folders[fid].devices():
                 self.__save_device_configuration(dev)
@@ -1019,8 +1481,8 @@ class SyncthingHandler(ServerComponent):
         for did in toadd:
             self.__log(1, 'adding %s to %s' % (did, fid))
             self.__folders[fid].add_device(did)
-        self.__save_configuration(save_st_config=True)
-        self.__log(1, "config saved, %s had devices: %s" % (fid, repr(self.__folders[fid].devices())))
+        self.__save_configuration(save_st_config=True, changed_devices=(), changed_folders=(fid,))
+        self.__log.fmt(1, "config saved, %s had devices: %r", fid, tuple(self.__folders[fid].devices()))
         #self.__save_st_config()
         for did in self.__folders[fid].devices().union(todel):
             self.__save_device_configuration(did)
@@ -1047,7 +1509,7 @@ class SyncthingHandler(ServerComponent):
         if name == self.__devices[did].name():
             return
         self.__devices[did]._setName(name)
-        self.__save_configuration(save_st_config=True)
+        self.__save_configuration(save_st_config=True, changed_devices=(did,), changed_folders=())
         #self.__save_st_config()
 
         # now we need to inform ALL devices this one has contact with about the new name
@@ -1073,14 +1535,14 @@ class SyncthingHandler(ServerComponent):
         if deviceid in self.__devices:
             if self.__devices[deviceid].is_schediled_for_deletion():
                 self.__devices[deviceid].unschedule_for_deletion()
-                self.__save_configuration(save_st_config=True)
+                self.__save_configuration(save_st_config=True, changed_devices=(deviceid,), changed_folders=())
                 #self.__save_st_config()
                 for dev in self.__devices:
                     self.__save_device_configuration(dev)
             return
         self.__log(1, 'adding device %s' % deviceid)
         self.__devices[deviceid] = Device(self, deviceid, name=name)
-        self.__save_configuration(save_st_config=True)
+        self.__save_configuration(save_st_config=True, changed_devices=(deviceid,), changed_folders=())
         #self.__save_st_config()
         self.__save_device_configuration(deviceid)
         #for dev in self.__devices:
@@ -1097,18 +1559,18 @@ class SyncthingHandler(ServerComponent):
             return
         self.__log(1, 'removing device %s' % deviceid)
         dids_to_update = set()
-        folders_updated = set()
+        folders_updated = []  # Folder is not hashable
         for fid, folder in self.__folders.items():
             if deviceid in folder.devices():
                 folder.remove_device(deviceid)
                 dids_to_update.update(folder.devices())
-                folders_updated.add(copy.deepcopy(self.__folders[fid]))
+                folders_updated.append(copy.deepcopy(self.__folders[fid]))
 
         # now we cannot just delete device like we do with folders - it will not sync if we delete it straight away, and therefore will not know it was deleted.
 
         remdevice = self.__devices[deviceid]
         remdevice.schedule_for_deletion()
-        self.__save_configuration(save_st_config=True)
+        self.__save_configuration(save_st_config=True, changed_devices=(deviceid,), changed_folders=[x.id() for x in folders_updated])
         #self.__save_st_config()
         dids_to_update.add(deviceid)
         for did in dids_to_update:
@@ -1124,9 +1586,9 @@ class SyncthingHandler(ServerComponent):
             raise RuntimeError('device list is provided by server')
         if not self.__configInSync:
             raise ConfigNotInSyncError()
-        self.__log(1, "setting device list to %s" % repr(dids))
         if not isinstance(dids, set):
             dids = set(dids)
+        self.__log.fmt(1, "setting device list to %r", tuple(dids))
         existing_dids = set((x for x, y in self.__devices.items() if not y.is_schediled_for_deletion() and x not in self.__servers))
         if dids == existing_dids:
             self.__log(1, "no changes required")
@@ -1155,7 +1617,7 @@ class SyncthingHandler(ServerComponent):
             devs_removed_forevent.append(self.__devices[did])
             self.__devices[did].schedule_for_deletion()
 
-        self.__save_configuration(save_st_config=True)
+        self.__save_configuration(save_st_config=True, changed_devices=dids_to_add.union(dids_to_remove), changed_folders=[x.id() for x in folders_updated_forevent])
         #self.__save_st_config()
         for did in dids_to_add.union(dids_to_update).union(dids_to_remove):
             self.__save_device_configuration(did)
@@ -1178,7 +1640,7 @@ class SyncthingHandler(ServerComponent):
         self.__log(1, 'adding server %s' % deviceid)
         self.__servers.add(deviceid)
 
-        self.__save_configuration(save_st_config=True)
+        self.__save_configuration(save_st_config=True, changed_devices=(deviceid,), changed_folders=())
         #self.__save_st_config()
         if self._isServer():
             for dev in self.__devices:
@@ -1216,11 +1678,12 @@ class SyncthingHandler(ServerComponent):
                 raise RuntimeError('unexpected probability! call ghost busters')
         self.__folders[fid] = Folder(self, fid, label, folderPath, devList, metadata)
 
-        self.__save_configuration(save_st_config=True)
+        self.__save_configuration(save_st_config=True, changed_devices=(), changed_folders=(fid,))
         #self.__save_st_config()
         for dev in devList:
             self.__save_device_configuration(dev)
         self._enqueueEvent(FoldersAddedEvent((copy.deepcopy(self.__folders[fid]),), 'external::add_folder'))
+        self.__index_folder_projects((self.__folders[fid],), 'external::add_folder')
         return fid
 
     def __interface_removeFolder(self, folderId: str):
@@ -1237,12 +1700,13 @@ class SyncthingHandler(ServerComponent):
         folder = self.__folders[folderId]
         del self.__folders[folderId]
 
-        self.__save_configuration(save_st_config=True)
+        self.__save_configuration(save_st_config=True, changed_devices=(), changed_folders=(folderId,))
         #self.__save_st_config()
         for dev in folder.devices():
             self.__save_device_configuration(dev)
         # note that server does NOT delete folder from disc when folder is removed
         self._enqueueEvent(FoldersRemovedEvent((copy.deepcopy(folder),), 'external::remove_folder'))
+        self.__unindex_folder_projects((folder,), 'external::remove_folder')
 
     def __reload_configuration(self, use_bootstrap=True):
         """
@@ -1254,12 +1718,11 @@ class SyncthingHandler(ServerComponent):
         if not self.__configInSync:
             self.__log(2, 'configuration not in sync!')
             #return None
-        if not os.path.exists(os.path.join(self.config_root, 'syncthinghandler_config.json')):  # initialization time!
+        if not self.__bootstrapConfigExists():  # initialization time!
             self.__generateInitialConfig()
 
-        with open(os.path.join(self.config_root, 'syncthinghandler_config.json'), 'r') as f:
-            config_bootstrap = json.load(f)
-            self.__log(1, config_bootstrap)
+        config_bootstrap = self.__load_bootstrapConfig()
+        self.__log(1, config_bootstrap)
 
         configChanged = False
 
@@ -1296,20 +1759,24 @@ class SyncthingHandler(ServerComponent):
         self.__log(1, 'configuration path: %s' % configFoldPath)
         os.makedirs(configFoldPath, exist_ok=True)
         if not os.path.exists(os.path.join(configFoldPath, 'config.cfg')):  # it cannot be deleted by anything, so if it doesn't exist - means we haven't initialized it at all
-            with open(os.path.join(configFoldPath, 'config.cfg'), 'w') as f:
-                json.dump({'devices': [],
-                           'servers': [],
-                           'folders': [],
-                           'ignoredevices': []}, f, indent=4)
+            with lance_utils.atomic_write(os.path.join(configFoldPath, 'config.cfg'), fsync=self.config_fsync) as f:
+                jsoncodec.dump({'devices': [],
+                                'servers': [],
+                                'folders': [],
+                                'ignoredevices': []}, f, compact=True)
 
         try:
             with open(os.path.join(configFoldPath, 'config.cfg'), 'r') as f:
-                configdict = json.load(f)
+                configdict = jsoncodec.load(f)
             self.__servers.update(configdict['servers'])
             # self.__servers.update(set(listdir(os.path.join(configFoldPath, 'servers'))))  # either update with bootstrapped, or with empty
-            self.__log(1, 'final server list:', self.__servers)
+            self.__log(1, 'final server list:', tuple(self.__servers))
             self.__devices = {}
             for devdict in configdict['devices']:
+                olddevice = olddevices.get(devdict['id'], None)
+                if olddevice is not None and olddevice._matches_serialized(devdict):  # unchanged devices are kept as they are
+                    self.__devices[olddevice.id()] = olddevice
+                    continue
                 newdevice = Device.deserialize(self, devdict)
                 self.__devices[newdevice.id()] = newdevice
 
@@ -1331,7 +1798,7 @@ class SyncthingHandler(ServerComponent):
             #     #    self.__devices[dev]['controlfolder'] = {'fid': 'control-%s' % hashlib.sha1((':'.join([self.__server_secret, dev])).encode('UTF-8')).hexdigest(),
             #     #                                            'path': os.path.join(self.data_root, 'control', dev)
             #     #                                            }  # ensure controlfolder attr exist
-            self.__log(1, 'final device list:', self.__devices.keys())
+            self.__log(1, 'final device list:', tuple(self.__devices.keys()))
 
             # check server-dev list consistency
             for srv in set(self.__servers):
@@ -1340,13 +1807,20 @@ class SyncthingHandler(ServerComponent):
                     self.__devices[srv] = Device(self, srv, None)
 
             self.__folders = {}
+            bootstrapfolders = config_bootstrap.get('folders', {})
             for foldict in configdict['folders']:
-                newfolder = Folder.deserialize(self, foldict)
-                newfolder._setPath(config_bootstrap.get('folders', {}).get(newfolder.id(), {}).get('attribs', {}).get('path', None), move_contents=False)
-                if newfolder.path() is None:
+                fid = foldict['attribs']['fid']
+                path = bootstrapfolders.get(fid, {}).get('attribs', {}).get('path', None)
+                if path is None:
                     # TODO: add an option to control this, allow folders to stay without path
                     # TODO: ensure path does not exist already
-                    newfolder._setPath(os.path.join(self.data_root, newfolder.label()))  #TODO: convert label to a valid filesystem filename !!!
+                    path = render_path(self.folder_path_template, self.config(), {'folder_label': foldict['attribs']['label'], 'folder_id': fid})  #TODO: convert label to a valid filesystem filename !!!
+                oldfolder = oldfolders.get(fid, None)
+                if oldfolder is not None and oldfolder._matches_serialized(foldict, path):  # unchanged folders are kept as they are
+                    self.__folders[fid] = oldfolder
+                    continue
+                newfolder = Folder.deserialize(self, foldict)
+                newfolder._setPath(path, move_contents=False)
                 self.__folders[newfolder.id()] = newfolder
 
             # for fid in listdir(os.path.join(configFoldPath, 'folders')):
@@ -1368,14 +1842,14 @@ class SyncthingHandler(ServerComponent):
             #         newfolder._setPath(os.path.join(self.data_root, newfolder.label()))  #TODO: convert label to a valid filesystem filename !!!
             #     self.__folders[fid] = newfolder
 
-            self.__log(1, 'final folder list:', self.__folders.keys())
+            self.__log(1, 'final folder list:', tuple(self.__folders.keys()))
             self.__ignoreDevices = set()
             self.__ignoreDevices.update(configdict['ignoredevices'])
             # for dev in listdir(os.path.join(configFoldPath, 'ignoredevices')):
             #     self.__ignoreDevices.add(dev)
 
             for did, newdevice in self.__devices.items():  # make sure to use old objects if exist
-                if did in olddevices:
+                if did in olddevices and olddevices[did] is not newdevice:
                     olddevice = olddevices[did]
                     olddevices[did] = copy.copy(olddevice)  # we will modify old device, so we need to keep old copy for future comparison
                     olddevice.replace_with(newdevice)
@@ -1383,7 +1857,7 @@ class SyncthingHandler(ServerComponent):
                     self.__devices[did] = newdevice
 
             for fid, newfolder in self.__folders.items():  # make sure to use old objects if exist
-                if fid in oldfolders:
+                if fid in oldfolders and oldfolders[fid] is not newfolder:
                     oldfolder = oldfolders[fid]
                     oldfolders[fid] = copy.copy(oldfolder)
                     oldfolder.replace_with(newfolder)
@@ -1431,7 +1905,11 @@ class SyncthingHandler(ServerComponent):
                 fldhash ^= fld.configuration_hash()
             os.makedirs(os.path.join(self.get_config_folder().path(), 'config_sync'), exist_ok=True)
             self.__log(1, 'saving config hash for server: %d:%d:%d:%d' % (serverhash, devhash, fldhash, ignhash))
-            with open(os.path.join(self.get_config_folder().path(), 'config_sync', 'hash'), 'w') as f:
+            with lance_utils.atomic_write(os.path.join(self.get_config_folder().path(), 'config_sync', 'trace'), fsync=self.config_fsync) as f:
+                jsoncodec.dump({'hash': "%d:%d:%d:%d" % (serverhash, devhash, fldhash, ignhash),
+                                'received': self.__configReceivedTime,
+                                'applied': time.time()}, f, compact=True)
+            with lance_utils.atomic_write(os.path.join(self.get_config_folder().path(), 'config_sync', 'hash'), fsync=self.config_fsync) as f:
                 f.write("%d:%d:%d:%d" % (serverhash, devhash, fldhash, ignhash))
 
         #if not self.__configInSync:
@@ -1449,43 +1927,45 @@ class SyncthingHandler(ServerComponent):
         # send events
         if olddevices != self.__devices:
             devicesadded = [copy.deepcopy(y) for x, y in self.__devices.items() if x not in olddevices]
-            devicesremoved = [copy.deepcopy(y) for x, y in olddevices.items() if x not in self.__devices]
+            devicesremoved = [y for x, y in olddevices.items() if x not in self.__devices]  # these are not ours anymore, no need to copy
             devicesupdated = [copy.deepcopy(y) for x, y in olddevices.items() if x in self.__devices and y != self.__devices[x]]
             __debug_devicesupdated = [y for x, y in self.__devices.items() if x in olddevices and y != olddevices[x]]
             if len(devicesadded) > 0:
                 self._enqueueEvent(DevicesAddedEvent(devicesadded, 'reload_configuration'))
-                self.__log(1, 'devicesadded event enqueued %s' % repr(devicesadded))
+                self.__log.fmt(1, 'devicesadded event enqueued %r', devicesadded)
             if len(devicesremoved) > 0:
                 self._enqueueEvent(DevicesRemovedEvent(devicesremoved, 'reload_configuration'))
-                self.__log(1, 'devicesremoved event enqueued %s' % repr(devicesremoved))
+                self.__log.fmt(1, 'devicesremoved event enqueued %r', devicesremoved)
             if len(devicesupdated) > 0:
                 self._enqueueEvent(DevicesChangedEvent(devicesupdated, 'reload_configuration'))
-                self.__log(1, 'devicesupdated event enqueued %s' % repr(devicesupdated))
+                self.__log.fmt(1, 'devicesupdated event enqueued %r', devicesupdated)
             #check
             for dev in __debug_devicesupdated:
                 assert dev is __debug_olddevices[dev.id()], 'modified device is not the same object'
         if oldfolders != self.__folders:
             foldersadded = [copy.deepcopy(y) for x, y in self.__folders.items() if x not in oldfolders]
-            foldersremoved = [copy.deepcopy(y) for x, y in oldfolders.items() if x not in self.__folders]
+            foldersremoved = [y for x, y in oldfolders.items() if x not in self.__folders]  # these are not ours anymore, no need to copy
             foldersupdated = [copy.deepcopy(y) for x, y in oldfolders.items() if x in self.__folders and y != self.__folders[x]]
             __debug_foldersupdated = [y for x, y in self.__folders.items() if x in oldfolders and y != oldfolders[x]]
             if len(foldersadded) > 0:
                 self._enqueueEvent(FoldersAddedEvent(foldersadded, 'reload_configuration'))
-                self.__log(1, 'foldersadded event enqueued %s' % repr(foldersadded))
+                self.__log.fmt(1, 'foldersadded event enqueued %r', foldersadded)
             if len(foldersremoved) > 0:
                 self._enqueueEvent(FoldersRemovedEvent(foldersremoved, 'reload_configuration'))
-                self.__log(1, 'foldersremoved event enqueued %s' % repr(foldersremoved))
+                self.__log.fmt(1, 'foldersremoved event enqueued %r', foldersremoved)
             if len(foldersupdated) > 0:
                 self._enqueueEvent(FoldersConfigurationChangedEvent(foldersupdated, 'reload_configuration'))
-                self.__log(1, 'foldersupdated event enqueued %s' % repr(foldersupdated))
+                self.__log.fmt(1, 'foldersupdated event enqueued %r', foldersupdated)
             # check
             for fld in __debug_foldersupdated:
                 assert fld is __debug_oldfolders[fld.id()], 'modified device is not the same object'
+            self.__rebuild_project_index('reload_configuration')
         # /events sent
 
         if not self.__configInSync and (self._isServer() and len(self.__servers) == 1 or len(self.__servers) == 0):  # so we are one and only server - we dont wait for config sync runtime check - there is noone to sync with
             self.__configInSync = True
             self._enqueueEvent(ConfigSyncChangedEvent(True))
+            self.__publish_projects('reload_configuration')
 
         return configChanged
 
@@ -1576,9 +2056,10 @@ class SyncthingHandler(ServerComponent):
         #     if fname not in self.__ignoreDevices:
         #         remove(os.path.join(_ignpath, fname))
 
-        with open(os.path.join(configFoldPath, 'config.cfg'), 'w') as f:
-            self.__log(1, 'saving config: %s' % json.dumps(configdict))
-            json.dump(configdict, f, indent=4)
+        configtext = jsoncodec.dumps(configdict, compact=True)
+        self.__log.fmt(0, 'saving config: %s', configtext)
+        with lance_utils.atomic_write(os.path.join(configFoldPath, 'config.cfg'), fsync=self.config_fsync) as f:
+            f.write(configtext)
 
         # save cache to check sync
         self.__log(1, 'calculating config hash for device %s' % deviceid)
@@ -1598,16 +2079,55 @@ class SyncthingHandler(ServerComponent):
         # for syncing purposes
         self.__devices[deviceid]._st_event_synced = False
         self.__devices[deviceid]._st_event_confighash = "%d:%d:%d:%d" % (serverhash, devhash, fldhash, ignhash)
+        if deviceid not in self.__servers:
+            self.__configTracer.begin(deviceid, self.__devices[deviceid]._st_event_confighash)
 
         if self.syncthing_running() and deviceid not in self.__servers:
             self.__log(1, 'requesting control folder rescan')
             try:
-                self.__post('/rest/db/scan', folder=self.get_config_folder(deviceid).fid())
+                self.__post('/rest/db/scan', folder=self.get_config_folder(deviceid).fid())  # scan request returns when scan is done
+                self.__configTracer.mark(deviceid, self.__devices[deviceid]._st_event_confighash, 'scanned')
             except requester.HTTPError as e:
                 self.__log(4, 'rescan control folder for device %s had an error: code=%d: %s. %s' % (deviceid, e.code, e.reason, e.msg))
 
+    def __bootstrapConfigExists(self) -> bool:
+        if self.__configStore is not None:
+            return self.__configStore.has_bootstrap()
+        return os.path.exists(os.path.join(self.config_root, 'syncthinghandler_config.json'))
+
+    def __load_bootstrapConfig(self) -> dict:
+        if self.__configStore is not None:
+            return self.__configStore.load_bootstrap()
+        with open(os.path.join(self.config_root, 'syncthinghandler_config.json'), 'r') as f:
+            return jsoncodec.load(f)
+
+    def __update_configStore(self, changed_devices: Optional[Iterable[str]] = None, changed_folders: Optional[Iterable[str]] = None) -> bool:
+        """
+        write changed devices and folders to the config store in one transaction
+        if changed_devices or changed_folders is None - whole configuration is rewritten
+        :return: True if synced part of configuration has changed
+        """
+        def _folder_row(folder: Folder):
+            fdict = folder.serialize_to_dict()
+            fdict['attribs'] = dict(fdict['attribs'], path=None)  # do not sync local path
+            return folder.path(), fdict
+
+        replace_all = changed_devices is None or changed_folders is None
+        if replace_all:
+            changed_devices = self.__devices.keys()
+            changed_folders = self.__folders.keys()
+        return self.__configStore.update(meta={'apikey': self.__apikey, 'server_secret': self.__server_secret},
+                                         servers=self.__servers,
+                                         ignoredevices=self.__ignoreDevices,
+                                         devices={did: self.__devices[did].serialize_to_dict() if did in self.__devices else None for did in changed_devices},
+                                         folders={fid: _folder_row(self.__folders[fid]) if fid in self.__folders else None for fid in changed_folders},
+                                         replace_all=replace_all)
+
     def __save_bootstrapConfig(self):  #TODO: use serialize_to_dict !
         self.__log(1, "saving bootstrap configuration")
+        if self.__configStore is not None:
+            self.__update_configStore()
+            return
         config = {}
         config['apikey'] = self.__apikey
         config['server_secret'] = self.__server_secret
@@ -1620,13 +2140,16 @@ class SyncthingHandler(ServerComponent):
         #    config['folders'][fid]['devices'] = list(config['folders'][fid]['devices'])
         config['ignoreDevices'] = list(self.__ignoreDevices)
 
-        with open(os.path.join(self.config_root, 'syncthinghandler_config.json'), 'w') as f:
-            json.dump(config, f, indent=4)
+        with lance_utils.atomic_write(os.path.join(self.config_root, 'syncthinghandler_config.json'), fsync=self.config_fsync) as f:
+            jsoncodec.dump(config, f)
 
-    def __save_configuration(self, save_st_config=True):
+    def __save_configuration(self, save_st_config=True, changed_devices: Optional[Iterable[str]] = None, changed_folders: Optional[Iterable[str]] = None):
         """
         server saves configuration to shared server folder
         both server and client dumps cache of current config to json file, though  it should only be used as abootstrap
+        :param changed_devices: ids of devices changed since last save (including removed ones), None if unknown
+        :param changed_folders: ids of folders changed since last save (including removed ones), None if unknown
+            these are only used by config store backend to write just the changed rows
         :return:
         """
         self.__log(1, 'saving configuration')
@@ -1636,12 +2159,39 @@ class SyncthingHandler(ServerComponent):
                 self.__log(4, 'presave check: server %s not in device list! skipping...' % srv)
                 self.__servers.remove(srv)
 
-        for fid in self.__folders:
+        partial_save = self.__configStore is not None and changed_devices is not None and changed_folders is not None
+        if partial_save:
+            # folders still listing removed devices must be cleaned and saved too, store's membership index tells which
+            changed_folders = set(changed_folders)
+            for did in changed_devices:
+                if did not in self.__devices:
+                    changed_folders.update(self.__configStore.device_folder_ids(did))
+        for fid in (changed_folders if partial_save else self.__folders):
+            if fid not in self.__folders:
+                continue
             for dev in tuple(self.__folders[fid].devices()):
                 if dev not in self.__devices:
                     self.__log(4, 'presave check: folder device %s is not part of device list. skipping...' % dev)
                     self.__folders[fid].remove_device(dev)
 
+        if self.__configStore is not None:
+            synced_changed = self.__update_configStore(changed_devices, changed_folders)
+            if self._isServer():
+                configPath = os.path.join(self.get_config_folder().path(), 'configuration', 'config.cfg')
+                # syncthing syncs whole files, so when synced part changes config.cfg is still regenerated in full, though from stored rows
+                if synced_changed or not os.path.exists(configPath):
+                    os.makedirs(os.path.dirname(configPath), exist_ok=True)
+                    with lance_utils.atomic_write(configPath, fsync=self.config_fsync) as f:
+                        f.write(self.__configStore.generate_config_text())
+            if save_st_config:
+                self.__save_st_config()
+            if self._isServer() and self.syncthing_running():
+                try:
+                    self.__post('/rest/db/scan', folder=self.get_config_folder().fid())
+                except requester.HTTPError as e:
+                    self.__log(4, 'rescan server config folder had an error: code=%d: %s. %s' % (e.code, e.reason, e.msg))
+            return
+
         #try:
         #with SyncthingHandler.SyncthingPauseLock(self, self.__servers):
         #if self.syncthing_running():
@@ -1714,9 +2264,10 @@ class SyncthingHandler(ServerComponent):
             # for fname in listdir(_ignpath):
             #     if fname not in self.__ignoreDevices:
             #         remove(os.path.join(_ignpath, fname))
-            self.__log(1, 'saving config: %s' % json.dumps(configdict))
-            with open(os.path.join(configFoldPath, 'config.cfg'), 'w') as f:
-                json.dump(configdict, f, indent=4)
+            configtext = jsoncodec.dumps(configdict, compact=True)
+            self.__log.fmt(0, 'saving config: %s', configtext)
+            with lance_utils.atomic_write(os.path.join(configFoldPath, 'config.cfg'), fsync=self.config_fsync) as f:
+                f.write(configtext)
 
         if save_st_config:
             self.__save_st_config()
@@ -1738,7 +2289,7 @@ class SyncthingHandler(ServerComponent):
         self.__log(1, 'saving st configuration with http request')
         config = self.__get('/rest/system/config')
 
-        self.__log(1, json.dumps(config))
+        self.__log.fmt(0, '%s', jsoncodec.dumps(config, compact=True))  # config is changed below
         folders_dict = {x['id']: x for x in config.get('folders', [])}
         all_folders = set()
         devices_dict = {x['deviceID']: x for x in config.get('devices', [])}
@@ -1878,8 +2429,8 @@ class SyncthingHandler(ServerComponent):
 
         config.get('options', {}).update({'listenAddress': self.syncthing_listenaddr})
 
-        self.__log(1, 'sending config:')
-        self.__log(1, json.dumps(config))
+        self.__log(1, 'sending config')
+        self.__log.fmt(0, '%s', jsoncodec.dumps(config, compact=True))
         try:
             self.__post('/rest/system/config', config)
             if not self.__get('/rest/system/config/insync').get('configInSync', False):
@@ -2032,9 +2583,9 @@ class SyncthingHandler(ServerComponent):
         dorestartst = self.syncthing_running()
         if dorestartst:
             self.__stop_syncthing()
-        with open(st_conffile, 'w') as f:
+        with lance_utils.atomic_write(st_conffile, fsync=self.config_fsync) as f:
             f.write(conftext)
-        self.__log(1, conftext)
+        self.__log(0, conftext)
         if dorestartst:
             self.__start_syncthing()
         #TODO: IMPROVE: its faster to get-modify-post config, but that config is in json format, and file is in xml... ffs
@@ -2046,7 +2597,10 @@ class SyncthingHandler(ServerComponent):
         self.__log(1, 'starting syncthing process...')
         if not self.syncthing_proc or self.syncthing_proc.poll() is not None:
             self._last_event_id = 0
-            self.syncthing_proc = subprocess.Popen([self.syncthing_bin, '-home={home}'.format(home=self.config_root), '-no-browser', '-no-restart', '-gui-address={addr}:{port}'.format(addr=self.syncthing_gui_ip, port=self.syncthing_gui_port)], stdout=sys.stdout, stderr=sys.stderr)
+            self.__eventSource = None
+            self.__syncthingReady.clear()
+            self.syncthing_proc = self.__launcher().start(self.config_root, '%s:%d' % (self.syncthing_gui_ip, self.syncthing_gui_port))
+            self.__supervisor.started(self.syncthing_proc)
             self.__log(1, 'syncthing started')
             return True
         self.__log(1, 'syncthing was not running')
@@ -2054,10 +2608,13 @@ class SyncthingHandler(ServerComponent):
 
     def __stop_syncthing(self):
         self.__log(1, 'stopping syncthing process...')
-        if self.syncthing_proc:
-            self.syncthing_proc.terminate()
-            self.syncthing_proc.wait()
+        proc = self.syncthing_proc  # may be stopped from both stop() and handler's thread
+        if proc:
+            proc.terminate()
+            proc.wait()
             self.syncthing_proc = None
+            self.__syncthingReady.clear()
+            self.__supervisor.stopped()
             self.__log(1, 'syncthing stopped')
             return True
         self.__log(1, 'syncthing was not running')
@@ -2096,29 +2653,77 @@ class SyncthingHandler(ServerComponent):
     def syncthing_running(self):
         return self.syncthing_proc is not None and self.syncthing_proc.poll() is None
 
+    def __wait_syncthing_ready(self):
+        """
+        block till syncthing rest api answers a ping
+        first caller probes with exponential backoff starting from a few milliseconds,
+        everyone else just waits for it to finish
+        :raises SyncthingNotReadyError: if syncthing exited or did not come up in syncthing_ready_timeout
+        """
+        if self.__syncthingReady.is_set():
+            return
+        with self.__syncthingReadyLock:
+            if self.__syncthingReady.is_set():  # someone has probed while we were waiting for the lock
+                return
+            proc = self.syncthing_proc
+            starttime = time.time()
+            delay = 0.005
+            req = requester.Request("http://%s:%d/rest/system/ping" % (self.syncthing_gui_ip, self.syncthing_gui_port), headers=self.httpheaders)
+            backoff = metrics.histogram('lance_syncthing_ready_backoff_seconds', {'component': self._metricsName})  # one observation per failed probe
+            while True:
+                if proc is None or proc.poll() is not None:
+                    raise SyncthingNotReadyError()
+                try:
+                    requester.urlopen(req, timeout=5).read()
+                    break
+                except requester.HTTPError:  # it answers, just not what we want, waiting won't help
+                    raise
+                except (OSError, http.client.HTTPException) as e:  # URLError is an OSError too
+                    # refused, reset, timed out and such - starting syncthing may do any of that
+                    self.__log.fmt(0, 'syncthing rest api is not ready yet: %r', e)
+                if time.time() - starttime > self.syncthing_ready_timeout:
+                    raise SyncthingNotReadyError()
+                backoff.observe(delay)
+                time.sleep(delay)
+                delay = min(delay * 2, 0.5)
+            metrics.histogram('lance_syncthing_ready_seconds', {'component': self._metricsName}).observe(time.time() - starttime)
+            self.__log.fmt(1, 'syncthing rest api is ready after %.3fs', time.time() - starttime)
+            self.__syncthingReady.set()
+
+    def __urlopen(self, req):
+        for _ in range(3):
+            self.__wait_syncthing_ready()
+            try:
+                return requester.urlopen(req, timeout=self.syncthing_rest_timeout)
+            except requester.HTTPError:
+                raise
+            except requester.URLError as e:
+                # syncthing was ready, but now fails to connect, so it may be restarting. probe again before next request
+                self.__syncthingReady.clear()
+                if not isinstance(e.reason, ConnectionRefusedError):  # request might have reached syncthing, not safe to repeat
+                    raise
+        raise SyncthingNotReadyError()
+
     def __get(self, path, **kwargs):
         if self.syncthing_proc is None or self.syncthing_proc.poll() is not None:
             raise SyncthingNotReadyError()
         url = "http://%s:%d%s" % (self.syncthing_gui_ip, self.syncthing_gui_port, path)
         if len(kwargs) > 0:
             url += '?' + '&'.join(['%s=%s' % (k, str(kwargs[k])) for k in kwargs.keys()])
-        self.__log(0, "getting %s" % url)
-        self.__log(0, self.httpheaders)
+        self.__log.fmt(0, "getting %s", url)
         req = requester.Request(url, headers=self.httpheaders)
-        for _ in range(32):  # 32 attempts
-            try:
-                rep = requester.urlopen(req)
-                break
-            except requester.URLError as e:
-                if not isinstance(e.reason, ConnectionRefusedError):
-                    raise
-                # assume syncthing is not yet ready
-                if self.syncthing_proc.poll() is not None:
-                    raise SyncthingNotReadyError()
-                time.sleep(1)
-        else:
-            raise SyncthingNotReadyError()
-        data = json.loads(rep.read().decode('utf-8'))
+        labels = {'component': self._metricsName, 'method': 'GET', 'path': path}
+        starttime = time.time()
+        try:
+            rep = self.__urlopen(req)
+            data = jsoncodec.loads(rep.read())
+            if self.__restRecorder is not None:
+                self.__restRecorder.record('GET', path, kwargs, data)
+        except Exception:
+            metrics.counter('lance_syncthing_rest_errors_total', labels).inc()
+            raise
+        finally:
+            metrics.histogram('lance_syncthing_rest_seconds', labels).observe(time.time() - starttime)
         return data
 
     def __post(self, path, data=None, **kwargs):
@@ -2127,25 +2732,57 @@ class SyncthingHandler(ServerComponent):
         url = "http://%s:%d%s" % (self.syncthing_gui_ip, self.syncthing_gui_port, path)
         if len(kwargs) > 0:
             url += '?' + '&'.join(['%s=%s' % (k, str(kwargs[k])) for k in kwargs.keys()])
-        self.__log(0, "posting %s with data %s" % (url, repr(data)))
-        req = requester.Request(url, None if data is None else json.dumps(data).encode('utf-8'), headers=self.httpheaders)
+        self.__log.fmt(0, "posting %s with data %r", url, data)
+        req = requester.Request(url, None if data is None else jsoncodec.dumps(data, compact=True).encode('utf-8'), headers=self.httpheaders)
         req.get_method = lambda: 'POST'
-        for _ in range(32):  # 32 attempts
-            try:
-                rep = requester.urlopen(req)
-                break
-            except requester.URLError as e:
-                if not isinstance(e.reason, ConnectionRefusedError):
-                    raise
-                # assume syncthing is not yet ready
-                if self.syncthing_proc.poll() is not None:
-                    raise SyncthingNotReadyError()
-                time.sleep(1)
-
-        else:
-            raise SyncthingNotReadyError()
+        labels = {'component': self._metricsName, 'method': 'POST', 'path': path}
+        starttime = time.time()
+        try:
+            rep = self.__urlopen(req)
+            if self.__restRecorder is not None:
+                self.__restRecorder.record('POST', path, kwargs)
+        except Exception:
+            metrics.counter('lance_syncthing_rest_errors_total', labels).inc()
+            raise
+        finally:
+            metrics.histogram('lance_syncthing_rest_seconds', labels).observe(time.time() - starttime)
         return None  # json.loads(rep.read())
 
+    @async_method()
+    def start_rest_recording(self, path: str):
+        """
+        start recording syncthing events and other rest responses into a file, to replay them later with lance.restrecording
+        recording starts with a snapshot of current configuration
+        :param path: file to write, gzipped
+        """
+        if self.__restRecorder is not None:
+            self.__restRecorder.close()
+        configpath = os.path.join(self.get_config_folder().path(), 'configuration', 'config.cfg')
+        with open(configpath, 'r') as f:
+            configdict = jsoncodec.load(f)
+        header = {'myid': self.myId(),
+                  'apikey': self.__apikey,
+                  'server_secret': self.__server_secret,
+                  'servers': list(self.__servers),
+                  'devices': {did: dev.name() for did, dev in self.__devices.items()},
+                  'ignoredevices': list(self.__ignoreDevices),
+                  'config': configdict}
+        self.__restRecorder = RestRecorder(path, header)
+        self.__log(1, 'rest recording started to %s' % path)
+
+    @async_method()
+    def stop_rest_recording(self):
+        """
+        :return: number of records written
+        """
+        if self.__restRecorder is None:
+            return 0
+        self.__restRecorder.close()
+        count = self.__restRecorder.count()
+        self.__restRecorder = None
+        self.__log(1, 'rest recording stopped, %d records' % count)
+        return count
+
     @async_method()
     def get(self, path, **kwargs):
         return self.__get(path, **kwargs)
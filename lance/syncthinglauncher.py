@@ -0,0 +1,87 @@
+import os
+import sys
+import base64
+import hashlib
+import subprocess
+
+from typing import Optional
+
+_luhn_alphabet = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ234567'
+
+
+def _luhn32(s: str) -> str:
+    factor = 1
+    total = 0
+    for c in s:
+        addend = factor * _luhn_alphabet.index(c)
+        factor = 1 if factor == 2 else 2
+        total += addend // 32 + addend % 32
+    return _luhn_alphabet[(32 - total % 32) % 32]
+
+
+def device_id_from_digest(digest: bytes) -> str:
+    """
+    format sha256 of device certificate the way syncthing does:
+    base32, luhn check char after every 13 chars, then groups of 7 joined with dashes
+    """
+    s = base64.b32encode(digest).decode('ascii').rstrip('=')
+    s = ''.join(s[i:i + 13] + _luhn32(s[i:i + 13]) for i in range(0, len(s), 13))
+    return '-'.join(s[i:i + 7] for i in range(0, len(s), 7))
+
+
+def device_id_from_certificate(certpath: str) -> Optional[str]:
+    """
+    device id is just sha256 of DER certificate, so no need to ask syncthing for it
+    :return: device id, None if there is no certificate in certpath
+    """
+    try:
+        with open(certpath, 'r') as f:
+            pem = f.read()
+    except FileNotFoundError:
+        return None
+    start = pem.find('-----BEGIN CERTIFICATE-----')
+    end = pem.find('-----END CERTIFICATE-----')
+    if start < 0 or end < start:
+        raise ValueError('no certificate found in %s' % certpath)
+    der = base64.b64decode(''.join(pem[start + len('-----BEGIN CERTIFICATE-----'):end].split()))
+    return device_id_from_digest(hashlib.sha256(der).digest())
+
+
+class SyncthingLauncher:
+    """
+    everything syncthing handler needs from syncthing besides REST api: keys generation, device id and the process itself
+    default one runs syncthing binary, replace it to run syncthing some other way, or not run it at all
+    """
+    def __init__(self, binary: str = 'syncthing'):
+        self.binary = binary
+
+    def device_id(self, home: str) -> Optional[str]:
+        """
+        :return: device id of syncthing configuration in home, None if there is no configuration there yet
+        """
+        try:
+            return device_id_from_certificate(os.path.join(home, 'cert.pem'))
+        except ValueError:  # let syncthing figure it out
+            pass
+        proc = subprocess.Popen([self.binary, '-home={home}'.format(home=home), '-no-browser', '-no-restart', '-device-id'], stdout=subprocess.PIPE)
+        res = proc.communicate()[0]
+        if proc.wait() != 0:
+            return None
+        if res.endswith(b'\n'):
+            res = res[:-1]
+        return res.decode()
+
+    def generate(self, home: str) -> bool:
+        """
+        generate keys and default configuration in home
+        :return: True on success
+        """
+        proc = subprocess.Popen([self.binary, '-generate={home}'.format(home=home)], stdout=sys.stdout, stderr=sys.stderr)
+        return proc.wait() == 0
+
+    def start(self, home: str, gui_address: str):
+        """
+        start syncthing with configuration from home, serving rest api on gui_address
+        :return: process-like object with poll(), terminate() and wait()
+        """
+        return subprocess.Popen([self.binary, '-home={home}'.format(home=home), '-no-browser', '-no-restart', '-gui-address={addr}'.format(addr=gui_address)], stdout=sys.stdout, stderr=sys.stderr)
@@ -0,0 +1,106 @@
+import time
+import collections
+
+from . import metrics
+
+from typing import Optional, Deque
+
+
+class SyncthingSupervisor:
+    """
+    keeps track of syncthing process health for syncthing handler and decides when it should be restarted
+    handler does the actual starting and stopping, and tells supervisor about it
+
+    syncthing is considered dead when it's process exited without handler stopping it,
+    or when rest api failed max_liveness_failures times in a row while process is still there
+    restarts are limited to max_restarts within restart_window seconds, so crash-looping syncthing is left alone
+    restarts requested through rest api (syncthing exits with RESTART_EXIT_CODE cuz we run it with -no-restart) do not count
+    """
+    RESTART_EXIT_CODE = 3
+
+    def __init__(self, component: str, max_restarts: int = 5, restart_window: float = 600, max_liveness_failures: int = 5):
+        self.max_restarts = max_restarts
+        self.restart_window = restart_window
+        self.max_liveness_failures = max_liveness_failures
+        self.__component = component
+        self.__proc = None
+        self.__starttime = None  # type: Optional[float]
+        self.__restarttimes = collections.deque()  # type: Deque[float]
+        self.__liveness_failures = 0
+        self.__restarts = 0
+        self.__crashes = 0
+        self.__gaveup = False
+
+    def started(self, proc):
+        """
+        handler has started syncthing process proc
+        """
+        self.__proc = proc
+        self.__starttime = time.time()
+        self.__liveness_failures = 0
+        metrics.gauge('lance_syncthing_up', {'component': self.__component}).set(1)
+
+    def stopped(self):
+        """
+        handler has stopped syncthing on purpose
+        """
+        self.__proc = None
+        self.__starttime = None
+        metrics.gauge('lance_syncthing_up', {'component': self.__component}).set(0)
+
+    def check_process(self, proc) -> Optional[str]:
+        """
+        :return: None if proc is fine, otherwise the reason it needs a restart. every dead process is reported only once
+        """
+        if proc is None or proc is not self.__proc:
+            return None
+        code = proc.poll()
+        if code is None:
+            metrics.gauge('lance_syncthing_uptime_seconds', {'component': self.__component}).set(self.uptime())
+            return None
+        self.stopped()
+        if code == self.RESTART_EXIT_CODE:
+            return 'restart requested'
+        self.__crashes += 1
+        metrics.counter('lance_syncthing_crashes_total', {'component': self.__component}).inc()
+        return 'exited with code %s' % code
+
+    def rest_succeeded(self):
+        self.__liveness_failures = 0
+
+    def rest_failed(self) -> bool:
+        """
+        :return: True if syncthing has failed to answer too many times and should be restarted
+        """
+        self.__liveness_failures += 1
+        return self.__proc is not None and self.__liveness_failures >= self.max_liveness_failures
+
+    def may_restart(self, reason: str) -> bool:
+        """
+        check restart budget, and count restart if it's allowed
+        """
+        if reason != 'restart requested':
+            now = time.time()
+            while len(self.__restarttimes) > 0 and now - self.__restarttimes[0] > self.restart_window:
+                self.__restarttimes.popleft()
+            if len(self.__restarttimes) >= self.max_restarts:
+                self.__gaveup = True
+                return False
+            self.__restarttimes.append(now)
+        self.__gaveup = False
+        self.__restarts += 1
+        metrics.counter('lance_syncthing_restarts_total', {'component': self.__component, 'reason': reason.split(' ', 1)[0]}).inc()
+        return True
+
+    def uptime(self) -> float:
+        if self.__starttime is None:
+            return 0.0
+        return time.time() - self.__starttime
+
+    def stats(self) -> dict:
+        return {'running': self.__proc is not None,
+                'uptime': self.uptime(),
+                'restarts': self.__restarts,
+                'crashes': self.__crashes,
+                'liveness_failures': self.__liveness_failures,
+                'gave_up': self.__gaveup}
@@ -0,0 +1,31 @@
+
+import os
+import importlib
+import inspect
+from benchbase import BenchBase
+
+
+benchClassList = []
+benchModuleList = []
+
+def rescanBenchmarks():
+	global benchClassList
+	global benchModuleList
+	global __all__
+	benchClassList = []
+	benchModuleList = []
+	files = [os.path.splitext(x)[0] for x in os.listdir(os.path.dirname(__file__)) if os.path.splitext(x)[1] == ".py" and x != "__init__.py"]
+	__all__ = files
+	for fn in files:
+		try:
+			newmodule = importlib.import_module(".".join((__name__, fn)))
+			importlib.reload(newmodule)
+		except Exception as e:
+			print("failed to load benchmark file %s: %s" % (fn, repr(e)))
+			continue
+		benchModuleList.append(newmodule)
+		for name, obj in inspect.getmembers(newmodule):
+			if inspect.isclass(obj) and BenchBase in inspect.getmro(obj)[1:]:
+				benchClassList.append(obj)
+
+rescanBenchmarks()
\ No newline at end of file
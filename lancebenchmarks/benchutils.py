@@ -0,0 +1,54 @@
+import os
+import time
+
+from lance.server import Server
+from lance.fakesyncthing import FakeSyncthing, random_device_id
+from lance.profiling import AsyncMethodProfiler
+
+
+def profile_into(recorder, prefix: str) -> AsyncMethodProfiler:
+    """
+    profiler that records queue wait and run time of every async method call as separate operations
+    end-to-end call latency alone is dominated by whatever the thread was busy with when call was queued
+    """
+    def _record(call):
+        recorder.sample('%s.%s run' % (prefix, call.method), call.run_time)
+        recorder.sample('%s.%s wait' % (prefix, call.method), call.wait_time)
+    return AsyncMethodProfiler(slow_threshold=0, keep_slow_calls=0, report=_record)
+
+
+def make_server(rootpath: str, name: str, start: bool = True, recorder=None):
+    """
+    server running against fake syncthing, registered as a server of itself
+    :param recorder: if given - syncthing handler's async methods are profiled into it
+    :return: (server, fake syncthing)
+    """
+    fake = FakeSyncthing()
+    srv = Server(os.path.join(rootpath, name, 'config'), os.path.join(rootpath, name, 'data'), syncthing_launcher=fake)
+    if recorder is not None:
+        srv.syncthingHandler.set_profiler(profile_into(recorder, 'sth'))
+    srv.syncthingHandler.set_server_secret('benchsecret').result()
+    srv.syncthingHandler.add_server(srv.syncthingHandler.myId()).result()
+    if start:
+        srv.start()
+        wait_for(lambda: any(path == '/rest/db/file' for _, path, _ in fake.requests()), 30)
+    return srv, fake
+
+
+def device_ids(count: int):
+    return [random_device_id() for _ in range(count)]
+
+
+def wait_for(condition, timeout: float, interval: float = 0.01):
+    starttime = time.time()
+    while not condition():
+        if time.time() - starttime > timeout:
+            raise RuntimeError('condition not met in %g seconds' % timeout)
+        time.sleep(interval)
+
+
+def wait_events_consumed(fake: FakeSyncthing, last_event_id: int, timeout: float = 120):
+    """
+    wait till handler polls events past given id, meaning everything before it was processed
+    """
+    wait_for(lambda: any(path == '/rest/events' and int(query.get('since', 0)) >= last_event_id for _, path, query in fake.requests()[-8:]), timeout)
@@ -0,0 +1,42 @@
+import os
+
+from benchbase import BenchBase
+from lancebenchmarks.benchutils import make_server, device_ids, wait_for, profile_into
+
+
+class PM_UserScalingBench(BenchBase):
+    """
+    ProjectManager user and shot management with K users per project
+    """
+    params = {'small': [{'users': 5, 'shots': 5}, {'users': 20, 'shots': 10}],
+              'medium': [{'users': 50, 'shots': 50}],
+              'large': [{'users': 200, 'shots': 200}]}
+
+    def benchBody(self, recorder, users, shots):
+        srv, fake = make_server(self.bench_root_path(), 'srv', recorder=recorder)
+        try:
+            dids = device_ids(users)
+            for did in dids:
+                srv.syncthingHandler.add_device(did).result()
+            srv.add_project('benchproject').result()
+            wait_for(lambda: 'benchproject' in srv.projectManagers, 60)
+            pm = srv.projectManagers['benchproject']
+            pm.set_profiler(profile_into(recorder, 'pm'))
+
+            for i in range(shots):
+                shotpath = os.path.join(self.bench_root_path(), 'shots', 'shot%d' % i)
+                os.makedirs(shotpath)
+                with recorder.measure('add_shot'):
+                    pm.add_shot('shot %d' % i, 'shot%d' % i, shotpath).result()
+            wait_for(lambda: len(pm.get_shots().result()) == shots, 60)
+
+            shotparts = [('shot%d' % i, 'main') for i in range(shots)]
+            for i, did in enumerate(dids):
+                with recorder.measure('add_user'):
+                    pm.add_user('user%d' % i, 'user %d' % i, [did], shotparts[i % shots:] + shotparts[:i % shots][:3]).result()
+
+            for _ in range(5):
+                with recorder.measure('rescan_configuration'):
+                    pm.rescan_configuration().result()
+        finally:
+            srv.stop()
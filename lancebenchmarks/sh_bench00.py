@@ -0,0 +1,82 @@
+import os
+import random
+
+from benchbase import BenchBase
+from lancebenchmarks.benchutils import make_server, device_ids, wait_events_consumed
+
+
+class SH_DeviceFolderScalingBench(BenchBase):
+    """
+    SyncthingHandler config changes with N devices and M folders
+    """
+    params = {'small': [{'devices': 10, 'folders': 10}, {'devices': 50, 'folders': 20}],
+              'medium': [{'devices': 50, 'folders': 50}, {'devices': 200, 'folders': 100}],
+              'large': [{'devices': 200, 'folders': 200}, {'devices': 1000, 'folders': 500}]}
+
+    def benchBody(self, recorder, devices, folders):
+        srv, fake = make_server(self.bench_root_path(), 'srv', recorder=recorder)
+        sth = srv.syncthingHandler
+        try:
+            dids = device_ids(devices)
+            for did in dids:
+                with recorder.measure('add_device'):
+                    sth.add_device(did).result()
+
+            fids = []
+            for i in range(folders):
+                fpath = os.path.join(self.bench_root_path(), 'folders', 'folder%d' % i)
+                os.makedirs(fpath)
+                with recorder.measure('add_folder'):
+                    fids.append(sth.add_folder(fpath, 'folder %d' % i).result())
+
+            rnd = random.Random(devices * 1000 + folders)
+            for fid in fids:
+                subset = rnd.sample(dids, min(len(dids), 5))
+                with recorder.measure('set_folder_devices'):
+                    sth.set_folder_devices(fid, subset).result()
+
+            serverid = sth.myId()
+            for _ in range(5):
+                with recorder.measure('set_devices'):
+                    sth.set_devices([serverid] + rnd.sample(dids, len(dids) * 9 // 10)).result()
+                with recorder.measure('set_devices'):
+                    sth.set_devices([serverid] + dids).result()
+
+            for _ in range(10):
+                with recorder.measure('reload_configuration'):
+                    sth.reload_configuration().result()
+        finally:
+            srv.stop()
+
+
+class SH_EventProcessingBench(BenchBase):
+    """
+    SyncthingHandler syncthing event processing throughput with M folders
+    """
+    params = {'small': [{'folders': 10, 'events': 500}],
+              'medium': [{'folders': 100, 'events': 2000}],
+              'large': [{'folders': 500, 'events': 10000}]}
+
+    def benchBody(self, recorder, folders, events):
+        srv, fake = make_server(self.bench_root_path(), 'srv')
+        sth = srv.syncthingHandler
+        try:
+            fids = []
+            for i in range(folders):
+                fpath = os.path.join(self.bench_root_path(), 'folders', 'folder%d' % i)
+                os.makedirs(fpath)
+                fids.append(sth.add_folder(fpath, 'folder %d' % i).result())
+
+            rnd = random.Random(folders)
+            for kind in ('ItemStarted', 'FolderSummary'):
+                lastid = 0
+                with recorder.measure_batch('event_%s' % kind, events):
+                    for _ in range(events):
+                        fid = rnd.choice(fids)
+                        if kind == 'ItemStarted':
+                            lastid = fake.push_event(kind, {'folder': fid, 'item': 'file.txt', 'type': 'file', 'action': 'update'})
+                        else:
+                            lastid = fake.push_event(kind, {'folder': fid, 'summary': {'needTotalItems': 0, 'globalBytes': 0, 'state': 'idle'}})
+                    wait_events_consumed(fake, lastid)
+        finally:
+            srv.stop()
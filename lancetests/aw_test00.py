@@ -0,0 +1,58 @@
+import os
+import shutil
+import threading
+
+from lance.lance_utils import atomic_write
+from lance.syncthinghandler import listdir
+from testbase import TestBase
+
+
+class AW_AtomicWriteTest0(TestBase):
+    def testBody(self, logger):
+        root = os.path.join(self.test_root_path(), 'atomic_write')
+        if os.path.exists(root):
+            shutil.rmtree(root)
+        os.makedirs(root)
+        path = os.path.join(root, 'config.cfg')
+
+        logger.print('checking new file and replace')
+        for fsync in (True, False):
+            with atomic_write(path, fsync=fsync) as f:
+                f.write('{"a":1}')
+                assert not os.path.exists(path) or open(path).read() != '{"a":1}', 'target was written in place'
+                tmpnames = [x for x in os.listdir(root) if x != 'config.cfg']
+                assert len(tmpnames) == 1, tmpnames
+                assert list(listdir(root)) == [x for x in ('config.cfg',) if os.path.exists(path)], 'temp file is not ignored as syncthing temp'
+            assert open(path).read() == '{"a":1}'
+            assert os.listdir(root) == ['config.cfg'], os.listdir(root)
+            os.remove(path)
+
+        logger.print('checking failed write leaves file untouched')
+        with atomic_write(path) as f:
+            f.write('old')
+        try:
+            with atomic_write(path) as f:
+                f.write('half of the n')
+                raise RuntimeError('boom')
+        except RuntimeError:
+            pass
+        else:
+            raise AssertionError('exception was swallowed')
+        assert open(path).read() == 'old'
+        assert os.listdir(root) == ['config.cfg'], os.listdir(root)
+
+        logger.print('checking binary mode and concurrent writers')
+        def _write(data):
+            for _ in range(50):
+                with atomic_write(path, 'wb', fsync=False) as f:
+                    f.write(data)
+        threads = [threading.Thread(target=_write, args=(bytes([ord('a') + i]) * 4096,)) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        with open(path, 'rb') as f:
+            data = f.read()
+        assert len(data) == 4096 and len(set(data)) == 1, 'file got mixed writes'
+        assert os.listdir(root) == ['config.cfg'], os.listdir(root)
+        shutil.rmtree(root)
@@ -0,0 +1,97 @@
+import os
+import json
+import time
+import shutil
+
+from lance.configtrace import ConfigPropagationTracer, percentile
+from lance.server import Server
+from lance.fakesyncthing import FakeSyncthing, random_device_id
+from lance.restrecording import prepare_replay_root
+from testbase import TestBase
+
+
+class CT_PropagationTest0(TestBase):
+    def testBody(self, testlogger):
+        tracer = ConfigPropagationTracer(keep_generations=8)
+        for i in range(10):
+            gen = tracer.begin('DEV', 'hash%d' % i, written_time=100.0 * i)
+            tracer.mark('DEV', 'hash%d' % i, 'scanned', 100.0 * i + 0.5)
+            tracer.client_report('DEV', {'hash': 'hash%d' % i, 'received': 100.0 * i + 1 + i, 'applied': 100.0 * i + 2 + i})
+            tracer.mark('DEV', 'hash%d' % i, 'acked', 100.0 * i + 3 + i)
+            tracer.mark('DEV', 'hash%d' % i, 'acked', 100.0 * i + 50)  # second ack should not override first one
+        testlogger.print(repr(gen))
+        assert gen.generation == 10
+        assert len(tracer.generations('DEV')) == 8, 'old generations were not dropped'
+        assert tracer.mark('DEV', 'unknown hash', 'acked') is None
+
+        stats = tracer.percentiles()['DEV']
+        assert stats['scanned']['count'] == 8
+        assert stats['scanned']['p50'] == 0.5
+        assert stats['acked']['p50'] == 3 + 5, repr(stats['acked'])  # kept generations 2..9, ack latency 3 + i
+        assert stats['acked']['p99'] == 3 + 9, repr(stats['acked'])
+        assert stats['client_applied']['p90'] == 2 + 9, repr(stats['client_applied'])
+
+        tracer.forget_device('DEV')
+        assert tracer.percentiles() == {}
+        assert percentile([], 50) is None
+        assert percentile([1.0, 2.0, 3.0, 4.0], 50) == 2.0
+
+
+class CT_PropagationTest1(TestBase):
+    def testBody(self, testlogger):
+        serverfake = FakeSyncthing()
+        srv = Server(os.path.join(self.test_root_path(), 'srv', 'config'), os.path.join(self.test_root_path(), 'srv', 'data'), syncthing_launcher=serverfake)
+        clientid = random_device_id()
+        cln = None
+        try:
+            srvid = srv.syncthingHandler.myId()
+            srv.syncthingHandler.add_server(srvid).result()
+            srv.start()
+            srv.syncthingHandler.add_device(clientid, 'client').result()
+            stats = srv.syncthingHandler.get_config_propagation_stats([clientid]).result()[clientid]
+            assert stats['scanned']['count'] == 1, 'config save was not traced till scan: %s' % repr(stats)
+
+            testlogger.print('delivering config to the client')
+            # we play syncthing here, moving files between server and client
+            servercontrol = srv.syncthingHandler.get_config_folder(clientid)
+            with open(os.path.join(servercontrol.path(), 'configuration', 'config.cfg'), 'r') as f:
+                clientconfig = json.load(f)
+            with open(os.path.join(self.test_root_path(), 'srv', 'config', 'syncthinghandler_config.json'), 'r') as f:
+                secret = json.load(f)['server_secret']
+            clientdataroot = os.path.join(self.test_root_path(), 'cln', 'data')
+            prepare_replay_root({'myid': clientid,
+                                 'apikey': 'clientapikey',
+                                 'server_secret': secret,
+                                 'servers': [srvid],
+                                 'devices': {srvid: 'server'},
+                                 'ignoredevices': [],
+                                 'config': clientconfig},
+                                os.path.join(self.test_root_path(), 'cln', 'config'), clientdataroot)
+            receivedtime = time.time()
+            cln = Server(os.path.join(self.test_root_path(), 'cln', 'config'), clientdataroot, syncthing_launcher=FakeSyncthing(device_id=clientid))
+            cln.start()  # config sync is probed on syncthing startup, as if config arrived while we were away
+            tracepath = os.path.join(clientdataroot, 'control', clientid, 'config_sync', 'trace')
+
+            def _client_applied():
+                """waiting for client to apply config it got"""
+                with open(tracepath, 'r') as f:
+                    trace = json.load(f)
+                assert trace['received'] is not None and trace['received'] >= receivedtime, 'bad received time in %s' % repr(trace)
+                assert trace['applied'] >= trace['received']
+            testlogger.check(_client_applied, timeout=10)
+
+            testlogger.print('delivering client report to the server')
+            for item in ('trace', 'hash'):
+                shutil.copy(os.path.join(clientdataroot, 'control', clientid, 'config_sync', item), os.path.join(servercontrol.path(), 'config_sync', item))
+                serverfake.push_event('ItemFinished', {'folder': servercontrol.fid(), 'item': 'config_sync/%s' % item, 'type': 'file', 'action': 'update', 'error': None})
+
+            def _acked():
+                """waiting for server to trace config till acked"""
+                stats = srv.syncthingHandler.get_config_propagation_stats([clientid]).result()[clientid]
+                for stage in ('scanned', 'client_received', 'client_applied', 'acked'):
+                    assert stats[stage]['count'] == 1, '%s: %s' % (stage, repr(stats))
+            testlogger.check(_acked, timeout=10)
+        finally:
+            srv.stop()
+            if cln is not None:
+                cln.stop()
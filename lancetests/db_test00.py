@@ -0,0 +1,85 @@
+import os
+import json
+
+from lance.databasehandler import SyncthingConfigStore
+from lance.fakesyncthing import random_device_id
+from testbase import TestBase
+
+
+class DB_ConfigStoreTest0(TestBase):
+    def testBody(self, logger):
+        store = SyncthingConfigStore(os.path.join(self.test_root_path(), 'config.sqlite3'))
+        try:
+            assert not store.has_bootstrap(), 'fresh store must have no bootstrap'
+
+            def _devdict(did, name=None):
+                return {'id': did, 'name': name, 'added_at': 1.0, 'delete_on_sync_after': None}
+
+            def _folddict(fid, devs):
+                return {'devices': list(devs), 'attribs': {'fid': fid, 'label': 'label %s' % fid, 'path': None}, 'metadata': {}}
+
+            logger.print('filling store')
+            store.update(meta={'apikey': 'key', 'server_secret': 'secret'},
+                         servers=['srv'],
+                         ignoredevices=[],
+                         devices={'srv': _devdict('srv'), 'dev0': _devdict('dev0'), 'dev1': _devdict('dev1', 'one')},
+                         folders={'f0': ('/local/f0', _folddict('f0', ['dev0'])), 'f1': ('/local/f1', _folddict('f1', ['dev0', 'dev1']))},
+                         replace_all=True)
+
+            bootstrap = store.load_bootstrap()
+            assert bootstrap['apikey'] == 'key' and bootstrap['server_secret'] == 'secret', 'meta mismatch %s' % repr(bootstrap)
+            assert bootstrap['servers'] == ['srv'], 'servers mismatch %s' % repr(bootstrap['servers'])
+            assert bootstrap['folders']['f1']['attribs']['path'] == '/local/f1', 'local path was not stored'
+
+            logger.print('checking partial update')
+            store.update(meta={}, servers=['srv'], ignoredevices=['bad'],
+                         devices={'dev1': None},
+                         folders={'f1': ('/local/f1', _folddict('f1', ['dev0'])), 'f0': None})
+
+            config = json.loads(store.generate_config_text())
+            assert sorted(x['id'] for x in config['devices']) == ['dev0', 'srv'], 'devices mismatch %s' % repr(config['devices'])
+            assert [x['attribs']['fid'] for x in config['folders']] == ['f1'], 'folders mismatch %s' % repr(config['folders'])
+            assert config['folders'][0]['devices'] == ['dev0'], 'folder devices were not updated'
+            assert config['folders'][0]['attribs']['path'] is None, 'local path leaked into synced config'
+            assert config['ignoredevices'] == ['bad']
+            assert store.load_bootstrap()['apikey'] == 'key', 'meta must survive partial updates'
+
+            logger.print('checking folder membership index')
+            assert store.device_folder_ids('dev0') == {'f1'}, store.device_folder_ids('dev0')
+            assert store.device_folder_ids('dev1') == set(), 'membership of updated folder was not replaced'
+            store.update(meta={}, servers=['srv'], ignoredevices=['bad'], devices={}, folders={'f0': ('/local/f0', _folddict('f0', ['dev0', 'srv']))})
+            assert store.device_folder_ids('dev0') == {'f0', 'f1'} and store.device_folder_ids('srv') == {'f0'}
+            store.update(meta={}, servers=['srv'], ignoredevices=['bad'], devices={}, folders={'f0': None})
+            assert store.device_folder_ids('dev0') == {'f1'} and store.device_folder_ids('srv') == set(), 'membership of removed folder was kept'
+
+            logger.print('checking change detection')
+            assert not store.update(meta={'apikey': 'key2'}, servers=['srv'], ignoredevices=['bad'],
+                                    devices={'dev0': _devdict('dev0'), 'dev1': None},
+                                    folders={'f1': ('/local/f1', _folddict('f1', ['dev0'])), 'f0': None}), 'same rows reported as changed'
+            assert store.load_bootstrap()['apikey'] == 'key2', 'meta was not updated'
+            assert not store.update(meta={}, servers=['srv'], ignoredevices=['bad'], devices={}, folders={'f1': ('/other/f1', _folddict('f1', ['dev0']))}), 'local path is not synced'
+            assert store.load_bootstrap()['folders']['f1']['attribs']['path'] == '/other/f1', 'local path was not updated'
+            assert store.update(meta={}, servers=['srv', 'dev0'], ignoredevices=['bad'], devices={}, folders={}), 'server change was missed'
+            assert store.update(meta={}, servers=['srv', 'dev0'], ignoredevices=[], devices={}, folders={}), 'ignored devices change was missed'
+            assert store.update(meta={}, servers=['srv', 'dev0'], ignoredevices=[], devices={'dev0': _devdict('dev0', 'zero')}, folders={}), 'device change was missed'
+            assert store.update(meta={}, servers=['srv', 'dev0'], ignoredevices=[], devices={}, folders={'f1': ('/other/f1', _folddict('f1', []))}), 'folder change was missed'
+            assert store.device_folder_ids('dev0') == set()
+        finally:
+            store.close()
+
+
+class DB_ConfigStoreTest1(TestBase):
+    def testBody(self, logger):
+        walpath = os.path.join(self.test_root_path(), 'srv', 'config', 'syncthinghandler_config.sqlite3-wal')
+        with self.fake_server(config_backend='sqlite') as (srv, _):
+            srv.start()
+            srv.syncthingHandler.add_device(random_device_id(), 'dev0').result()
+            assert os.path.exists(walpath), 'config store is not in use'
+        assert not srv.syncthingHandler.is_alive()
+        # sqlite removes write-ahead log when the last connection is closed
+        assert not os.path.exists(walpath), 'config store was not closed on stop'
+
+        logger.print('checking handler that was never started')
+        with self.fake_server(config_backend='sqlite'):
+            assert os.path.exists(walpath)
+        assert not os.path.exists(walpath), 'config store was not closed on stop'
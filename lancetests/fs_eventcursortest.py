@@ -0,0 +1,62 @@
+import os
+import time
+
+from lance.syncthinghandler import FoldersVolatileDataChangedEvent
+from lance.fakesyncthing import FakeSyncthing
+from testbase import TestBase
+
+
+class FS_EventCursorTest0(TestBase):
+    def testBody(self, logger):
+        fake = FakeSyncthing(persistent=True)  # outlives servers, like syncthing service would
+        fpath = os.path.join(self.test_root_path(), 'folder0')
+        os.makedirs(fpath)
+
+        def _polled_past(since, firstrequest):
+            def _assertion():
+                """waiting for handler to poll past last event"""
+                assert any(path == '/rest/events' and int(query['since']) >= since for _, path, query in fake.requests()[firstrequest:])
+            return _assertion
+
+        try:
+            # servers are stopped and joined on exit, so they do not poll after we push events
+            with self.fake_server(fake) as (srv, _):
+                fid = srv.syncthingHandler.add_folder(fpath, 'folder 0').result()
+                port = srv.syncthingHandler.syncthing_gui_port
+                srv.start()
+                logger.check(_polled_past(fake.last_event_id(), 0), timeout=10)
+            lastseen = fake.last_event_id()
+
+            logger.print('checking restarted server does not get old events again')
+            fake.push_event('Ping')
+            firstrequest = len(fake.requests())
+            with self.fake_server(fake) as (srv, _):
+                srv.syncthingHandler.syncthing_gui_port = port
+                srv.start()
+                logger.check(_polled_past(lastseen + 1, firstrequest), timeout=10)
+                sinces = [int(query['since']) for _, path, query in fake.requests()[firstrequest:] if path == '/rest/events']
+                assert min(sinces) == lastseen, 'events were not resumed from %d: %s' % (lastseen, sinces)
+
+                def _config_synced():
+                    """waiting for config sync status to be probed without StartupComplete"""
+                    assert srv.syncthingHandler.config_synced()
+                logger.check(_config_synced, timeout=10)
+
+            logger.print('checking dropped events make server resync from status')
+            fake.set_folder_status(fid, needTotalItems=3, state='syncing')
+            fake.set_folder_stats(fid, last_file=time.time())  # pulled something while server was away
+            for _ in range(5):
+                fake.push_event('Ping')
+            fake.drop_events(keep=1)
+            firstrequest = len(fake.requests())
+            with self.fake_server(fake) as (srv, _):
+                srv.syncthingHandler.syncthing_gui_port = port
+                srv.start()
+
+                def _resynced():
+                    """waiting for folder status to be resynced"""
+                    assert srv.syncthingHandler.get_folders().result()[fid].volatile_data().get('summary', {}).get('needTotalItems') == 3
+                logger.check_events(_resynced, (srv,), (FoldersVolatileDataChangedEvent,), timeout=10)
+                assert ('GET', '/rest/db/status', {'folder': fid}) in fake.requests()[firstrequest:]
+        finally:
+            fake.crash(0)
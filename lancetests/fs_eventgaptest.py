@@ -0,0 +1,118 @@
+import os
+import json
+import time
+
+from lance import metrics
+from lance.syncthinghandler import FoldersVolatileDataChangedEvent, DevicesVolatileDataChangedEvent
+from lance.fakesyncthing import random_device_id
+from testbase import TestBase
+
+
+class FS_EventGapTest0(TestBase):
+    def testBody(self, logger):
+        with self.fake_server() as (srv, fake):
+            waiter = TestBase.EventWaiter((FoldersVolatileDataChangedEvent, DevicesVolatileDataChangedEvent))
+            srv.eventQueueEater.add_event_processor(waiter)
+            did = random_device_id()
+            srv.syncthingHandler.add_device(did).result()
+            fids = []
+            for i in range(2):
+                fpath = os.path.join(self.test_root_path(), 'folder%d' % i)
+                os.makedirs(fpath)
+                fids.append(srv.syncthingHandler.add_folder(fpath, 'folder %d' % i).result())
+            srv.start()
+
+            def _settled():
+                """waiting for handler to configure syncthing and poll past all events"""
+                assert set(fids).issubset(x['id'] for x in fake.config()['folders'])
+                assert any(path == '/rest/events' and int(query['since']) >= fake.last_event_id() for _, path, query in fake.requests())
+            logger.check(_settled, timeout=10)
+            waiter.wait(0)
+
+            logger.print('losing events')
+            requestcount = len(fake.requests())
+            for fid in fids:
+                fake.set_folder_status(fid, needTotalItems=2, state='syncing')
+            fake.set_folder_stats(fids[0], last_file=time.time())  # only first folder pulled something in the gap
+            fake.set_connected(did, True, 'tcp://127.0.0.2:22000')
+            fake.lose_events(10)
+            fake.push_event('Ping')
+
+            def _resynced():
+                """waiting for lost state to be resynced"""
+                assert srv.syncthingHandler.get_devices().result()[did].volatile_data().connected()
+                assert srv.syncthingHandler.get_folders().result()[fids[0]].volatile_data().get('summary', {}).get('needTotalItems') == 2
+            logger.check_events(_resynced, (srv,), (DevicesVolatileDataChangedEvent,), timeout=10)
+
+            statuses = [query['folder'] for _, path, query in fake.requests()[requestcount:] if path == '/rest/db/status']
+            assert statuses == [fids[0]], 'resync was not targeted: %s' % repr(statuses)
+            assert srv.syncthingHandler.get_folders().result()[fids[1]].volatile_data().get('summary', {}).get('needTotalItems') != 2
+            events = []
+
+            def _reported():
+                """waiting for resync to be reported"""
+                events.extend(x for _, x in waiter.wait(0) if x.source() == 'syncthing::resync')
+                assert len(events) >= 2
+            logger.check(_reported, timeout=10)
+            assert [type(x) for x in events] == [FoldersVolatileDataChangedEvent, DevicesVolatileDataChangedEvent], events
+            assert [x.id() for x in events[0].folders()] == [fids[0]] and [x.id() for x in events[1].devices()] == [did], events
+
+            dropped = [x for x in metrics.snapshot()['lance_syncthing_dropped_events_total'] if x['labels']['component'] == srv.syncthingHandler._metricsName]
+            assert len(dropped) == 1 and dropped[0]['value'] == 10, json.dumps(dropped)
+
+
+class FS_EventGapTest1(TestBase):
+    def testBody(self, logger):
+        with self.fake_server() as (srv, fake):
+            waiter = TestBase.EventWaiter((FoldersVolatileDataChangedEvent,))
+            srv.eventQueueEater.add_event_processor(waiter)
+            srv.syncthingHandler.resync_batch_size = 1
+            srv.syncthingHandler.syncthing_rest_timeout = 0.5
+            fids = []
+            for i in range(3):
+                fpath = os.path.join(self.test_root_path(), 'folder%d' % i)
+                os.makedirs(fpath)
+                fids.append(srv.syncthingHandler.add_folder(fpath, 'folder %d' % i).result())
+            srv.start()
+
+            def _settled():
+                """waiting for handler to configure syncthing and poll past all events"""
+                assert set(fids).issubset(x['id'] for x in fake.config()['folders'])
+                assert any(path == '/rest/events' and int(query['since']) >= fake.last_event_id() for _, path, query in fake.requests())
+            logger.check(_settled, timeout=10)
+            waiter.wait(0)
+
+            logger.print('losing events while folder status hangs')
+            requestcount = len(fake.requests())
+            fake.set_latency(1, '/rest/db/status')
+            for fid in fids:
+                fake.set_folder_status(fid, needTotalItems=3, state='syncing')
+                fake.set_folder_stats(fid, last_scan=time.time())
+            fake.lose_events(10)
+            fake.push_event('Ping')
+
+            def _status_failed():
+                """waiting for resync to time out on folder status"""
+                assert any(path == '/rest/db/status' for _, path, _ in fake.requests()[requestcount:])
+            logger.check(_status_failed, timeout=10)
+
+            def _status_retried():
+                """waiting for resync to be retried after folder status timed out"""
+                assert sum(1 for _, path, _ in fake.requests()[requestcount:] if path == '/rest/db/status') > 1
+            logger.check(_status_retried, timeout=20)
+            assert srv.syncthingHandler.is_alive(), 'resync failure killed handler thread'
+            fake.set_latency(0, '/rest/db/status')
+
+            def _resynced():
+                """waiting for all folders to be resynced one by one"""
+                folders = srv.syncthingHandler.get_folders().result()
+                for fid in fids:
+                    assert folders[fid].volatile_data().get('summary', {}).get('needTotalItems') == 3, fid
+            logger.check(_resynced, timeout=20)
+
+            events = waiter.wait(10)
+            events += waiter.wait(0.5)  # no more resync batches should follow
+            events = [x for _, x in events if x.source() == 'syncthing::resync']
+            assert len(events) == 1, 'resync was not reported in one batch: %s' % repr(events)
+            assert sorted(x.id() for x in events[0].folders()) == sorted(fids)
+            assert all(x.volatile_data().get('summary', {}).get('needTotalItems') == 3 for x in events[0].folders())
@@ -0,0 +1,89 @@
+import os
+
+from lance.syncthinghandler import ProjectsAddedEvent, ProjectsRemovedEvent, ConfigSyncChangedEvent
+from lance.fakesyncthing import random_device_id
+from testbase import TestBase
+
+
+class FS_ProjectIndexTest0(TestBase):
+    def testBody(self, logger):
+        with self.fake_server() as (srv, fake):
+            waiter = TestBase.EventWaiter((ProjectsAddedEvent, ProjectsRemovedEvent))
+            srv.eventQueueEater.add_event_processor(waiter)
+            prjmeta = {'__ProjectManager_data__': {'type': 'server.configuration', 'project': 'prj'}}
+            srv.start()
+
+            logger.print('adding project folders')
+            fids = []
+            for i in range(2):
+                fpath = os.path.join(self.test_root_path(), 'prj%d' % i)
+                os.makedirs(fpath)
+                fids.append(srv.syncthingHandler.add_folder(fpath, 'prj %d' % i, metadata=prjmeta).result())
+            events = waiter.wait(10)
+            events += waiter.wait(1)  # no more project events should follow
+            assert [(type(x), list(x.projects())) for _, x in events] == [(ProjectsAddedEvent, ['prj'])], events
+            assert srv.syncthingHandler.get_project_names().result() == {'prj'}
+
+            def _manager_started():
+                """waiting for project manager to be created"""
+                assert 'prj' in srv.projectManagers and srv.projectManagers['prj'].is_alive()
+            logger.check(_manager_started, timeout=10)
+            pm = srv.projectManagers['prj']
+
+            logger.print('removing project folders')
+            srv.syncthingHandler.remove_folder(fids[0]).result()
+            assert srv.syncthingHandler.get_project_names().result() == {'prj'}, 'project removed while it still has folders'
+            assert waiter.wait(1) == [], 'project event with no project change'
+            srv.syncthingHandler.remove_folder(fids[1]).result()
+            events = waiter.wait(10)
+            assert [(type(x), list(x.projects())) for _, x in events] == [(ProjectsRemovedEvent, ['prj'])], events
+            assert srv.syncthingHandler.get_project_names().result() == set()
+
+            def _manager_stopped():
+                """waiting for project manager to be stopped"""
+                assert 'prj' not in srv.projectManagers
+                assert not pm.is_alive()
+            logger.check(_manager_stopped, timeout=10)
+
+
+class FS_ProjectIndexTest1(TestBase):
+    def testBody(self, logger):
+        prjmeta = {'__ProjectManager_data__': {'type': 'server.configuration', 'project': 'prj'}}
+        with self.fake_server() as (srv, fake):
+            fpath = os.path.join(self.test_root_path(), 'prj0')
+            os.makedirs(fpath)
+            srv.syncthingHandler.add_folder(fpath, 'prj 0', metadata=prjmeta).result()
+            srv.syncthingHandler.add_server(random_device_id()).result()  # not the only server anymore, so config sync is checked on load
+            configfid = srv.syncthingHandler.get_config_folder().fid()
+
+        logger.print('checking projects are not announced while config is not in sync')
+        fake.set_file(configfid, 'configuration/config.cfg', local_version=['fake:1'], global_version=['fake:2'])
+        with self.fake_server(fake) as (srv, _):
+            waiter = TestBase.EventWaiter((ProjectsAddedEvent, ConfigSyncChangedEvent))
+            srv.eventQueueEater.add_event_processor(waiter)
+            assert srv.syncthingHandler.get_project_names().result() == {'prj'}
+            firstrequest = len(fake.requests())
+            srv.start()
+
+            def _sync_probed():
+                """waiting for handler to probe config sync status and poll events after that"""
+                requests = fake.requests()[firstrequest:]
+                probes = [i for i, x in enumerate(requests) if x == ('GET', '/rest/db/file', {'folder': configfid, 'file': 'configuration/config.cfg'})]
+                assert len(probes) > 0 and any(path == '/rest/events' for _, path, _ in requests[probes[0] + 1:])
+            logger.check(_sync_probed, timeout=10)
+            events = waiter.wait(0)
+            assert not any(isinstance(x, ProjectsAddedEvent) for _, x in events), events
+            assert len(srv.projectManagers) == 0
+
+            logger.print('checking projects are announced once config is in sync')
+            fake.set_file(configfid, 'configuration/config.cfg', local_version=['fake:2'], global_version=['fake:2'])
+            fake.push_event('StartupComplete')
+
+            def _announced():
+                """waiting for project manager to be created after config sync"""
+                assert 'prj' in srv.projectManagers
+            logger.check(_announced, timeout=10)
+            events = [x for _, x in events + waiter.wait(0)]
+            synced = [i for i, x in enumerate(events) if isinstance(x, ConfigSyncChangedEvent) and x.in_sync()]
+            added = [i for i, x in enumerate(events) if isinstance(x, ProjectsAddedEvent)]
+            assert len(added) == 1 and len(synced) > 0 and synced[0] < added[0], events
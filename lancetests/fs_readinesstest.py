@@ -0,0 +1,89 @@
+import json
+import time
+import socket
+import struct
+import threading
+
+from lance import metrics
+from lance.syncthinghandler import ConfigSyncChangedEvent
+from lance.fakesyncthing import FakeSyncthing
+from testbase import TestBase
+
+
+def _ready_metrics(srv):
+    snap = metrics.snapshot()
+    ready = [x for x in snap['lance_syncthing_ready_seconds'] if x['labels']['component'] == srv.syncthingHandler._metricsName]
+    backoff = [x for x in snap.get('lance_syncthing_ready_backoff_seconds', []) if x['labels']['component'] == srv.syncthingHandler._metricsName]
+    return ready, backoff
+
+
+def _check_backoff_schedule(backoff):
+    """
+    failed probes must sleep 5ms, 10ms, 20ms... capped at 0.5s - that is what makes cold start both quick and cheap
+    """
+    assert len(backoff) == 1 and backoff[0]['count'] > 0, 'readiness was not retried: %s' % json.dumps(backoff)
+    expected = sum(min(0.005 * 2 ** i, 0.5) for i in range(backoff[0]['count']))
+    assert abs(backoff[0]['sum'] - expected) < 1e-6, 'backoff schedule is off, slept %.3fs over %d probes, expected %.3fs' % (backoff[0]['sum'], backoff[0]['count'], expected)
+
+
+class FS_ReadinessTest0(TestBase):
+    def testBody(self, logger):
+        with self.fake_server(FakeSyncthing(startup_delay=0.3)) as (srv, fake):
+            srv.start()
+
+            def _started():
+                """waiting for handler to process StartupComplete event"""
+                assert ('GET', '/rest/db/file', {'folder': srv.syncthingHandler.get_config_folder().fid(), 'file': 'configuration/config.cfg'}) in fake.requests()
+            logger.check_events(_started, (srv,), (ConfigSyncChangedEvent,), timeout=10, max_interval=0.02)
+
+            ready, backoff = _ready_metrics(srv)
+            assert len(ready) == 1 and ready[0]['count'] == 1 and ready[0]['sum'] >= 0.3, 'readiness was not probed once: %s' % json.dumps(ready)
+            _check_backoff_schedule(backoff)
+
+
+class FS_ReadinessTest1(TestBase):
+    def testBody(self, logger):
+        with self.fake_server(FakeSyncthing(startup_delay=3.0)) as (srv, fake):
+            # something accepts connections on gui port while syncthing starts, but resets them right away
+            resetter = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            resetter.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            resetter.bind(('127.0.0.1', srv.syncthingHandler.syncthing_gui_port))
+            resetter.listen(16)
+            resetter.settimeout(0.05)
+            resets = []
+            stop_resetting = threading.Event()
+
+            def _reset_connections():
+                while not stop_resetting.is_set():
+                    try:
+                        conn, _ = resetter.accept()
+                    except socket.timeout:
+                        continue
+                    conn.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+                    conn.close()
+                    resets.append(time.time())
+                resetter.close()
+
+            resetthread = threading.Thread(target=_reset_connections)
+            resetthread.start()
+            try:
+                srv.start()
+
+                def _probed():
+                    """waiting for readiness probe to hit resetting socket"""
+                    assert len(resets) > 0
+                logger.check(_probed, timeout=10)
+            finally:
+                stop_resetting.set()
+                resetthread.join()
+            logger.print('%d connections were reset' % len(resets))
+
+            def _started():
+                """waiting for handler to process StartupComplete event"""
+                assert ('GET', '/rest/db/file', {'folder': srv.syncthingHandler.get_config_folder().fid(), 'file': 'configuration/config.cfg'}) in fake.requests()
+            logger.check_events(_started, (srv,), (ConfigSyncChangedEvent,), timeout=10, max_interval=0.02)
+            assert srv.syncthingHandler.is_alive()
+            ready, backoff = _ready_metrics(srv)
+            assert len(ready) == 1 and ready[0]['count'] == 1 and ready[0]['sum'] >= 3, 'readiness was not probed once: %s' % json.dumps(ready)
+            _check_backoff_schedule(backoff)
+            assert backoff[0]['count'] >= len(resets), 'connection resets were not retried as not ready: %d probes for %d resets' % (backoff[0]['count'], len(resets))
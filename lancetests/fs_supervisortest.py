@@ -0,0 +1,56 @@
+from lance.syncthingsupervisor import SyncthingSupervisor
+from testbase import TestBase
+
+
+class FS_SupervisorTest0(TestBase):
+    def testBody(self, logger):
+        with self.fake_server() as (srv, fake):
+            srv.start()
+            startupreq = ('GET', '/rest/db/file', {'folder': srv.syncthingHandler.get_config_folder().fid(), 'file': 'configuration/config.cfg'})
+
+            def _started():
+                """waiting for handler to process startup"""
+                assert fake.requests().count(startupreq) == 1
+            logger.check(_started, timeout=10)
+
+            logger.print('crashing syncthing')
+            fake.crash(1)
+
+            def _restarted():
+                """waiting for supervisor to restart syncthing"""
+                assert fake.requests().count(startupreq) == 2
+            logger.check(_restarted, timeout=10)
+            stats = srv.syncthingHandler.get_syncthing_supervisor_stats().result()
+            assert stats['running'] and stats['restarts'] == 1 and stats['crashes'] == 1, stats
+
+            logger.print('checking restart requested through rest api does not count as a crash')
+            fake.crash(SyncthingSupervisor.RESTART_EXIT_CODE)
+
+            def _restarted_again():
+                """waiting for supervisor to restart syncthing"""
+                assert fake.requests().count(startupreq) == 3
+            logger.check(_restarted_again, timeout=10)
+            stats = srv.syncthingHandler.get_syncthing_supervisor_stats().result()
+            assert stats['restarts'] == 2 and stats['crashes'] == 1, stats
+
+        logger.print('checking restart budget')
+
+        class _Proc:
+            def __init__(self, code=None):
+                self.code = code
+
+            def poll(self):
+                return self.code
+
+        sup = SyncthingSupervisor('test', max_restarts=2, restart_window=60)
+        for i in range(3):
+            proc = _Proc()
+            sup.started(proc)
+            assert sup.check_process(proc) is None
+            proc.code = 1
+            reason = sup.check_process(proc)
+            assert reason == 'exited with code 1', reason
+            assert sup.check_process(proc) is None, 'dead process was reported twice'
+            assert sup.may_restart(reason) == (i < 2)
+        assert sup.stats()['gave_up']
+        assert sup.may_restart('restart requested'), 'requested restarts are limited by budget'
@@ -0,0 +1,67 @@
+import os
+import json
+import urllib.request
+import urllib.error
+
+from lance import metrics
+from lance.syncthinghandler import ProjectsAddedEvent
+from lance.fakesyncthing import FakeSyncthing
+from testbase import TestBase
+
+
+class FS_FakeSyncthingTest0(TestBase):
+    def testBody(self, logger):
+        with self.fake_server(FakeSyncthing(latency=0.05)) as (srv, fake):
+            assert fake.device_id(os.path.join(self.test_root_path(), 'srv', 'config')) == srv.syncthingHandler.myId()
+            srv.start()
+
+            def _started():
+                """waiting for handler to process startup"""
+                assert ('GET', '/rest/db/file', {'folder': srv.syncthingHandler.get_config_folder().fid(), 'file': 'configuration/config.cfg'}) in fake.requests()
+            logger.check(_started, timeout=10)
+
+            fpath = os.path.join(self.test_root_path(), 'folder0')
+            os.makedirs(fpath)
+            fid = srv.syncthingHandler.add_folder(fpath, 'folder 0').result()
+
+            def _configured():
+                """waiting for folder to be posted to syncthing"""
+                assert fid in [x['id'] for x in fake.config()['folders']]
+            logger.check(_configured, timeout=10)
+
+            logger.print('checking api key and unknown paths')
+            apikey = fake.config()['gui']['apikey']
+            try:
+                urllib.request.urlopen(fake.base_url() + '/rest/system/config')
+            except urllib.error.HTTPError as e:
+                assert e.code == 403
+            else:
+                raise AssertionError('request without api key was served')
+            req = urllib.request.Request(fake.base_url() + '/rest/db/file?folder=%s&file=nothere' % fid, headers={'X-API-Key': apikey})
+            try:
+                urllib.request.urlopen(req)
+            except urllib.error.HTTPError as e:
+                assert e.code == 404
+            else:
+                raise AssertionError('unknown file was found')
+
+            logger.print('checking scripted events reach the handler')
+            lastid = fake.push_event('Ping')
+            fake.script_events([(0.1, 'ItemStarted', {'folder': fid, 'item': 'a.txt', 'type': 'file', 'action': 'update'}),
+                                (0.1, 'FolderSummary', {'folder': fid, 'summary': {'needTotalItems': 0}})])
+
+            def _consumed():
+                """waiting for handler to poll past scripted events"""
+                assert any(path == '/rest/events' and int(query['since']) >= lastid + 2 for _, path, query in fake.requests())
+            logger.check(_consumed, timeout=10)
+
+            srv.add_project('fakeproject').result()
+
+            def _project_manager_started():
+                """waiting for project manager to start on project added event"""
+                assert 'fakeproject' in srv.projectManagers
+            logger.check_events(_project_manager_started, (srv,), (ProjectsAddedEvent,), timeout=10, max_interval=0.25)
+
+            rest = [x for x in metrics.snapshot()['lance_syncthing_rest_seconds'] if x['labels']['component'] == srv.syncthingHandler._metricsName and x['labels']['path'] == '/rest/system/config']
+            assert len(rest) > 0 and rest[0]['sum'] >= 0.05 * rest[0]['count'], 'injected latency is not seen: %s' % json.dumps(rest)
+        assert fake.base_url() is None, 'fake syncthing was not stopped'
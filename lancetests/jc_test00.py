@@ -0,0 +1,51 @@
+import io
+import json
+
+from lance import jsoncodec
+from testbase import TestBase
+
+
+class JC_JsonCodecTest0(TestBase):
+    def testBody(self, logger):
+        data = {'devices': [{'id': 'AAAAAAA', 'name': 'dev', 'metadata': {'x': 1.5, 'y': None, 'z': [True, False]}}],
+                'servers': ['BBBBBBB'],
+                'folders': [],
+                'ignoredevices': []}
+        unicodedata = {'label': 'шот 01', 'id': 'über'}
+        initial = jsoncodec.backend_name()
+        try:
+            for backend in jsoncodec.available_backends():
+                logger.print('checking backend %s' % backend)
+                jsoncodec.set_backend(backend)
+                assert jsoncodec.backend_name() == backend
+
+                compact = jsoncodec.dumps(data, compact=True)
+                assert compact == json.dumps(data, separators=(',', ':')), 'compact output differs from stdlib: %s' % compact
+                assert jsoncodec.dumps(data) == json.dumps(data, indent=4)
+                assert jsoncodec.dumps(unicodedata, compact=True).isascii(), 'non-ascii output may not be writable with locale encoding'
+                assert jsoncodec.dumps({1: 'a'}, compact=True) == '{"1":"a"}'
+
+                assert jsoncodec.loads(compact) == data
+                assert jsoncodec.loads(compact.encode('utf-8')) == data, 'cannot parse bytes'
+                assert jsoncodec.loads(json.dumps(unicodedata, ensure_ascii=False).encode('utf-8')) == unicodedata
+
+                f = io.StringIO()
+                jsoncodec.dump(data, f, compact=True)
+                f.seek(0)
+                assert jsoncodec.load(f) == data
+
+                try:
+                    jsoncodec.loads(b'{"devices": [')
+                except ValueError:
+                    pass
+                else:
+                    raise AssertionError('broken json was parsed')
+
+            try:
+                jsoncodec.set_backend('nosuchjson')
+            except ValueError:
+                pass
+            else:
+                raise AssertionError('unknown backend was set')
+        finally:
+            jsoncodec.set_backend(initial)
@@ -0,0 +1,67 @@
+import os
+import json
+
+from lance import logger
+from testbase import TestBase
+
+
+class LG_AsyncSinkTest0(TestBase):
+    def testBody(self, testlogger):
+        logpath = os.path.join(self.test_root_path(), 'lance.log')
+        sink = logger.AsyncLogSink(logger.RotatingFileWriter(logpath, max_bytes=4096, backup_count=2), json_lines=True)
+        oldsink = logger.set_sink(sink)
+        try:
+            logger.set_log_level('lgtest *', 0)
+            log = logger.get_logger('lgtest component')
+            other = logger.get_logger('lgtest_other component')
+            assert log.enabled(0), 'per component level was not applied'
+            assert not other.enabled(0), 'per component level applied to wrong logger'
+
+            testlogger.print('writing log records')
+            for i in range(200):
+                log(0, 'plain record', i)
+                log.fmt(1, 'formatted record %d', i)
+            state = ['before']
+            log.fmt(1, 'mutable state %r', state)
+            state[0] = 'after'
+            sink.flush(timeout=10)
+        finally:
+            logger.set_sink(oldsink)
+            sink.close()
+
+        assert os.path.exists(logpath + '.1'), 'log was not rotated'
+        assert not os.path.exists(logpath + '.3'), 'too many backups kept'
+        with open(logpath, 'r') as f:
+            records = [json.loads(x) for x in f]
+        assert len(records) > 0
+        assert records[-1]['message'] == "mutable state ['before']", 'record does not show state at the time of logging: %s' % repr(records[-1])
+        assert records[-2]['message'] == 'formatted record 199', 'last record mismatch: %s' % repr(records[-2])
+        assert records[-2]['logger'] == 'lgtest component'
+        assert records[-3]['message'] == "'plain record', 199", 'last record mismatch: %s' % repr(records[-3])
+        assert sink.dropped() == 0
+
+
+class LG_FlightRecorderTest0(TestBase):
+    def testBody(self, testlogger):
+        recorder = logger.enable_flight_recorder(capacity=16, dump_dir=self.test_root_path(), min_dump_interval=0)
+        try:
+            log = logger.get_logger('lgtest recorder')
+            log.min_log_level = 5
+            for i in range(32):
+                log(0, 'below output level', i)
+            logger.record_event('fake event')
+            records = recorder.records()
+            assert len(records) == 16, 'recorder kept %d records' % len(records)
+            assert records[-1][1] == 'lance event', 'event was not recorded: %s' % repr(records[-1])
+            assert records[-2][4] == ('below output level', 31)
+
+            testlogger.print('dumping on exception')
+            recorder.dump_on_exception(RuntimeError('test'), 'LG_FlightRecorderTest0')
+            dumps = [x for x in os.listdir(self.test_root_path()) if x.startswith('lance-flight-')]
+            assert len(dumps) == 1, 'expected one dump, got %s' % repr(dumps)
+            with open(os.path.join(self.test_root_path(), dumps[0]), 'r') as f:
+                dumptext = f.read()
+            assert "'below output level', 31" in dumptext
+            assert 'RuntimeError' in dumptext
+        finally:
+            logger.disable_flight_recorder()
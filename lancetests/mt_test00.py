@@ -0,0 +1,75 @@
+import urllib.request
+
+from lance import metrics
+from lance import lance_utils
+from testbase import TestBase
+
+
+class _MetricsTestThread(lance_utils.StoppableThread):
+    @lance_utils.async_method()
+    def add(self, a, b):
+        return a + b
+
+    @lance_utils.async_method()
+    def fail(self):
+        raise RuntimeError('expected failure')
+
+
+class MT_RegistryTest0(TestBase):
+    def testBody(self, testlogger):
+        registry = metrics.MetricsRegistry()
+        registry.counter('mttest_calls_total', {'method': 'a'}).inc()
+        registry.counter('mttest_calls_total', {'method': 'a'}).inc(2)
+        registry.gauge('mttest_depth').set(5)
+        hist = registry.histogram('mttest_seconds', buckets=(0.1, 1.0))
+        for x in (0.05, 0.5, 0.5, 5):
+            hist.observe(x)
+        try:
+            registry.gauge('mttest_calls_total')
+        except ValueError:
+            pass
+        else:
+            raise AssertionError('metric type mismatch was not detected')
+
+        snap = registry.snapshot()
+        assert snap['mttest_calls_total'][0]['value'] == 3
+        assert snap['mttest_depth'][0]['value'] == 5
+        assert snap['mttest_seconds'][0]['counts'] == (1, 2, 1), repr(snap['mttest_seconds'])
+        text = registry.exposition_text()
+        assert 'mttest_seconds_bucket{le="1.0"} 3' in text, text
+        assert 'mttest_seconds_bucket{le="+Inf"} 4' in text, text
+        assert 'mttest_calls_total{method="a"} 3' in text, text
+
+        testlogger.print('checking http endpoint')
+        srv = metrics.MetricsHttpServer(0, metrics_registry=registry)
+        try:
+            with urllib.request.urlopen('http://127.0.0.1:%d/metrics' % srv.port()) as rep:
+                assert rep.read().decode('utf-8') == text
+        finally:
+            srv.stop()
+
+
+class MT_AsyncMethodsTest0(TestBase):
+    def testBody(self, testlogger):
+        thread = _MetricsTestThread()
+        thread._metricsName = 'mttest thread'
+        with lance_utils.AsyncMethodBatch(thread) as batch:
+            res = batch.add(1, 2)
+            errres = batch.fail()
+        errres.set_raise_on_invoke(False)  # batch makes everything raise in worker thread
+        thread._processAsyncMethods(max_events_to_invoke=2)
+        assert res.result(0) == 3
+        try:
+            errres.result(0)
+        except RuntimeError:
+            pass
+        else:
+            raise AssertionError('exception was not passed to the result')
+
+        snap = metrics.snapshot()
+        runs = {x['labels']['method']: x['count'] for x in snap['lance_async_run_seconds'] if x['labels']['component'] == 'mttest thread'}
+        assert runs == {'add': 1, 'fail': 1}, repr(runs)
+        errors = [x['value'] for x in snap['lance_async_errors_total'] if x['labels'] == {'component': 'mttest thread', 'method': 'fail'}]
+        assert errors == [1], repr(errors)
+        waits = [x for x in snap['lance_async_queue_wait_seconds'] if x['labels']['component'] == 'mttest thread']
+        assert sum(x['count'] for x in waits) == 2
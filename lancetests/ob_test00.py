@@ -0,0 +1,68 @@
+import copy
+import json
+
+from lance.syncthinghandler import Device, Folder
+from testbase import TestBase
+
+
+class OB_ConfigObjectsTest0(TestBase):
+    def testBody(self, logger):
+        meta = {'__ProjectManager_data__': {'type': 'shotpart', 'project': 'proj', 'shotid': 'sh010', 'shotpartid': 'main'}}
+        folder = Folder(None, 'folder-0', 'folder 0', '/some/path', ['DEV-A', 'DEV-B'], meta)
+        assert not hasattr(folder, '__dict__')
+        assert folder.metadata() == meta and folder.metadata() is not meta
+
+        logger.print('checking folder copies')
+        folder._updateVolatileData({'folder': 'folder-0', 'summary': {'needTotalItems': 0}})
+        folder._st_event_synced = False
+        fcopy = copy.deepcopy(folder)
+        assert fcopy == folder and fcopy.is_synced()
+        assert fcopy._st_event_synced, 'copy is not a fresh folder'
+        assert fcopy.devices() is not folder.devices()
+        fcopy.add_device('DEV-C')
+        assert 'DEV-C' not in folder.devices()
+        folder._updateVolatileData({'summary': {'needTotalItems': 3}})
+        assert fcopy.is_synced() and not folder.is_synced(), 'volatile data of deep copy changed with original'
+        scopy = copy.copy(folder)
+        assert scopy.volatile_data() is folder.volatile_data()
+
+        logger.print('checking folder replace_with')
+        newfolder = Folder(None, 'folder-0', 'new label', None, ['DEV-A'], {})
+        folder.replace_with(newfolder)
+        assert folder == newfolder and folder.label() == 'new label'
+        assert not folder.is_synced() and not folder._st_event_synced, 'volatile data was replaced'
+
+        logger.print('checking devices')
+        dev = Device(None, 'DEV-A', 'dev a', 123.0)
+        dev.schedule_for_deletion()
+        dev._update_volatile_data({'connected': True})
+        dev._st_event_confighash = 'hash'
+        dcopy = copy.deepcopy(dev)
+        assert dcopy.id() == 'DEV-A' and dcopy.name() == 'dev a' and dcopy.created_at() == 123.0
+        assert dcopy.volatile_data().connected()
+        assert dcopy._st_event_confighash == '' and not dcopy.is_schediled_for_deletion()
+        dev._update_volatile_data({'connected': False})
+        assert dcopy.volatile_data().connected()
+
+        newdev = Device(None, 'DEV-A', 'renamed', 456.0)
+        dev.replace_with(newdev)
+        assert dev == newdev and dev.name() == 'renamed'
+        assert dev._st_event_confighash == 'hash', 'internal state was replaced'
+        assert Device.deserialize(None, dev.serialize_to_dict()) == dev
+
+        logger.print('checking serialized config matching')
+        fdict = json.loads(json.dumps(newfolder.serialize_to_dict()))
+        assert newfolder._matches_serialized(fdict, None)
+        assert not newfolder._matches_serialized(fdict, '/other/path')
+        fdict['devices'].append('DEV-Z')
+        assert not newfolder._matches_serialized(fdict, None)
+        ddict = json.loads(json.dumps(dev.serialize_to_dict()))
+        assert dev._matches_serialized(ddict)
+        ddict['name'] = 'nope'
+        assert not dev._matches_serialized(ddict)
+
+        logger.print('checking configuration hash follows metadata')
+        confhash = folder.configuration_hash()
+        assert copy.copy(folder).configuration_hash() == confhash
+        folder._setMetadata({'other': 1})
+        assert folder.configuration_hash() != confhash
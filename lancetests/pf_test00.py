@@ -0,0 +1,80 @@
+import time
+import threading
+
+from lance import lance_utils
+from lance.profiling import AsyncMethodProfiler, summarize_args
+from testbase import TestBase
+
+
+class _ProfiledThread(lance_utils.StoppableThread):
+    @lance_utils.async_method()
+    def fast(self, data):
+        return len(data)
+
+    @lance_utils.async_method()
+    def slow(self, data, delay=0.2):
+        time.sleep(delay)
+        return len(data)
+
+
+def _slow(_, data, delay):
+    time.sleep(delay)
+    return len(data)
+
+
+class PF_SlowCallTest0(TestBase):
+    def testBody(self, testlogger):
+        reported = []
+        profiler = AsyncMethodProfiler(slow_threshold=0.1, use_cprofile=True, report=reported.append)
+        thread = _ProfiledThread()
+        thread._metricsName = 'pftest thread'
+        thread.set_profiler(profiler)
+        with lance_utils.AsyncMethodBatch(thread) as batch:
+            batch.fast('x' * 10)
+            slowres = batch.slow(list(range(1000)), delay=0.2)
+        thread._processAsyncMethods(max_events_to_invoke=2)
+        assert slowres.result(0) == 1000
+
+        assert len(reported) == 1, 'expected one slow call, got %s' % repr(reported)
+        slowcall = reported[0]
+        testlogger.print(repr(slowcall))
+        assert slowcall.method == 'slow'
+        assert slowcall.run_time >= 0.2
+        assert len(slowcall.argstext) < 100, 'arguments were not summarized: %s' % slowcall.argstext
+        assert 'delay=0.2' in slowcall.argstext
+        assert slowcall.profile_text is not None and 'sleep' in slowcall.profile_text
+
+        stats = profiler.stats()
+        assert stats['pftest thread.fast']['count'] == 1
+        assert stats['pftest thread.slow']['run_max'] >= 0.2
+        assert len(summarize_args(('a' * 1000,), {})) < 60
+
+
+class PF_SlowCallTest1(TestBase):
+    def testBody(self, testlogger):
+        reported = []
+        profiler = AsyncMethodProfiler(slow_threshold=0.1, use_cprofile=True, report=reported.append)
+        errors = []
+
+        def _call(delay):
+            try:
+                profiler.invoke('pftest concurrent', _slow, None, ('x',), {'delay': delay}, 0.0)
+            except Exception as e:
+                errors.append(e)
+
+        testlogger.print('profiling calls in parallel threads')
+        threads = [threading.Thread(target=_call, args=(0.4 - 0.1 * i,)) for i in range(3)]
+        for t in threads:
+            t.start()
+            time.sleep(0.05)
+        for t in threads:
+            t.join()
+        assert errors == [], 'profiled calls failed: %s' % repr(errors)
+        assert len(reported) == 3, repr(reported)
+        profiled = [x for x in reported if x.profile_text is not None]
+        assert len(profiled) == 1, 'expected only first call to be profiled, got %s' % repr(profiled)
+        assert profiled[0].run_time >= 0.4
+
+        testlogger.print('checking profiler is free again')
+        profiler.invoke('pftest concurrent', _slow, None, ('x',), {'delay': 0.15}, 0.0)
+        assert reported[-1].profile_text is not None
@@ -0,0 +1,49 @@
+import os
+
+from lance.pathtemplate import compile_template, render_path, UnresolvedPlaceholderError, CyclicPlaceholderError
+from testbase import TestBase
+
+
+class PT_BasicTest0(TestBase):
+    def testBody(self, logger):
+        conf = {'data_root': '/data', 'nested_root': '__LANCECONF_data_root__/nested'}
+
+        logger.print('checking simple substitution')
+        path = render_path('__LANCECONF_data_root__/__LANCELOC_folder_label__', conf, {'folder_label': 'le folder'})
+        assert path == '/data/le folder', 'got %s' % path
+
+        logger.print('checking nested substitution')
+        path = render_path('__LANCECONF_nested_root__/x', conf)
+        assert path == '/data/nested/x', 'got %s' % path
+
+        logger.print('checking env substitution')
+        os.environ['LANCE_PT_TEST_VAR'] = 'envval'
+        path = render_path('/a/__LANCEENV_LANCE_PT_TEST_VAR__/b', conf)
+        assert path == '/a/envval/b', 'got %s' % path
+
+        logger.print('checking local values are not expanded')
+        path = render_path('/a/__LANCELOC_folder_label__', conf, {'folder_label': '__LANCECONF_data_root__'})
+        assert path == '/a/__LANCECONF_data_root__', 'got %s' % path
+
+        logger.print('checking unresolved placeholders')
+        path = render_path('/a/__LANCECONF_nope__/b', conf)
+        assert path == '/a/__LANCECONF_nope__/b', 'got %s' % path
+        try:
+            render_path('/a/__LANCECONF_nope__/b', conf, strict=True)
+        except UnresolvedPlaceholderError:
+            pass
+        else:
+            raise AssertionError('unresolved placeholder was not detected')
+
+        logger.print('checking cycles')
+        try:
+            render_path('__LANCECONF_a__', {'a': 'x/__LANCECONF_b__', 'b': '__LANCECONF_a__'})
+        except CyclicPlaceholderError as e:
+            logger.print(repr(e))
+        else:
+            raise AssertionError('cycle was not detected')
+
+        logger.print('checking template cache')
+        assert compile_template('/a/__LANCELOC_x__') is compile_template('/a/__LANCELOC_x__'), 'template was not cached'
+        assert compile_template('/static/path').is_static()
+        assert compile_template('/a/__LANCELOC_x__/__LANCEENV_Y__').placeholders() == (('LOC', 'x'), ('ENV', 'Y'))
@@ -0,0 +1,46 @@
+import os
+
+from lance.server import Server
+from lance.fakesyncthing import FakeSyncthing
+from lance.restrecording import load_recording, replay
+from testbase import TestBase
+
+
+class RR_RecordReplayTest0(TestBase):
+    def testBody(self, logger):
+        recpath = os.path.join(self.test_root_path(), 'events.jsonl.gz')
+        fake = FakeSyncthing()
+        srv = Server(os.path.join(self.test_root_path(), 'srv', 'config'), os.path.join(self.test_root_path(), 'srv', 'data'), syncthing_launcher=fake)
+        try:
+            srv.syncthingHandler.set_server_secret('wowsecret').result()
+            srv.syncthingHandler.add_server(srv.syncthingHandler.myId()).result()
+            fpath = os.path.join(self.test_root_path(), 'folder0')
+            os.makedirs(fpath)
+            fid = srv.syncthingHandler.add_folder(fpath, 'folder 0').result()
+            srv.start()
+            srv.syncthingHandler.start_rest_recording(recpath).result()
+
+            lastid = 0
+            for i in range(50):
+                fake.push_event('ItemStarted', {'folder': fid, 'item': 'f%d.txt' % i, 'type': 'file', 'action': 'update'})
+                lastid = fake.push_event('FolderSummary', {'folder': fid, 'summary': {'needTotalItems': 0}})
+
+            def _consumed():
+                """waiting for handler to poll past pushed events"""
+                assert any(path == '/rest/events' and int(query['since']) >= lastid for _, path, query in fake.requests())
+            logger.check(_consumed, timeout=20)
+            count = srv.syncthingHandler.stop_rest_recording().result()
+            logger.print('recorded %d requests' % count)
+        finally:
+            srv.stop()
+
+        header, records = load_recording(recpath)
+        assert header['myid'] == srv.syncthingHandler.myId()
+        assert fid in [x['attribs']['fid'] for x in header['config']['folders']], 'configuration snapshot is missing folder'
+        recorded = sum(len(x['r']) for x in records if x['p'] == '/rest/events' and x['r'])
+        assert recorded >= 100, 'only %d events recorded' % recorded
+
+        logger.print('replaying')
+        result = replay(recpath, os.path.join(self.test_root_path(), 'replay'), timeout=60)
+        logger.print(repr(result))
+        assert result['events'] == recorded
@@ -0,0 +1,31 @@
+import os
+import base64
+import hashlib
+
+from lance.syncthinglauncher import SyncthingLauncher, device_id_from_digest
+from testbase import TestBase
+
+
+class SL_DeviceIdTest0(TestBase):
+    def testBody(self, logger):
+        logger.print('checking device id formatting against syncthing\'s own example')
+        digest = base64.b32decode('P56IOI7MZJNU2IQGDREYDM2MGTMGL3BXNPQ6W5BTBBZ4TJXZWICQ====')
+        did = device_id_from_digest(digest)
+        assert did == 'P56IOI7-MZJNU2Y-IQGDREY-DM2MGTI-MGL3BXN-PQ6W5BM-TBBZ4TJ-XZWICQ2', 'got %s' % did
+
+        home = os.path.join(self.test_root_path(), 'sthome')
+        os.makedirs(home, exist_ok=True)
+        launcher = SyncthingLauncher('there-is-no-such-syncthing-binary')  # so any attempt to spawn it would fail
+
+        logger.print('checking no certificate means no configuration')
+        assert launcher.device_id(home) is None
+
+        logger.print('checking device id is derived from certificate')
+        der = os.urandom(300)  # only DER bytes' hash matters
+        with open(os.path.join(home, 'cert.pem'), 'w') as f:
+            f.write('-----BEGIN CERTIFICATE-----\n')
+            b64 = base64.b64encode(der).decode('ascii')
+            f.write('\n'.join(b64[i:i + 64] for i in range(0, len(b64), 64)))
+            f.write('\n-----END CERTIFICATE-----\n')
+        did = launcher.device_id(home)
+        assert did == device_id_from_digest(hashlib.sha256(der).digest()), 'got %s' % did
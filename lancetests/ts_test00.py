@@ -0,0 +1,32 @@
+import datetime
+
+from lance.lance_utils import syncthing_timestamp_to_datetime
+from lance.eventtypes import SyncthingEvent
+from testbase import TestBase
+
+
+class TS_TimestampTest0(TestBase):
+    def testBody(self, logger):
+        logger.print('checking parsing matches strptime')
+        for ts, expected in (('2019-05-01T12:00:00.123456789+02:00', '2019-05-01T12:00:00.123456+0200'),
+                             ('2019-05-01T12:00:00.123456789-05:30', '2019-05-01T12:00:00.123456-0530'),
+                             ('2019-05-01T12:00:00.5+01:00', '2019-05-01T12:00:00.500000+0100'),
+                             ('2019-05-01T12:00:00+00:00', '2019-05-01T12:00:00.000000+0000'),
+                             ('2019-05-01T12:00:00.1234Z', '2019-05-01T12:00:00.123400+0000')):
+            parsed = syncthing_timestamp_to_datetime(ts)
+            assert parsed == datetime.datetime.strptime(expected, '%Y-%m-%dT%H:%M:%S.%f%z'), 'bad parse of %s: %s' % (ts, parsed)
+            assert parsed.utcoffset() == datetime.datetime.strptime(expected, '%Y-%m-%dT%H:%M:%S.%f%z').utcoffset()
+
+        logger.print('checking bad timestamps')
+        for ts in ('', 'nope', '2019-05-01T12:00:00,123+02:00', '2019-05-01 12:00:00.123+0200'):
+            try:
+                syncthing_timestamp_to_datetime(ts)
+            except ValueError:
+                pass
+            else:
+                raise AssertionError('%r was parsed' % ts)
+
+        logger.print('checking event time')
+        event = SyncthingEvent({'id': 1, 'globalID': 1, 'time': '2019-05-01T12:00:00.123456789+02:00', 'type': 'Ping', 'data': None})
+        assert event.time() == syncthing_timestamp_to_datetime('2019-05-01T12:00:00.123456789+02:00')
+        assert event.time() is event.time(), 'event time is parsed every time'
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import subprocess
+import re
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def compare(results, baseline, threshold):
+    """
+    print mean latency ratio for every operation present in both result sets
+    :return: number of operations slower than threshold
+    """
+    def _index(res):
+        return {(x['benchmark'], json.dumps(x['params'], sort_keys=True), op): stats for x in res['results'] for op, stats in x['metrics'].items()}
+    new = _index(results)
+    old = _index(baseline)
+    regressions = 0
+    for key in sorted(new.keys()):
+        if key not in old or old[key]['mean'] <= 0:
+            continue
+        ratio = new[key]['mean'] / old[key]['mean']
+        flag = ''
+        if ratio > threshold:
+            flag = '  <-- REGRESSION'
+            regressions += 1
+        print('{0} {1} {2}: {3:.6f}s -> {4:.6f}s (x{5:.2f}){6}'.format(key[0], key[1], key[2], old[key]['mean'], new[key]['mean'], ratio, flag))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='run lance benchmarks')
+    parser.add_argument('filter', nargs='?', default='.*', help='regex to filter benchmark names')
+    parser.add_argument('--scale', default='small', choices=('small', 'medium', 'large'))
+    parser.add_argument('--output', help='file to save json results to')
+    parser.add_argument('--compare', help='json results of a previous run to compare with')
+    parser.add_argument('--threshold', type=float, default=1.25, help='mean latency ratio over which operation is reported as regression')
+    args = parser.parse_args()
+
+    try:
+        filterre = re.compile(args.filter)
+    except Exception as e:
+        print('bad regexp: %s' % repr(e))
+        sys.exit(1)
+
+    import lancebenchmarks
+    from lance import logger
+    filteredClassList = [x for x in lancebenchmarks.benchClassList if filterre.match(x.__name__) is not None]
+    print('\n\n\t\tBENCHMARKS WILL BE RUN:\n\t\t\t{names}\n\n'.format(names='\n\t\t\t'.join(x.__name__ for x in filteredClassList)))
+
+    logger.set_log_level('*', 3)  # logging of every config change would dominate timings
+    results = {'revision': git_revision(),
+               'time': time.time(),
+               'scale': args.scale,
+               'python': platform.python_version(),
+               'platform': platform.platform(),
+               'results': []}
+    for BenchClass in filteredClassList:
+        print('running benchmark: {name}'.format(name=BenchClass.__name__))
+        for run in BenchClass().run(args.scale):
+            results['results'].append({'benchmark': BenchClass.__name__, 'params': run['params'], 'metrics': run['metrics']})
+            for op, stats in sorted(run['metrics'].items()):
+                print('  {params} {op}: n={count} mean={mean:.6f}s p90={p90:.6f}s max={max:.6f}s'.format(params=json.dumps(run['params'], sort_keys=True), op=op, **stats))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print('results saved to %s' % args.output)
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        print('\ncomparing with revision %s' % baseline.get('revision'))
+        if compare(results, baseline, args.threshold) > 0:
+            sys.exit(2)
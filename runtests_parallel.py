@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import traceback
+import subprocess
+import re
+import concurrent.futures
+import xml.etree.ElementTree as ET
+
+
+def run_worker(testname, resultpath):
+    """
+    runs in a separate process with it's own HOME, so test root of every test is isolated
+    """
+    import lancetests
+    result = {'name': testname, 'passed': False}
+    classes = [x for x in lancetests.testClassList if x.__name__ == testname]
+    if len(classes) == 0:
+        result['error'] = 'test not found'
+    else:
+        result['module'] = classes[0].__module__
+        _starttime = time.time()
+        try:
+            classes[0]().run()
+            result['passed'] = True
+        except Exception as e:
+            result['error'] = repr(e)
+            result['traceback_string'] = traceback.format_exc()
+        result['time'] = time.time() - _starttime
+    with open(resultpath, 'w') as f:
+        json.dump(result, f)
+
+
+def run_test(testname, homeroot, timeout):
+    """
+    run one test in a subprocess, kill it with all it's children (syncthings) on timeout
+    :return: result dict
+    """
+    home = os.path.join(homeroot, testname)
+    os.makedirs(home, exist_ok=True)
+    resultpath = os.path.join(home, 'result.json')
+    if os.path.exists(resultpath):
+        os.remove(resultpath)
+    env = dict(os.environ)
+    env['HOME'] = home
+    outpath = os.path.join(home, 'stdout.log')
+    _starttime = time.time()
+    with open(outpath, 'w') as out:
+        proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--worker', testname, resultpath],
+                                cwd=os.path.dirname(os.path.abspath(__file__)), env=env, stdout=out, stderr=subprocess.STDOUT,
+                                start_new_session=True)
+        try:
+            proc.wait(timeout)
+        except subprocess.TimeoutExpired:
+            os.killpg(proc.pid, signal.SIGKILL)
+            proc.wait()
+            return {'name': testname, 'passed': False, 'time': time.time() - _starttime, 'error': 'timed out after %g seconds' % timeout, 'stdout': outpath}
+    if not os.path.exists(resultpath):
+        return {'name': testname, 'passed': False, 'time': time.time() - _starttime, 'error': 'test process exited with code %d without result' % proc.returncode, 'stdout': outpath}
+    with open(resultpath, 'r') as f:
+        result = json.load(f)
+    result['stdout'] = outpath
+    return result
+
+
+def write_junit(results, path):
+    suite = ET.Element('testsuite', {'name': 'lancetests',
+                                     'tests': str(len(results)),
+                                     'failures': str(len([x for x in results if not x['passed']])),
+                                     'time': '%.3f' % sum(x.get('time', 0) for x in results)})
+    for result in results:
+        case = ET.SubElement(suite, 'testcase', {'classname': result.get('module', 'lancetests'), 'name': result['name'], 'time': '%.3f' % result.get('time', 0)})
+        if not result['passed']:
+            failure = ET.SubElement(case, 'failure', {'message': result.get('error', '')})
+            failure.text = result.get('traceback_string', result.get('error', ''))
+        ET.SubElement(case, 'system-out').text = 'output: %s' % result.get('stdout', '')
+    ET.ElementTree(suite).write(path, encoding='utf-8', xml_declaration=True)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 4 and sys.argv[1] == '--worker':
+        run_worker(sys.argv[2], sys.argv[3])
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description='run lancetests in parallel processes')
+    parser.add_argument('filter', nargs='?', default='.*', help='regex to filter test names')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1, help='number of tests to run at the same time')
+    parser.add_argument('--timeout', type=float, default=1800, help='seconds before a test is killed')
+    parser.add_argument('--home-root', default=None, help='where to create HOMEs of tests, default is lance-tests-parallel in HOME')
+    parser.add_argument('--junit', default=None, help='path to write junit xml report to')
+    args = parser.parse_args()
+
+    try:
+        filterre = re.compile(args.filter)
+    except Exception as e:
+        print('bad regexp: %s' % repr(e))
+        sys.exit(1)
+
+    import lancetests
+    testnames = [x.__name__ for x in lancetests.testClassList if filterre.match(x.__name__) is not None]
+    homeroot = os.path.abspath(args.home_root or os.path.join(os.environ['HOME'], 'lance-tests-parallel'))
+    print('\n\n\t\tTESTS WILL BE RUN ({jobs} at a time):\n\t\t\t{testnames}\n\n'.format(jobs=args.jobs, testnames='\n\t\t\t'.join(testnames)))
+
+    _starttime = time.time()
+    results = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+        futures = {pool.submit(run_test, name, homeroot, args.timeout): name for name in testnames}
+        for future in concurrent.futures.as_completed(futures):
+            result = future.result()
+            results.append(result)
+            print('{passed} "{name}" in {time:.3f}'.format(passed='Passed' if result['passed'] else 'Failed', name=result['name'], time=result.get('time', -1)))
+
+    print('\n\nAll tests finished in %.3f!\n\n' % (time.time() - _starttime))
+    results.sort(key=lambda x: x['name'])
+    failedTests = [x for x in results if not x['passed']]
+    if len(failedTests) > 0:
+        print("\n\nfailed tests:\n")
+    for result in failedTests:
+        print('test %s: %s' % (result['name'], result.get('error', '')))
+        print(result.get('traceback_string', ''))
+        print('output: %s' % result.get('stdout', ''))
+        print('\n-------------------------------------\n')
+
+    if args.junit:
+        write_junit(results, args.junit)
+        print('junit report written to %s' % args.junit)
+    sys.exit(1 if len(failedTests) > 0 else 0)
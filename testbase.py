@@ -2,6 +2,14 @@ import sys
 import os
 import shutil
 import time
+import threading
+import contextlib
+
+from lance.eventprocessor import BaseEventProcessorInterface
+from lance.server import Server
+from lance.fakesyncthing import FakeSyncthing
+
+from typing import Optional
 
 basepath = os.environ['HOME']
 testrootpath = os.path.join(basepath, 'lance-tests')
@@ -10,6 +18,40 @@ testrootpath = os.path.join(basepath, 'lance-tests')
 
 
 class TestBase:
+    class EventWaiter(BaseEventProcessorInterface):
+        """
+        event processor that only collects events of given types, for tests to wait on
+        """
+        def __init__(self, event_types):
+            super(TestBase.EventWaiter, self).__init__()
+            self.__event_types = tuple(event_types)
+            self.__condition = threading.Condition()
+            self.__events = []
+
+        def add_event(self, event):
+            with self.__condition:
+                self.__events.append((time.time(), event))
+                self.__condition.notify_all()
+
+        @classmethod
+        def is_init_event(cls, event):
+            return False
+
+        def is_expected_event(self, event):
+            return isinstance(event, self.__event_types)
+
+        def wait(self, timeout):
+            """
+            wait for new events
+            :return: list of (arrival time, event) arrived since last call
+            """
+            with self.__condition:
+                if len(self.__events) == 0:
+                    self.__condition.wait(timeout)
+                events = self.__events
+                self.__events = []
+            return events
+
     class StdoutSwitcher:
         def __init__(self, logpath):
             self.__logpath = logpath
@@ -75,6 +117,57 @@ class TestBase:
                 status += ' and was held true for %d sec' % time_to_hold
             self.print(status)
 
+        def check_events(self, assertion, servers, event_types, timeout: float, time_to_hold: float = 0, max_interval: float = 5) -> float:
+            """
+            like check, but assertion is only re-evaluated when one of the servers gets a lance event of one of event_types
+            and at least every max_interval seconds, for state that changes without any event
+            :param servers: Server instances to listen to
+            :param event_types: event classes that may change assertion's result
+            :return: seconds it took for assertion to become true, counted to arrival of the event after which it did
+            """
+            if assertion.__doc__ is not None:
+                self.print(assertion.__doc__)
+            self.print('waiting for assertion to be true on %s. timeout %g seconds...' % (', '.join(x.__name__ for x in event_types), timeout))
+            waiter = TestBase.EventWaiter(event_types)
+            for server in servers:
+                server.eventQueueEater.add_event_processor(waiter)
+            try:
+                start_time = time.time()
+                last_ex = None
+                true_since = None
+                trigger = None
+                trigger_time = start_time
+                while True:
+                    try:
+                        assertion()
+                        if true_since is None:
+                            true_since = trigger_time
+                            self.print('assertion became true after %.3f sec%s' % (true_since - start_time, '' if trigger is None else ' on %r' % (trigger,)))
+                        if time.time() - true_since >= time_to_hold:
+                            break
+                    except Exception as e:
+                        last_ex = e
+                        true_since = None
+                        if time.time() - start_time > timeout:
+                            self.print('assertion did not hold')
+                            raise last_ex
+                    wait_time = max_interval
+                    if true_since is not None:
+                        wait_time = min(wait_time, max(0.0, time_to_hold - (time.time() - true_since)))
+                    else:
+                        wait_time = min(wait_time, max(0.0, timeout - (time.time() - start_time)) + 0.001)
+                    events = waiter.wait(wait_time)
+                    if len(events) > 0:
+                        trigger_time, trigger = events[-1]
+                    else:
+                        trigger_time, trigger = time.time(), None
+            finally:
+                for server in servers:
+                    server.eventQueueEater.remove_event_provessor(waiter)
+            if time_to_hold > 0:
+                self.print('assertion was held true for %g sec' % time_to_hold)
+            return true_since - start_time
+
 
     def __init__(self):
         self.__testrootpath = os.path.join(testrootpath, self.__class__.__name__)
@@ -87,6 +180,28 @@ class TestBase:
     def test_root_path(self):
         return self.__testrootpath
 
+    @contextlib.contextmanager
+    def fake_server(self, fake: Optional[FakeSyncthing] = None, name: str = 'srv', as_server: bool = True, **kwargs):
+        """
+        Server running on fake syncthing, with config and data roots under test root. it is not started
+        on exit server is stopped and it's syncthing handler thread is joined, so nothing polls the fake anymore
+        :param fake: fake syncthing to use, new one if None. pass the same one and name to run same server again
+        :param as_server: add server's own device to servers, so it is a lance server, not a client
+        :param kwargs: passed to Server
+        :return: yields (server, fake)
+        """
+        if fake is None:
+            fake = FakeSyncthing()
+        srv = Server(os.path.join(self.__testrootpath, name, 'config'), os.path.join(self.__testrootpath, name, 'data'), syncthing_launcher=fake, **kwargs)
+        try:
+            if as_server:
+                srv.syncthingHandler.add_server(srv.syncthingHandler.myId()).result()
+            yield srv, fake
+        finally:
+            srv.stop()
+            if srv.syncthingHandler.ident is not None:
+                srv.syncthingHandler.join(10)
+
     def testBody(self, logger: 'TestBase.StdoutSwitcher'):
         raise NotImplementedError()
 